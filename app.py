@@ -1,39 +1,604 @@
+import json
+import logging
 import os
-from flask import Flask, request, jsonify
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, Response, request, jsonify
 from flask_cors import CORS
 from routes.prd_summarizer import PRDSummarizer
 from routes.wireframe_generator import WireframeGenerator
+from routes.combined_analyzer import CombinedAnalyzer
+from routes.large_document import is_large
+from routes.stage_scheduler import StageScheduler
+from routes.metrics import REGISTRY, log_payload
+from routes.result_cache import text_digest
+from routes.job_queue import JobQueue, QueueFull
+from routes.rate_limiter import priority_class
+from routes.json_repair import validate_wireframes
+from routes.wireframe_layout import with_layout
+from routes.text_normalizer import prepare_text
+from routes.deadline import call_within, current_deadline, deadline_scope
+from routes.extractive_summary import summarize as extractive_summary
+from routes.gemini_client import get_client
+from routes.analysis_config import (
+    DEFAULT_MODE,
+    DEFAULT_OUTPUTS,
+    GEMINI_API_KEY,
+    OUTPUTS,
+    PIPELINE_OWNERS,
+    RESULT_CACHE,
+    SIMILAR_INDEX,
+    SUMMARY_DEADLINE_SHARE,
+    DocumentResults,
+    form_flag,
+    options_error,
+    output_sources,
+    request_deadline,
+)
+from routes.document_ingest import (
+    UnreadableDocument,
+    UnsupportedDocument,
+    detect_type,
+    extract_text,
+    upload_file,
+)
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+
+class UploadRequest(Request):
+    """Request that writes multipart files straight to named temporary
+    files, so uploads are extracted where Werkzeug spooled them."""
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return upload_file(total_content_length, content_type, filename, content_length)
+
 
 # Flask setup
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app, origins="*", supports_credentials=True)  # Allow all origins for all routes
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Larger uploads are rejected with 413 before they are read
+app.config["MAX_CONTENT_LENGTH"] = int(
+    os.getenv("PRD_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024))
+)
+
+STAGE_WORKERS = int(os.getenv("PRD_STAGE_WORKERS", "4"))
+
+def invalidOptions(outputs, mode, deadline_seconds=None, reuse_similar=True):
+    message = options_error(outputs, mode, deadline_seconds, reuse_similar)
+    if message:
+        return jsonify({"error": message}), 400
+    return None
+
 
 @app.route("/analyze", methods=["POST"])
 def analyze_text():
     data = request.get_json()
     text = data["text"]
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(
+        outputs, mode, data.get("deadline_seconds"), reuse_similar
+    )
+    if error_response:
+        return error_response
+    deadline = request_deadline(data.get("deadline_seconds"))
 
     # return defaultResponse(text)
 
-    print("Received text for analysis:", text)  # Debugging
+    log_payload(logger, "Received text for analysis", text)
 
-    prd_summarizer = PRDSummarizer(api_key=GEMINI_API_KEY, prd_text=text)
-    result = prd_summarizer.process()
+    response, succeeded = runAnalysis(text, outputs, mode, deadline, reuse_similar)
+    return jsonify(response), 200 if succeeded else 502
 
-    wireframes = getWireframes(text)
-    print("\n\n\nWireframes:", wireframes)
 
-    resJson = jsonify(
-        {
-            "summarizedText": result['summarized_text'],
-            "Flowchart": result['mermaid_code'],
-            "wireframes": wireframes
-        }
+@app.route("/analyze/upload", methods=["POST"])
+def analyze_upload():
+    """Analyze a PDF, DOCX or TXT file sent as multipart ``file``.
+
+    The upload is spooled to disk and extracted on the server, then goes
+    through the same pipeline as /analyze. ``outputs`` may be passed as a
+    comma-separated form field, as may ``deadline_seconds`` and
+    ``reuse_similar``.
+    """
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "Missing multipart field 'file'."}), 400
+
+    outputs = [
+        name.strip()
+        for name in request.form.get("outputs", "").split(",")
+        if name.strip()
+    ] or DEFAULT_OUTPUTS
+    mode = request.form.get("mode") or DEFAULT_MODE
+    deadline_seconds = request.form.get("deadline_seconds") or None
+    reuse_similar = form_flag(request.form.get("reuse_similar"))
+    error_response = invalidOptions(outputs, mode, deadline_seconds, reuse_similar)
+    if error_response:
+        return error_response
+    deadline = request_deadline(deadline_seconds)
+
+    try:
+        kind = detect_type(upload.filename, upload.mimetype)
+    except UnsupportedDocument as e:
+        return jsonify({"error": str(e)}), 415
+
+    # Already on disk (see UploadRequest); removed when the request ends
+    upload.stream.flush()
+    try:
+        text = extract_text(upload.stream.name, kind)
+    except UnreadableDocument as e:
+        return jsonify({"error": str(e)}), 422
+
+    if not text:
+        return jsonify({"error": "No text could be extracted from the file."}), 422
+
+    response, succeeded = runAnalysis(text, outputs, mode, deadline, reuse_similar)
+    return jsonify(response), 200 if succeeded else 502
+
+
+def runAnalysis(text, outputs, mode=DEFAULT_MODE, deadline=None, reuse_similar=True):
+    """Run the stages behind ``outputs``, within ``deadline`` if given;
+    return the response body and whether at least one requested output
+    was produced."""
+    stages = [OUTPUTS[name][0] for name in outputs]
+    with deadline_scope(deadline):
+        scheduler = buildAnalysisScheduler(
+            prepare_text(text), mode=mode, reuse_similar=reuse_similar
+        )
+        run = scheduler.run(targets=stages)
+
+    response = {
+        OUTPUTS[name][1]: run.results.get(OUTPUTS[name][0]) for name in outputs
+    }
+    response["sources"] = output_sources(scheduler.sources, outputs, run.results)
+    if run.errors:
+        response["errors"] = {name: str(error) for name, error in run.errors.items()}
+
+    return response, any(stage in run.results for stage in stages)
+
+
+def runAnalysisJob(payload):
+    # Queued jobs yield Gemini capacity to interactive requests
+    with priority_class("batch"):
+        response, succeeded = runAnalysis(
+            payload["text"],
+            payload["outputs"],
+            payload["mode"],
+            reuse_similar=payload.get("reuse_similar", True),
+        )
+    if not succeeded:
+        raise Exception(f"Analysis failed: {response.get('errors')}")
+    return response
+
+
+JOB_QUEUE = JobQueue(
+    runAnalysisJob,
+    workers=int(os.getenv("PRD_JOB_WORKERS", "4")),
+    max_queued=int(os.getenv("PRD_JOB_QUEUE_SIZE", "32")),
+    retention=int(os.getenv("PRD_JOB_RETENTION_SECONDS", "3600")),
+)
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queue an analysis and return its id immediately (202).
+
+    Responds 429 when the queue is full so clients back off instead of
+    piling more work onto a saturated server.
+    """
+    data = request.get_json()
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(outputs, mode, reuse_similar=reuse_similar)
+    if error_response:
+        return error_response
+
+    try:
+        job = JOB_QUEUE.submit(
+            {
+                "text": data["text"],
+                "outputs": outputs,
+                "mode": mode,
+                "reuse_similar": reuse_similar,
+            }
+        )
+    except QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = os.getenv("PRD_JOB_RETRY_AFTER", "5")
+        return response, 429
+
+    response = jsonify(job.to_dict())
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response, 202
+
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/analyze/stream", methods=["POST"])
+def analyze_text_stream():
+    """Stream /analyze results as NDJSON, one event per line.
+
+    Events are ``summary_delta`` (partial summary text from Gemini),
+    ``result`` (a finished output, keyed like the /analyze response, with
+    its ``source``), ``error`` (a failed output) and a final ``done``.
+    """
+    data = request.get_json()
+    text = data["text"]
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(
+        outputs, mode, data.get("deadline_seconds"), reuse_similar
     )
+    if error_response:
+        return error_response
+    deadline = request_deadline(data.get("deadline_seconds"))
 
-    return resJson
+    events = queue.Queue()
+    response_keys = {stage: key for stage, key in OUTPUTS.values()}
+    requested = {OUTPUTS[name][0] for name in outputs}
+    # Set once the summary is out, so a summary streaming on in the
+    # background after an extractive fallback sends no more deltas
+    summary_done = threading.Event()
+
+    def on_summary_delta(delta):
+        if "summary" in requested and not summary_done.is_set():
+            events.put({"event": "summary_delta", "text": delta})
+
+    def drive():
+        try:
+            with deadline_scope(deadline):
+                scheduler = buildAnalysisScheduler(
+                    prepare_text(text),
+                    on_summary_delta=on_summary_delta,
+                    mode=mode,
+                    reuse_similar=reuse_similar,
+                )
+                for stage, result, error in scheduler.iter_run(targets=requested):
+                    if stage == "summary":
+                        summary_done.set()
+                    if stage not in requested:
+                        continue
+                    if error is None:
+                        events.put(
+                            {
+                                "event": "result",
+                                "key": response_keys[stage],
+                                "data": result,
+                                "source": scheduler.sources.get(stage),
+                            }
+                        )
+                    else:
+                        events.put(
+                            {"event": "error", "key": response_keys[stage], "message": str(error)}
+                        )
+        finally:
+            events.put({"event": "done"})
+
+    threading.Thread(target=drive, daemon=True).start()
+
+    def generate():
+        while True:
+            event = events.get()
+            yield json.dumps(event) + "\n"
+            if event["event"] == "done":
+                return
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def cachedOutputs(text, outputs, reuse_similar=True):
+    """Return ``{stage: (source, result)}`` when every pipeline stage behind
+    ``outputs`` is already cached for the document (or a near-duplicate
+    of it), else None."""
+    document = DocumentResults(text, reuse_similar)
+    results = {}
+    for name in outputs:
+        stage = OUTPUTS[name][0]
+        source, value = document.get(stage, PIPELINE_OWNERS[stage])
+        if not source:
+            return None
+        results[stage] = source, value
+    return results
+
+
+BATCH_MAX_DOCUMENTS = int(os.getenv("PRD_BATCH_MAX_DOCUMENTS", "500"))
+# Every batch shares this executor, so concurrent batches together never run
+# more stages at once than the Gemini quota allows.
+BATCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PRD_BATCH_WORKERS", "8")),
+    thread_name_prefix="batch-stage",
+)
+
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Analyze many documents in one request, streaming NDJSON per document.
+
+    Takes ``{"documents": [{"id", "text"}, ...], "outputs", "mode",
+    "reuse_similar"}``.
+    Identical texts are analyzed once and reported under every id; in
+    pipeline mode, documents whose outputs are all cached are answered
+    without scheduling anything. All remaining stages of all documents run
+    as one DAG on BATCH_EXECUTOR. Events are ``result``/``error`` (with
+    ``id`` and ``key``), ``document_done`` (with ``cached`` and
+    ``duplicate_of``) and a final ``done`` with counts.
+    """
+    data = request.get_json()
+    documents = data.get("documents") or []
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(outputs, mode, reuse_similar=reuse_similar)
+    if error_response:
+        return error_response
+    if not documents or len(documents) > BATCH_MAX_DOCUMENTS:
+        return jsonify(
+            {"error": f"Send between 1 and {BATCH_MAX_DOCUMENTS} documents."}
+        ), 400
+
+    # digest -> ids sharing that (normalized) text; the first id is the one analyzed
+    groups = {}
+    texts = {}
+    for index, document in enumerate(documents):
+        doc_id = str(document.get("id", index))
+        text = prepare_text(document["text"])
+        digest = text_digest(text)
+        groups.setdefault(digest, []).append(doc_id)
+        texts.setdefault(digest, text)
+
+    response_keys = {stage: key for stage, key in OUTPUTS.values()}
+    requested = [OUTPUTS[name][0] for name in outputs]
+    events = queue.Queue()
+
+    def finish(digest, cached=False):
+        first, *duplicates = groups[digest]
+        events.put({"event": "document_done", "id": first, "cached": cached})
+        for doc_id in duplicates:
+            events.put(
+                {"event": "document_done", "id": doc_id, "cached": cached, "duplicate_of": first}
+            )
+
+    def emit(digest, stage, result, error, source=None):
+        for doc_id in groups[digest]:
+            if error is None:
+                events.put(
+                    {
+                        "event": "result",
+                        "id": doc_id,
+                        "key": response_keys[stage],
+                        "data": result,
+                        "source": source,
+                    }
+                )
+            else:
+                events.put(
+                    {"event": "error", "id": doc_id, "key": response_keys[stage], "message": str(error)}
+                )
+
+    def drive():
+        scheduler = StageScheduler(executor=BATCH_EXECUTOR)
+        prefixes, remaining, sources, cached_count = {}, {}, {}, 0
+        # Batch stages queue behind interactive requests for Gemini capacity
+        with priority_class("batch"):
+            try:
+                for digest in groups:
+                    cached = (
+                        cachedOutputs(texts[digest], outputs, reuse_similar)
+                        if mode == "pipeline"
+                        else None
+                    )
+                    if cached is not None:
+                        for stage, (source, result) in cached.items():
+                            emit(digest, stage, result, None, source)
+                        finish(digest, cached=True)
+                        cached_count += 1
+                        continue
+                    prefix = f"{len(prefixes)}:"
+                    prefixes[prefix] = digest
+                    remaining[digest] = set(requested)
+                    document_scheduler = buildAnalysisScheduler(
+                        texts[digest], mode=mode, reuse_similar=reuse_similar
+                    )
+                    sources[digest] = document_scheduler.sources
+                    scheduler.add_stages_from(document_scheduler, prefix)
+
+                targets = [prefix + stage for prefix in prefixes for stage in requested]
+                for name, result, error in scheduler.iter_run(targets=targets):
+                    prefix, stage = name.split(":", 1)
+                    digest = prefixes[prefix + ":"]
+                    if stage not in remaining[digest]:
+                        continue
+                    emit(digest, stage, result, error, sources[digest].get(stage))
+                    remaining[digest].discard(stage)
+                    if not remaining[digest]:
+                        finish(digest)
+            finally:
+                events.put(
+                    {
+                        "event": "done",
+                        "documents": len(documents),
+                        "unique": len(groups),
+                        "cached": cached_count,
+                    }
+                )
+
+    threading.Thread(target=drive, daemon=True).start()
+
+    def generate():
+        while True:
+            event = events.get()
+            yield json.dumps(event) + "\n"
+            if event["event"] == "done":
+                return
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def buildAnalysisScheduler(
+    text, on_summary_delta=None, mode=DEFAULT_MODE, reuse_similar=True
+):
+    """Model the /analyze stages as a DAG so independent Gemini calls overlap.
+
+    Only the user flows need the summary; the flowchart and the wireframes
+    both work from the PRD text, which callers pass through
+    ``prepare_text`` first. In combined mode every output stage
+    instead picks its field out of one shared Gemini call. Large PRDs
+    always use the pipeline, which knows how to chunk them.
+
+    Built inside a ``deadline_scope``, every Gemini stage must finish by the
+    deadline, and a summary that misses its share of it is replaced by an
+    extractive one. ``scheduler.sources`` records where each result came
+    from. ``reuse_similar=False`` serves only this document's own cached
+    results, never a near-duplicate's.
+    """
+    prd_summarizer = PRDSummarizer(
+        api_key=GEMINI_API_KEY, prd_text=text, cache=RESULT_CACHE
+    )
+    document = DocumentResults(text, reuse_similar)
+    deadline = current_deadline()
+    scheduler = StageScheduler(max_workers=STAGE_WORKERS)
+    sources = scheduler.sources
+
+    def cached(stage, owner, compute, fallback=None, inputs=()):
+        """Serve a stage from the result cache (or a near-duplicate PRD's
+        results), computing it on a miss; under a deadline, ``fallback``
+        (if any) answers instead of a late computation. Results computed
+        from a fallback among the ``inputs`` stages are not cached."""
+
+        def lookup(*args):
+            source, value = document.get(stage, owner)
+            if source:
+                return source, value
+            value = compute(*args)
+            if value is not None and all(
+                sources.get(name) != "extractive" for name in inputs
+            ):
+                document.set(stage, owner, value)
+            return "gemini", value
+
+        def run(*args):
+            if deadline is None:
+                source, value = lookup(*args)
+            else:
+                share = SUMMARY_DEADLINE_SHARE if stage == "summary" else 1.0
+                source, value = call_within(
+                    stage,
+                    deadline.share(share),
+                    lookup,
+                    *args,
+                    fallback=fallback and (lambda: ("extractive", fallback())),
+                )
+            sources[stage] = source
+            return value
+
+        return run
+
+    def fromCombined(stage, value):
+        sources[stage] = sources.get("combined")
+        return value
+
+    def summarize():
+        prd_summarizer.summarize_text(on_delta=on_summary_delta)
+        return prd_summarizer.summarized_text
+
+    def user_flows(summary):
+        prd_summarizer.summarized_text = summary
+        prd_summarizer.extract_user_flows()
+        return prd_summarizer.user_flow_text
+
+    if mode == "combined" and not is_large(text):
+        analyzer = CombinedAnalyzer(api_key=GEMINI_API_KEY, prd_text=text)
+        scheduler.add_stage(
+            "combined", cached("combined", CombinedAnalyzer, analyzer.analyze)
+        )
+        for stage, field in [("summary", "summary"), ("user_flows", "user_flows")]:
+            scheduler.add_stage(
+                stage,
+                lambda combined, stage=stage, field=field: fromCombined(
+                    stage, combined[field]
+                ),
+                ["combined"],
+            )
+        scheduler.add_stage(
+            "mermaid",
+            lambda combined: fromCombined(
+                "mermaid", prd_summarizer.finalize_mermaid(combined["mermaid"])
+            ),
+            ["combined"],
+        )
+        scheduler.add_stage(
+            "wireframes",
+            lambda combined: fromCombined(
+                # A copy: validation fills in "edges" and the combined
+                # result may be a cached object shared with other requests
+                "wireframes",
+                with_layout(validate_wireframes(dict(combined["wireframes"]))),
+            ),
+            ["combined"],
+        )
+        return scheduler
+
+    scheduler.add_stage(
+        "summary",
+        cached(
+            "summary",
+            PRDSummarizer,
+            summarize,
+            fallback=lambda: extractive_summary(text),
+        ),
+    )
+    scheduler.add_stage(
+        "user_flows",
+        cached("user_flows", PRDSummarizer, user_flows, inputs=["summary"]),
+        depends_on=["summary"],
+    )
+    scheduler.add_stage(
+        "mermaid",
+        cached("mermaid", PRDSummarizer, prd_summarizer.generate_mermaid_code),
+    )
+    scheduler.add_stage(
+        "wireframes",
+        cached("wireframes", WireframeGenerator, lambda: getWireframes(text)),
+    )
+    return scheduler
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    stats = RESULT_CACHE.stats()
+    if SIMILAR_INDEX is not None:
+        stats["similar_index"] = SIMILAR_INDEX.stats()
+    context_cache = get_client(GEMINI_API_KEY).context_cache
+    if context_cache is not None:
+        stats["context_cache"] = context_cache.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 def defaultResponse(text):
@@ -150,7 +715,7 @@ def defaultResponse(text):
 
 
 def getWireframes(text):
-    generator = WireframeGenerator(GEMINI_API_KEY, text)
+    generator = WireframeGenerator(GEMINI_API_KEY, text, cache=RESULT_CACHE)
     result = generator.process()
     return result
 
@@ -321,7 +886,7 @@ def getSampleWireframes():
         ],
     }
 
-    return sampleJson1
+    return with_layout(sampleJson1)
 
 
 @app.route("/")
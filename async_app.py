@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import os
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+from routes.prd_summarizer import AsyncPRDSummarizer, PRDSummarizer
+from routes.wireframe_generator import AsyncWireframeGenerator, WireframeGenerator
+from routes.combined_analyzer import AsyncCombinedAnalyzer, CombinedAnalyzer
+from routes.large_document import is_large
+from routes.stage_scheduler import AsyncStageScheduler
+from routes.metrics import REGISTRY, log_payload
+from routes.json_repair import validate_wireframes
+from routes.wireframe_layout import with_layout
+from routes.text_normalizer import prepare_text
+from routes.deadline import call_within_async, current_deadline, deadline_scope
+from routes.extractive_summary import summarize as extractive_summary
+from routes.async_gemini_client import get_async_client
+from routes.analysis_config import (
+    DEFAULT_MODE,
+    DEFAULT_OUTPUTS,
+    GEMINI_API_KEY,
+    OUTPUTS,
+    RESULT_CACHE,
+    SIMILAR_INDEX,
+    SUMMARY_DEADLINE_SHARE,
+    DocumentResults,
+    options_error,
+    output_sources,
+    request_deadline,
+)
+
+# asyncio counterpart of app.py for /analyze and /analyze/stream: every
+# in-flight analysis is a few coroutines rather than a thread per stage, so
+# one worker process can serve hundreds of them. Run it with an ASGI server,
+# e.g. ``hypercorn async_app:app``. Uploads, jobs and batches stay on app.py.
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+app = cors(Quart(__name__), allow_origin="*")
+
+
+def invalidOptions(outputs, mode, deadline_seconds=None, reuse_similar=True):
+    message = options_error(outputs, mode, deadline_seconds, reuse_similar)
+    if message:
+        return jsonify({"error": message}), 400
+    return None
+
+
+@app.route("/analyze", methods=["POST"])
+async def analyze_text():
+    data = await request.get_json()
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(
+        outputs, mode, data.get("deadline_seconds"), reuse_similar
+    )
+    if error_response:
+        return error_response
+    deadline = request_deadline(data.get("deadline_seconds"))
+
+    # Normalizing a large PRD takes a moment; keep it off the event loop
+    text = await asyncio.to_thread(prepare_text, data["text"])
+    log_payload(logger, "Received text for analysis", text)
+
+    stages = [OUTPUTS[name][0] for name in outputs]
+    with deadline_scope(deadline):
+        scheduler = buildAnalysisScheduler(text, mode=mode, reuse_similar=reuse_similar)
+        run = await scheduler.run(targets=stages)
+
+    response = {
+        OUTPUTS[name][1]: run.results.get(OUTPUTS[name][0]) for name in outputs
+    }
+    response["sources"] = output_sources(scheduler.sources, outputs, run.results)
+    if run.errors:
+        response["errors"] = {name: str(error) for name, error in run.errors.items()}
+
+    succeeded = any(stage in run.results for stage in stages)
+    return jsonify(response), 200 if succeeded else 502
+
+
+@app.route("/analyze/stream", methods=["POST"])
+async def analyze_text_stream():
+    """Stream /analyze results as NDJSON; same events as app.py."""
+    data = await request.get_json()
+    outputs = data.get("outputs") or DEFAULT_OUTPUTS
+    mode = data.get("mode") or DEFAULT_MODE
+    reuse_similar = data.get("reuse_similar", True)
+
+    error_response = invalidOptions(
+        outputs, mode, data.get("deadline_seconds"), reuse_similar
+    )
+    if error_response:
+        return error_response
+    deadline = request_deadline(data.get("deadline_seconds"))
+
+    # Normalizing a large PRD takes a moment; keep it off the event loop
+    text = await asyncio.to_thread(prepare_text, data["text"])
+
+    events = asyncio.Queue()
+    response_keys = {stage: key for stage, key in OUTPUTS.values()}
+    requested = {OUTPUTS[name][0] for name in outputs}
+    summary_done = False
+
+    def on_summary_delta(delta):
+        # No deltas from a summary still streaming after an extractive fallback
+        if "summary" in requested and not summary_done:
+            events.put_nowait({"event": "summary_delta", "text": delta})
+
+    async def drive():
+        nonlocal summary_done
+        try:
+            with deadline_scope(deadline):
+                scheduler = buildAnalysisScheduler(
+                    text,
+                    on_summary_delta=on_summary_delta,
+                    mode=mode,
+                    reuse_similar=reuse_similar,
+                )
+                async for stage, result, error in scheduler.iter_run(targets=requested):
+                    if stage == "summary":
+                        summary_done = True
+                    if stage not in requested:
+                        continue
+                    if error is None:
+                        events.put_nowait(
+                            {
+                                "event": "result",
+                                "key": response_keys[stage],
+                                "data": result,
+                                "source": scheduler.sources.get(stage),
+                            }
+                        )
+                    else:
+                        events.put_nowait(
+                            {"event": "error", "key": response_keys[stage], "message": str(error)}
+                        )
+        finally:
+            events.put_nowait({"event": "done"})
+
+    async def generate():
+        # The analysis lives as long as the response: a client that
+        # disconnects cancels its outstanding Gemini calls
+        task = asyncio.ensure_future(drive())
+        try:
+            while True:
+                event = await events.get()
+                yield (json.dumps(event) + "\n").encode("utf-8")
+                if event["event"] == "done":
+                    return
+        finally:
+            task.cancel()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def buildAnalysisScheduler(
+    text, on_summary_delta=None, mode=DEFAULT_MODE, reuse_similar=True
+):
+    """The DAG of app.buildAnalysisScheduler with coroutine stages.
+
+    Results are cached under the same keys as the Flask app, so both
+    serve each other's cached analyses. Deadlines and the extractive
+    summary fallback work as there.
+    """
+    prd_summarizer = AsyncPRDSummarizer(
+        api_key=GEMINI_API_KEY, prd_text=text, cache=RESULT_CACHE
+    )
+    document = DocumentResults(text, reuse_similar)
+    deadline = current_deadline()
+    scheduler = AsyncStageScheduler()
+    sources = scheduler.sources
+
+    def cached(stage, owner, compute, fallback=None, inputs=()):
+        """Serve a stage from the result cache (or a near-duplicate PRD's
+        results), computing it on a miss; under a deadline, ``fallback``
+        (if any) answers instead of a late computation. Results computed
+        from a fallback among the ``inputs`` stages are not cached."""
+
+        async def lookup(*args):
+            # The result cache is SQLite; keep its I/O off the event loop
+            source, value = await asyncio.to_thread(document.get, stage, owner)
+            if source:
+                return source, value
+            value = await compute(*args)
+            if value is not None and all(
+                sources.get(name) != "extractive" for name in inputs
+            ):
+                await asyncio.to_thread(document.set, stage, owner, value)
+            return "gemini", value
+
+        async def run(*args):
+            if deadline is None:
+                source, value = await lookup(*args)
+            else:
+                share = SUMMARY_DEADLINE_SHARE if stage == "summary" else 1.0
+                source, value = await call_within_async(
+                    stage,
+                    deadline.share(share),
+                    lookup,
+                    *args,
+                    fallback=fallback and (lambda: ("extractive", fallback())),
+                )
+            sources[stage] = source
+            return value
+
+        return run
+
+    def fromCombined(stage, value):
+        sources[stage] = sources.get("combined")
+        return value
+
+    async def summarize():
+        await prd_summarizer.summarize_text(on_delta=on_summary_delta)
+        return prd_summarizer.summarized_text
+
+    async def user_flows(summary):
+        prd_summarizer.summarized_text = summary
+        await prd_summarizer.extract_user_flows()
+        return prd_summarizer.user_flow_text
+
+    async def wireframes():
+        return await AsyncWireframeGenerator(
+            GEMINI_API_KEY, text, cache=RESULT_CACHE
+        ).process()
+
+    if mode == "combined" and not is_large(text):
+        analyzer = AsyncCombinedAnalyzer(api_key=GEMINI_API_KEY, prd_text=text)
+
+        async def field(combined, name):
+            return fromCombined(name, combined[name])
+
+        async def combined_wireframes(combined):
+            return fromCombined(
+                # A copy: validation fills in "edges" and the combined
+                # result may be a cached object shared with other requests
+                "wireframes",
+                with_layout(validate_wireframes(dict(combined["wireframes"]))),
+            )
+
+        async def combined_mermaid(combined):
+            return fromCombined(
+                "mermaid", await prd_summarizer.finalize_mermaid(combined["mermaid"])
+            )
+
+        scheduler.add_stage(
+            "combined", cached("combined", CombinedAnalyzer, analyzer.analyze)
+        )
+        for stage in ["summary", "user_flows"]:
+            scheduler.add_stage(
+                stage, lambda combined, name=stage: field(combined, name), ["combined"]
+            )
+        scheduler.add_stage("mermaid", combined_mermaid, ["combined"])
+        scheduler.add_stage("wireframes", combined_wireframes, ["combined"])
+        return scheduler
+
+    scheduler.add_stage(
+        "summary",
+        cached(
+            "summary",
+            PRDSummarizer,
+            summarize,
+            fallback=lambda: extractive_summary(text),
+        ),
+    )
+    scheduler.add_stage(
+        "user_flows",
+        cached("user_flows", PRDSummarizer, user_flows, inputs=["summary"]),
+        depends_on=["summary"],
+    )
+    scheduler.add_stage(
+        "mermaid",
+        cached("mermaid", PRDSummarizer, prd_summarizer.generate_mermaid_code),
+    )
+    scheduler.add_stage(
+        "wireframes", cached("wireframes", WireframeGenerator, wireframes)
+    )
+    return scheduler
+
+
+@app.route("/cache/stats")
+async def cache_stats():
+    stats = await asyncio.to_thread(RESULT_CACHE.stats)
+    if SIMILAR_INDEX is not None:
+        stats["similar_index"] = await asyncio.to_thread(SIMILAR_INDEX.stats)
+    context_cache = get_async_client(GEMINI_API_KEY).context_cache
+    if context_cache is not None:
+        stats["context_cache"] = context_cache.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/")
+async def hello():
+    return "Hello, async Quart API is running!"
+
+
+if __name__ == "__main__":
+    app.run(port=8000, host="0.0.0.0")
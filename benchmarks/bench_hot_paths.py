@@ -0,0 +1,244 @@
+"""pytest-benchmark suite for this service's own CPU hot paths.
+
+Gemini is answered from recorded responses (``routes/replay.py``), so only
+our code is measured, for a small, a medium and a huge PRD: building the
+request bodies, parsing responses (``validateJsonResponse`` and the
+Mermaid extraction and canonicalization), serializing the /analyze
+response and the whole replayed analysis. Every test reports CPU time and
+tracemalloc peak and retained memory, and fails when the fastest CPU time
+or the peak memory is more than BENCH_TOLERANCE (default 0.3) above
+benchmarks/baselines/hot_paths.json::
+
+    pip install -r requirements-bench.txt
+    python -m pytest benchmarks/bench_hot_paths.py
+    BENCH_UPDATE_BASELINES=1 python -m pytest benchmarks/bench_hot_paths.py
+
+CPU time baselines depend on the machine; update them where the suite
+runs. The corpus is recorded against benchmarks/mock_gemini.py into a
+temporary directory, unless BENCH_REPLAY_DIR already holds
+``<corpus>.sqlite3`` stores; the mock's notes, flowcharts and wireframes
+grow with the PRD (one screen per SCALE_TOKENS prompt tokens), so bigger
+PRDs also mean bigger responses to parse. Run once with BENCH_RECORD_LIVE=1 and
+GEMINI_API_KEY set to record real responses into BENCH_REPLAY_DIR.
+"""
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+# Every analysis must reach the (replayed) client, with nothing in between
+os.environ.update(PRD_CACHE_PATH="", PRD_CACHE_MEMORY_ENTRIES="0", PRD_SIMILAR_INDEX_PATH="")
+for name in ("GEMINI_HEDGING", "GEMINI_CONTEXT_CACHE", "GEMINI_REPLAY_MODE"):
+    os.environ.pop(name, None)
+os.environ.setdefault("GEMINI_API_KEY", "mock")
+
+import mock_gemini  # noqa: E402
+from extractive_benchmark import long_prd  # noqa: E402
+from routes.gemini_client import GeminiResponse, get_client  # noqa: E402
+from routes.large_document import (  # noqa: E402
+    FLOW_NOTES_PROMPT,
+    chunk_text,
+    condense,
+    flow_notes,
+    is_large,
+)
+from routes.mermaid_graph import canonicalize  # noqa: E402
+from routes.prd_summarizer import PRDSummarizer  # noqa: E402
+from routes.replay import ReplayStore  # noqa: E402
+from routes.text_normalizer import prepare_text  # noqa: E402
+from routes.wireframe_generator import WireframeGenerator  # noqa: E402
+
+BASELINES = os.path.join(HERE, "baselines", "hot_paths.json")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.3"))
+# Absolute slack on top of the tolerance, so timer jitter on microsecond
+# paths does not count as a regression
+SLACK = {"cpu_ms": 0.05, "peak_kb": 4.0}
+OUTPUTS = ["summary", "flowchart", "user_flows", "wireframes"]
+# Prompt tokens per screen in the mock's scaled responses
+SCALE_TOKENS = 150
+CORPUS = {
+    "small": lambda: open(os.path.join(HERE, "fixtures", "quiz_prd.md"), encoding="utf-8").read(),
+    "medium": lambda: long_prd(10, 1),
+    "huge": lambda: long_prd(200, 1),
+}
+
+# CPU time of the whole process, so stage threads are counted too
+pytestmark = pytest.mark.benchmark(
+    timer=time.process_time,
+    min_rounds=5,
+    max_time=2.0,
+    disable_gc=True,
+    warmup=True,
+    warmup_iterations=3,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def corpus_text(name):
+    return CORPUS[name]()
+
+
+class Baselines:
+    """Stored CPU times and peaks; records instead of checking when updating."""
+
+    def __init__(self, path, update):
+        self.path = path
+        self.update = update
+        self.values = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.values = json.load(f)
+
+    def check(self, name, measured):
+        if self.update:
+            self.values[name] = {metric: round(value, 3) for metric, value in measured.items()}
+            return
+        baseline = self.values.get(name)
+        if baseline is None:
+            warnings.warn(f"No baseline for {name}; run with BENCH_UPDATE_BASELINES=1")
+            return
+        failures = [
+            f"{metric} {value:.3f} > {baseline[metric]:.3f} +{TOLERANCE:.0%}"
+            for metric, value in measured.items()
+            if metric in baseline
+            and value > baseline[metric] * (1 + TOLERANCE) + SLACK[metric]
+        ]
+        if failures:
+            pytest.fail(f"{name} regressed: " + ", ".join(failures))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.values, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+@pytest.fixture(scope="session")
+def baselines():
+    stored = Baselines(BASELINES, os.getenv("BENCH_UPDATE_BASELINES") == "1")
+    yield stored
+    if stored.update:
+        stored.save()
+
+
+@pytest.fixture(scope="session")
+def service():
+    import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(service):
+    return get_client(service.GEMINI_API_KEY)
+
+
+@pytest.fixture(scope="session")
+def recordings(service, client, tmp_path_factory):
+    """A replay store per corpus PRD, recorded first where missing."""
+    directory = os.getenv("BENCH_REPLAY_DIR") or str(tmp_path_factory.mktemp("replay"))
+    live = os.getenv("BENCH_RECORD_LIVE") == "1"
+    server, stores = None, {}
+    for name in CORPUS:
+        path = os.path.join(directory, f"{name}.sqlite3")
+        if live or not os.path.exists(path):
+            if not live and server is None:
+                server = mock_gemini.start_server(mock_gemini.MockGemini(scale_tokens=SCALE_TOKENS))
+                client.base_url = mock_gemini.base_url(server)
+            client.replay = ReplayStore(path, "record")
+            service.runAnalysis(corpus_text(name), OUTPUTS, "pipeline")
+        stores[name] = ReplayStore(path, "replay")
+    if server is not None:
+        server.shutdown()
+    return stores
+
+
+@pytest.fixture(scope="session", params=list(CORPUS))
+def corpus(request, client, recordings):
+    """``(name, text)`` of a corpus PRD, with its recordings replayed."""
+    client.replay = recordings[request.param]
+    return request.param, corpus_text(request.param)
+
+
+def response_text(client, stage):
+    return GeminiResponse(200, client.replay.responses(stage)[0]).text
+
+
+def check(benchmark, baselines, request, func, *args):
+    """Benchmark ``func(*args)``, then trace one more call's memory and
+    compare both with the baseline."""
+    result = benchmark(func, *args)
+    if benchmark.disabled:
+        return result
+    tracemalloc.start()
+    try:
+        func(*args)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The fastest round: other load on the machine only ever adds time
+    measured = {"cpu_ms": benchmark.stats.stats.min * 1000, "peak_kb": peak / 1024}
+    benchmark.extra_info.update(measured, retained_kb=retained / 1024)
+    baselines.check(request.node.name, measured)
+    return result
+
+
+def build_requests(client, text):
+    """Serialized request bodies for an analysis of ``text``, with the
+    documents runAnalysis sends: the map prompts of a large PRD, then the
+    stage prompts over the PRD or, for a large one, over its (replayed)
+    condensed notes."""
+    text = prepare_text(text)
+    summarizer = PRDSummarizer(client.api_key, text, client=client)
+    generator = WireframeGenerator(client.api_key, text, client=client)
+    prompts = []
+    if is_large(text):
+        for chunk in chunk_text(text):
+            prompts.append((summarizer.chunk_prompt(chunk), None))
+            prompts.append((FLOW_NOTES_PROMPT.format(chunk=chunk), None))
+    summary_document = condense(text, summarizer.summarize_chunk)
+    flow_document = flow_notes(client, summarizer.MODEL, text)
+    for prompt, document in (
+        (summarizer.summary_prompt(), summary_document),
+        (summarizer.mermaid_prompt(), flow_document),
+        (generator.wireframePrompt(), flow_document),
+    ):
+        prompts.append((prompt, document))
+    return [
+        json.dumps(client.payload(prompt, None, document)).encode("utf-8")
+        for prompt, document in prompts
+    ]
+
+
+def test_build_requests(benchmark, baselines, request, client, corpus):
+    check(benchmark, baselines, request, build_requests, client, corpus[1])
+
+
+def test_parse_wireframes(benchmark, baselines, request, client, corpus):
+    generator = WireframeGenerator(client.api_key, "", client=client)
+    text = response_text(client, "wireframes")
+    check(benchmark, baselines, request, generator.validateJsonResponse, text)
+
+
+def test_parse_mermaid(benchmark, baselines, request, client, corpus):
+    text = response_text(client, "mermaid")
+    check(benchmark, baselines, request, canonicalize, text)
+
+
+def test_serialize_response(benchmark, baselines, request, service, corpus):
+    response, _ = service.runAnalysis(corpus[1], OUTPUTS, "pipeline")
+    # What jsonify does to the body in analyze_text
+    check(benchmark, baselines, request, service.app.json.dumps, response)
+
+
+def test_replayed_analysis(benchmark, baselines, request, service, corpus):
+    check(benchmark, baselines, request, service.runAnalysis, corpus[1], OUTPUTS, "pipeline")
@@ -0,0 +1,124 @@
+"""Compare the combined single-call mode with the multi-call pipeline.
+
+For each mode, runs the analysis ``--runs`` times with the result cache
+off and reports latency, Gemini calls, request bytes, prompt/output tokens
+and how many runs produced valid outputs (non-empty summary, a Mermaid
+flowchart header, wireframes whose edges point at existing screens)::
+
+    python benchmarks/combined_benchmark.py --runs 10 --latency lognormal:1500,0.4
+    GEMINI_API_KEY=... python benchmarks/combined_benchmark.py --live --runs 3
+
+Without ``--live`` the calls go to benchmarks/mock_gemini.py, which is
+only useful to compare call counts and bytes; use ``--live`` for real
+latency and output quality.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import mock_gemini  # noqa: E402
+
+OUTPUTS = ["summary", "flowchart", "user_flows", "wireframes"]
+
+
+def valid_outputs(response):
+    """Return which outputs of an /analyze response body look valid."""
+    summary = response.get("summarizedText")
+    flowchart = (response.get("Flowchart") or "").lstrip()
+    wireframes = response.get("wireframes")
+
+    wireframes_ok = False
+    if isinstance(wireframes, dict) and isinstance(wireframes.get("screens"), list):
+        count = len(wireframes["screens"])
+        wireframes_ok = all(
+            isinstance(edge.get("from"), int)
+            and isinstance(edge.get("to"), int)
+            and 0 <= edge["from"] < count
+            and 0 <= edge["to"] < count
+            for edge in wireframes.get("edges", [])
+        )
+
+    return {
+        "summary": bool(summary and summary.strip()),
+        "flowchart": flowchart.startswith(("graph", "flowchart")),
+        "user_flows": bool(response.get("userFlow")),
+        "wireframes": wireframes_ok,
+    }
+
+
+def measure(service, metrics, text, mode, runs):
+    def counters():
+        return {
+            "calls": metrics.GEMINI_REQUESTS.total(),
+            "request_bytes": metrics.GEMINI_REQUEST_BYTES.total(),
+            "prompt_tokens": metrics.GEMINI_TOKENS.total(kind="prompt"),
+            "output_tokens": metrics.GEMINI_TOKENS.total(kind="output"),
+        }
+
+    before = counters()
+    latencies, valid = [], {name: 0 for name in OUTPUTS}
+    for _ in range(runs):
+        start = time.perf_counter()
+        response, _ = service.runAnalysis(text, OUTPUTS, mode)
+        latencies.append(time.perf_counter() - start)
+        for name, ok in valid_outputs(response).items():
+            valid[name] += ok
+
+    after = counters()
+    result = {name: (after[name] - before[name]) / runs for name in after}
+    result.update(
+        mode=mode,
+        latency_p50=statistics.median(latencies),
+        latency_max=max(latencies),
+        valid=valid,
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--prd", default=os.path.join(HERE, "fixtures", "quiz_prd.md"))
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API")
+    mock_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if not args.live:
+        server = mock_gemini.start_server(mock_gemini.from_arguments(args))
+        os.environ["GEMINI_API_BASE"] = mock_gemini.base_url(server)
+        os.environ.setdefault("GEMINI_API_KEY", "mock")
+    os.environ["PRD_CACHE_PATH"] = ""
+    os.environ["PRD_CACHE_MEMORY_ENTRIES"] = "0"
+
+    import app as service
+    from routes import metrics
+
+    with open(args.prd, encoding="utf-8") as f:
+        text = f.read()
+
+    print(
+        f"{'mode':10} {'p50 s':>7} {'max s':>7} {'calls':>6} {'req KB':>8} "
+        f"{'prompt tok':>10} {'output tok':>10}  valid/{args.runs}"
+    )
+    for mode in ("pipeline", "combined"):
+        result = measure(service, metrics, text, mode, args.runs)
+        valid = " ".join(f"{name}={count}" for name, count in result["valid"].items())
+        print(
+            f"{mode:10} {result['latency_p50']:7.2f} {result['latency_max']:7.2f} "
+            f"{result['calls']:6.1f} {result['request_bytes'] / 1024:8.1f} "
+            f"{result['prompt_tokens']:10.0f} {result['output_tokens']:10.0f}  {valid}"
+        )
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Measure what context caching saves on repeated analyses of one PRD.
+
+Analyzes a ``--pages`` page PRD once and then ``--followups`` more times
+with the result cache off, first sending the PRD inline with every stage
+and then through a Gemini context cache, and reports the bytes sent to
+Gemini and the latency of the first and the follow-up analyses. It also
+times the first streamed summary chunk (time to first token) for a new
+PRD and for a PRD already cached. Pass ``--max-bytes-ratio`` to exit
+non-zero when cached follow-ups send more than that share of the inline
+bytes::
+
+    python benchmarks/context_cache_benchmark.py --pages 25 --prefill-ms 20
+    GEMINI_API_KEY=... python benchmarks/context_cache_benchmark.py --live --followups 2
+
+Without ``--live`` the calls go to benchmarks/mock_gemini.py, whose
+``--prefill-ms`` delay per 1000 uncached prompt tokens stands in for
+Gemini reading the prompt; byte counts are exact either way.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import mock_gemini  # noqa: E402
+from extractive_benchmark import long_prd  # noqa: E402
+
+OUTPUTS = ["summary", "flowchart", "user_flows", "wireframes"]
+
+
+def measure(service, metrics, text, followups):
+    """Request bytes and latency of a first analysis and its follow-ups."""
+    runs = []
+    for _ in range(followups + 1):
+        sent = metrics.GEMINI_REQUEST_BYTES.total()
+        start = time.perf_counter()
+        service.runAnalysis(text, OUTPUTS, "pipeline")
+        runs.append(
+            (metrics.GEMINI_REQUEST_BYTES.total() - sent, time.perf_counter() - start)
+        )
+    return runs
+
+
+def first_token(summarizer):
+    """Seconds until a streamed summary produces its first chunk."""
+    start, first = time.perf_counter(), []
+    summarizer.summarize_text(
+        on_delta=lambda delta: first or first.append(time.perf_counter() - start)
+    )
+    return first[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=25)
+    parser.add_argument("--followups", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API")
+    parser.add_argument("--max-bytes-ratio", type=float, default=float("inf"))
+    mock_gemini.add_arguments(parser)
+    parser.set_defaults(latency="fixed:100", prefill_ms=20.0)
+    args = parser.parse_args()
+
+    server = None
+    if not args.live:
+        server = mock_gemini.start_server(mock_gemini.from_arguments(args))
+        os.environ["GEMINI_API_BASE"] = mock_gemini.base_url(server)
+        os.environ.setdefault("GEMINI_API_KEY", "mock")
+    os.environ["PRD_CACHE_PATH"] = ""
+    os.environ["PRD_CACHE_MEMORY_ENTRIES"] = "0"
+    os.environ["PRD_SIMILAR_INDEX_PATH"] = ""
+
+    import app as service
+    from routes import metrics
+    from routes.context_cache import ContextCache
+    from routes.gemini_client import get_client
+    from routes.prd_summarizer import PRDSummarizer
+
+    client = get_client(service.GEMINI_API_KEY)
+    text = long_prd(args.pages, args.seed)
+    print(f"PRD: {args.pages} pages, {len(text)} chars")
+    print(
+        f"{'context':8} {'first KB':>9} {'first s':>8} {'follow KB':>10} {'follow s':>9} "
+        f"{'TTFT new s':>11} {'TTFT cached s':>14}"
+    )
+
+    results = {}
+    for variant in ("inline", "cached"):
+        client.context_cache = ContextCache() if variant == "cached" else None
+        (first_bytes, first_seconds), *rest = measure(service, metrics, text, args.followups)
+        # A PRD seen for the first time, then the same PRD again
+        new_text = long_prd(args.pages, args.seed + 1)
+        ttft_new = first_token(PRDSummarizer(service.GEMINI_API_KEY, new_text, client=client))
+        ttft_cached = statistics.median(
+            first_token(PRDSummarizer(service.GEMINI_API_KEY, new_text, client=client))
+            for _ in range(max(1, args.followups))
+        )
+        follow_bytes = statistics.mean(sent for sent, _ in rest) if rest else 0.0
+        follow_seconds = statistics.median(seconds for _, seconds in rest) if rest else 0.0
+        results[variant] = follow_bytes
+        print(
+            f"{variant:8} {first_bytes / 1024:9.1f} {first_seconds:8.2f} "
+            f"{follow_bytes / 1024:10.1f} {follow_seconds:9.2f} "
+            f"{ttft_new:11.3f} {ttft_cached:14.3f}"
+        )
+
+    if server:
+        server.shutdown()
+    if results["inline"]:
+        ratio = results["cached"] / results["inline"]
+        print(f"follow-up bytes, cached / inline: {ratio:.3f}")
+        if ratio > args.max_bytes_ratio:
+            print(f"FAIL follow-up bytes ratio {ratio:.3f} above {args.max_bytes_ratio}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
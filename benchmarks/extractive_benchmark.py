@@ -0,0 +1,79 @@
+"""Time the extractive fallback summary on a long PRD.
+
+Builds a PRD of ``--pages`` pages (about 3000 characters each) from
+varied copies of the fixture paragraphs, then reports how long
+``routes.extractive_summary.summarize`` takes on it with its line
+structure intact and with whitespace collapsed, and the summary length.
+Pass ``--max-seconds`` to exit non-zero on a regression::
+
+    python benchmarks/extractive_benchmark.py --pages 200 --max-seconds 1
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from routes.extractive_summary import summarize  # noqa: E402
+
+FIXTURES = os.path.join(HERE, "fixtures")
+PAGE_CHARS = 3000
+
+
+def long_prd(pages, seed):
+    """A ``pages``-page PRD of fixture paragraphs with a fifth of their
+    words swapped, so no two paragraphs are identical."""
+    rng = random.Random(seed)
+    paragraphs = []
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith((".txt", ".md")):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                paragraphs.extend(p for p in f.read().split("\n\n") if p.strip())
+    words = sorted({word for paragraph in paragraphs for word in paragraph.split()})
+
+    document, size = [], 0
+    while size < pages * PAGE_CHARS:
+        paragraph = rng.choice(paragraphs).split()
+        for i in rng.sample(range(len(paragraph)), len(paragraph) // 5):
+            paragraph[i] = rng.choice(words)
+        document.append(" ".join(paragraph))
+        size += len(document[-1]) + 2
+    return "\n\n".join(document)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=float("inf"))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    text = long_prd(args.pages, args.seed)
+    print(f"PRD: {args.pages} pages, {len(text)} chars, {len(text.split())} words")
+    failures = []
+    for variant, source in (("lines", text), ("collapsed", " ".join(text.split()))):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            summary = summarize(source)
+            timings.append(time.perf_counter() - start)
+        worst = max(timings)
+        print(
+            f"{variant:10} median {statistics.median(timings) * 1000:7.1f} ms  "
+            f"max {worst * 1000:7.1f} ms  summary {len(summary)} chars"
+        )
+        if worst > args.max_seconds:
+            failures.append(f"{variant}: {worst:.2f}s above {args.max_seconds}s")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
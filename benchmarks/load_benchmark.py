@@ -0,0 +1,172 @@
+"""End-to-end load/latency benchmark for /analyze against the Gemini mock.
+
+Starts benchmarks/mock_gemini.py in-process, points the backend at it and
+drives the Flask app from N client threads per concurrency level. Reports
+throughput, p50/p95/p99 latency per request and per stage, error counts
+and peak memory, and optionally compares against a saved baseline::
+
+    python benchmarks/load_benchmark.py --concurrency 1,8,32 --requests 64 \
+        --latency lognormal:800,0.5 --output bench.json --baseline baseline.json
+
+The result cache is disabled unless ``--cache`` is given, so every request
+exercises the full pipeline.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import mock_gemini  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": statistics.mean(values) if values else None,
+    }
+
+
+def run_level(client, body, concurrency, total, stage_times):
+    """Send ``total`` requests from ``concurrency`` threads."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    for times in stage_times.values():
+        times.clear()
+
+    def one(_):
+        start = time.perf_counter()
+        response = client.post("/analyze", json=body)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": total / wall,
+        "latency": summarize(latencies),
+        "stages": {name: summarize(times) for name, times in stage_times.items()},
+        "statuses": statuses,
+    }
+
+
+def print_level(level, baseline=None):
+    latency = level["latency"]
+    print(
+        f"\nconcurrency {level['concurrency']}: {level['throughput_rps']:.2f} req/s, "
+        f"statuses {level['statuses']}"
+    )
+    print(f"  {'':12} {'p50':>8} {'p95':>8} {'p99':>8}")
+    rows = [("request", latency)] + sorted(level["stages"].items())
+    for name, stats in rows:
+        if not stats["count"]:
+            continue
+        print(
+            f"  {name:12} {stats['p50']:8.3f} {stats['p95']:8.3f} {stats['p99']:8.3f}"
+        )
+    if baseline:
+        before = baseline["latency"]["p95"]
+        change = (latency["p95"] - before) / before * 100
+        print(
+            f"  vs baseline: p95 {change:+.1f}%, throughput "
+            f"{(level['throughput_rps'] / baseline['throughput_rps'] - 1) * 100:+.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=32, help="requests per level")
+    parser.add_argument(
+        "--prd", default=os.path.join(HERE, "fixtures", "quiz_prd.md")
+    )
+    parser.add_argument("--outputs", default="summary,flowchart,wireframes")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --output run")
+    mock_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = mock_gemini.start_server(mock_gemini.from_arguments(args))
+    os.environ["GEMINI_API_BASE"] = mock_gemini.base_url(server)
+    os.environ.setdefault("GEMINI_API_KEY", "mock")
+    if not args.cache:
+        os.environ["PRD_CACHE_PATH"] = ""
+        os.environ["PRD_CACHE_MEMORY_ENTRIES"] = "0"
+
+    tracemalloc.start()
+    import app as service
+    from routes.stage_scheduler import add_stage_listener
+
+    stage_times = {}
+    stage_lock = threading.Lock()
+
+    def on_stage(stage, seconds, error):
+        with stage_lock:
+            stage_times.setdefault(stage, []).append(seconds)
+
+    add_stage_listener(on_stage)
+
+    with open(args.prd, encoding="utf-8") as f:
+        body = {"text": f.read(), "outputs": args.outputs.split(",")}
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+    client = service.app.test_client()
+    levels = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        level = run_level(client, body, concurrency, args.requests, stage_times)
+        levels.append(level)
+        print_level(level, baseline.get(concurrency))
+
+    _, peak_traced = tracemalloc.get_traced_memory()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\npeak traced allocations {peak_traced / 1e6:.1f}MB, peak RSS {peak_rss:.1f}MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "levels": levels,
+                    "peak_traced_mb": peak_traced / 1e6,
+                    "peak_rss_mb": peak_rss,
+                    "settings": vars(args),
+                },
+                f,
+                indent=2,
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""Local stand-in for the Gemini generateContent API.
+
+Serves ``/v1beta/models/<model>:generateContent``,
+``:streamGenerateContent`` and ``/v1beta/cachedContents`` with
+configurable latency, error rates and 429 bursts, so /analyze can be
+exercised without spending real quota. ``--prefill-ms`` adds a delay per
+1000 prompt tokens not read from cached content, which makes the effect
+of context caching on time to first token visible. Point the backend at
+it with::
+
+    python benchmarks/mock_gemini.py --port 8090 --latency lognormal:800,0.5
+    GEMINI_API_BASE=http://127.0.0.1:8090/v1beta python app.py
+
+Responses are canned per stage (recognised from the prompt) unless
+``--responses`` points at a directory of recorded ``<stage>.json`` bodies
+or ``<stage>.txt`` texts. With ``--scale-tokens N`` the notes, flowchart
+and wireframes instead grow with the prompt: one note, screen or group of
+flowchart nodes per N prompt tokens, as a model describing a bigger PRD
+would return.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MERMAID = (
+    "graph TD;\n    A[Login] --> B{Auth Success?}\n"
+    "    B -- Yes --> C[Dashboard]\n    B -- No --> A\n"
+    "    C --> D[Quiz Page]\n    D --> E[Results Page]\n    E --> C"
+)
+
+WIREFRAMES = {
+    "screens": [
+        {
+            "label": "Login",
+            "components": [
+                {"type": "TextField", "label": "Email"},
+                {"type": "TextField", "label": "Password"},
+                {"type": "Button", "label": "Login"},
+            ],
+        },
+        {
+            "label": "Dashboard",
+            "components": [
+                {"type": "List", "label": "Quiz History"},
+                {"type": "Button", "label": "Start Quiz"},
+            ],
+        },
+        {
+            "label": "Quiz",
+            "components": [
+                {"type": "Text", "label": "Question"},
+                {"type": "Button", "label": "Next"},
+            ],
+        },
+    ],
+    "edges": [{"from": 0, "to": 1}, {"from": 1, "to": 2}, {"from": 2, "to": 1}],
+}
+
+CANNED = {
+    "summary": (
+        "🔹 **Overview:** A quiz platform for students and instructors.\n"
+        "🔹 **Key Features:**\n✅ AI-generated quizzes\n✅ Adaptive difficulty\n"
+        "🔹 **Core UI Components:**\n📌 Login Screen\n📌 Dashboard\n📌 Quiz Page\n"
+        "🔹 **System Architecture:**\n🔹 Flask API\n🔹 PostgreSQL\n"
+        "🔹 **Future Enhancements:**\n🚀 Voice quizzes"
+    ),
+    "user_flows": (
+        "1. User opens the app and logs in.\n2. Dashboard shows quiz history.\n"
+        "3. User starts a quiz and answers questions.\n4. Results page shows feedback."
+    ),
+    "notes": "- Login screen with email and password\n- Dashboard lists quizzes\n- Quiz page with timer",
+    "mermaid": f"```mermaid\n{MERMAID}\n```",
+    "wireframes": f"```json\n{json.dumps(WIREFRAMES, indent=2)}\n```",
+}
+CANNED["combined"] = json.dumps(
+    {
+        "summary": CANNED["summary"],
+        "user_flows": CANNED["user_flows"],
+        "mermaid": MERMAID,
+        "wireframes": WIREFRAMES,
+    }
+)
+
+# Most screens a scaled response describes; Gemini's output limit caps it
+MAX_SCALED_SCREENS = 100
+
+
+def scaled_notes(count):
+    return "\n".join(
+        f"- Screen {i}: form with a title, a list of entries and a Save button; "
+        f"Save returns to screen {max(0, i - 1)}"
+        for i in range(count)
+    )
+
+
+def scaled_mermaid(screens):
+    """A flowchart over ``screens`` screens, using the syntax models produce:
+    shapes, labelled and ``&``-joined edges and subgraphs."""
+    lines = ["graph TD"]
+    for i in range(screens):
+        if i % 10 == 0:
+            if i:
+                lines.append("    end")
+            lines.append(f"    subgraph section_{i // 10}[Section {i // 10}]")
+        node, following = f"screen_{i}[Screen {i}]", f"screen_{i + 1}"
+        if i % 3 == 0:
+            lines.append(f"        {node} --> check_{i}{{Valid {i}?}}")
+            lines.append(f"        check_{i} -- Yes --> {following}")
+            lines.append(f"        check_{i} -- No --> screen_{i}")
+        elif i % 7 == 0:
+            lines.append(f"        {node} & screen_{i - 1} --> {following}(Screen {i + 1})")
+        else:
+            lines.append(f"        {node} --> {following}")
+    lines.append("    end")
+    return "\n".join(lines)
+
+
+def scaled_wireframes(screens):
+    return {
+        "screens": [
+            {
+                "label": f"Screen {i}",
+                "components": [
+                    {"type": "Text", "label": f"Screen {i} title"},
+                    {"type": "List", "label": "Entries"},
+                    {"type": "TextField", "label": "Search"},
+                    {"type": "Button", "label": "Save"},
+                ],
+            }
+            for i in range(screens)
+        ],
+        "edges": [{"from": i, "to": i + 1} for i in range(screens - 1)]
+        + [{"from": i, "to": 0} for i in range(5, screens, 5)],
+    }
+
+
+# Prompt fragment -> stage, checked in order
+STAGE_MARKERS = [
+    ("return a single JSON object", "combined"),
+    ("UI component identification", "wireframes"),
+    ("Mermaid.js", "mermaid"),
+    ("one part of a larger", "notes"),
+    ("extract and map the complete user flow", "user_flows"),
+    ("summarizing Product Requirements", "summary"),
+]
+
+
+def detect_stage(prompt):
+    for marker, stage in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return "summary"
+
+
+def contents_text(contents):
+    return "".join(
+        part.get("text", "") for content in contents for part in content.get("parts", [])
+    )
+
+
+def parse_latency(spec):
+    """Build a sampler (seconds) from ``fixed:MS``, ``uniform:MIN,MAX``,
+    ``lognormal:MEDIAN_MS,SIGMA`` or ``stall:MEDIAN_MS,SIGMA,SHARE,STALL_MS``
+    (lognormal, except that a SHARE of calls hang for STALL_MS)."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    if kind == "stall":
+        mu = math.log(values[0])
+        return lambda: (
+            values[3] if random.random() < values[2] else random.lognormvariate(mu, values[1])
+        ) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockGemini:
+    """Behaviour shared by all request handlers of one mock server."""
+
+    def __init__(
+        self,
+        latency="fixed:0",
+        error_rate=0.0,
+        burst_every=0,
+        burst_length=0,
+        retry_after=1,
+        responses_dir=None,
+        prefill_ms=0.0,
+        cache_min_tokens=1024,
+        scale_tokens=0,
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.responses_dir = responses_dir
+        self.prefill_ms = prefill_ms
+        self.cache_min_tokens = cache_min_tokens
+        self.scale_tokens = scale_tokens
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.statuses = {}
+        # cachedContents name -> (model, text, expiry)
+        self.cached_contents = {}
+
+    def prefill(self, tokens):
+        """Sleep for the time it would take to read ``tokens`` prompt tokens."""
+        time.sleep(tokens / 1000 * self.prefill_ms / 1000)
+
+    def create_cached_content(self, payload):
+        """Store a cachedContents upload; returns ``(status, body)``."""
+        model = payload.get("model", "").rpartition("/")[2]
+        text = contents_text(payload.get("contents", []))
+        tokens = len(text) // 4
+        if not model or tokens < self.cache_min_tokens:
+            message = (
+                f"Cached content is too small. total_token_count={tokens}, "
+                f"min_total_token_count={self.cache_min_tokens}"
+            )
+            return 400, {"error": {"code": 400, "message": message}}
+        ttl = float(payload.get("ttl", "3600s").rstrip("s"))
+        self.prefill(tokens)
+        with self.lock:
+            name = f"cachedContents/{len(self.cached_contents) + 1}"
+            self.cached_contents[name] = (model, text, time.monotonic() + ttl)
+        return 200, {
+            "name": name,
+            "model": f"models/{model}",
+            "usageMetadata": {"totalTokenCount": tokens},
+        }
+
+    def cached_text(self, name, model):
+        """Text of a live cachedContents entry for ``model``, else None."""
+        with self.lock:
+            entry = self.cached_contents.get(name)
+        if entry is None or entry[2] <= time.monotonic() or entry[0] != model:
+            return None
+        return entry[1]
+
+    def next_status(self):
+        with self.lock:
+            self.requests += 1
+            count = self.requests
+        if self.burst_every and count % self.burst_every < self.burst_length:
+            return 429
+        if random.random() < self.error_rate:
+            return 500
+        return 200
+
+    def record(self, status):
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def response_text(self, stage, prompt_tokens=0):
+        if self.scale_tokens and stage in ("notes", "mermaid", "wireframes"):
+            count = min(MAX_SCALED_SCREENS, max(3, prompt_tokens // self.scale_tokens))
+            if stage == "notes":
+                return scaled_notes(count)
+            if stage == "mermaid":
+                return f"```mermaid\n{scaled_mermaid(count)}\n```"
+            return f"```json\n{json.dumps(scaled_wireframes(count), indent=2)}\n```"
+        if self.responses_dir:
+            for name in (f"{stage}.txt", f"{stage}.json"):
+                path = os.path.join(self.responses_dir, name)
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        content = f.read()
+                    if name.endswith(".json"):
+                        return json.loads(content)["candidates"][0]["content"]["parts"][0]["text"]
+                    return content
+        return CANNED[stage]
+
+    def body(self, prompt, text, cached=""):
+        body = {
+            "candidates": [
+                {"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}
+            ],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": (len(prompt) + len(text)) // 4,
+            },
+        }
+        if cached:
+            body["usageMetadata"]["cachedContentTokenCount"] = len(cached) // 4
+        return body
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            mock.record(status)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.split("?")[0].endswith("/cachedContents"):
+                self.send_json(*mock.create_cached_content(payload))
+                return
+            match = re.search(r"/models/([^/:]+):(\w+)", self.path)
+            if not match:
+                self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+                return
+
+            time.sleep(mock.sample_latency())
+            status = mock.next_status()
+            if status == 429:
+                self.send_json(
+                    429,
+                    {"error": {"code": 429, "message": "Resource has been exhausted"}},
+                    {"Retry-After": str(mock.retry_after)},
+                )
+                return
+            if status != 200:
+                self.send_json(status, {"error": {"code": status, "message": "Internal error"}})
+                return
+
+            cached = ""
+            if "cachedContent" in payload:
+                cached = mock.cached_text(payload["cachedContent"], match.group(1))
+                if cached is None:
+                    message = "CachedContent not found (or permission denied)"
+                    self.send_json(403, {"error": {"code": 403, "message": message}})
+                    return
+            request_text = contents_text(payload.get("contents", []))
+            prompt = cached + request_text
+            text = mock.response_text(detect_stage(prompt), len(prompt) // 4)
+            mock.prefill(len(request_text) // 4)
+            if match.group(2) == "streamGenerateContent":
+                self.stream(prompt, text, cached)
+            else:
+                self.send_json(200, mock.body(prompt, text, cached))
+
+        def stream(self, prompt, text, cached=""):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            pieces = [text[i : i + 80] for i in range(0, len(text), 80)] or [""]
+            for piece in pieces:
+                event = json.dumps(mock.body(prompt, piece, cached))
+                self.wfile.write(f"data: {event}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.close_connection = True
+            mock.record(200)
+
+    return Handler
+
+
+def start_server(mock, host="127.0.0.1", port=0):
+    """Start the mock on a background thread; returns the server instance."""
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1beta"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:800,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=int, default=0, help="start a 429 burst every N requests")
+    parser.add_argument("--burst-length", type=int, default=0, help="requests per 429 burst")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--responses", help="directory of recorded <stage>.json/.txt responses")
+    parser.add_argument(
+        "--prefill-ms", type=float, default=0.0, help="delay per 1000 uncached prompt tokens"
+    )
+    parser.add_argument("--cache-min-tokens", type=int, default=1024)
+    parser.add_argument(
+        "--scale-tokens", type=int, default=0, help="scale responses: one screen per N prompt tokens"
+    )
+
+
+def from_arguments(args):
+    return MockGemini(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        retry_after=args.retry_after,
+        responses_dir=args.responses,
+        prefill_ms=args.prefill_ms,
+        cache_min_tokens=args.cache_min_tokens,
+        scale_tokens=args.scale_tokens,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(from_arguments(args), args.host, args.port)
+    print(f"Mock Gemini listening on {base_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Check what PRD normalization saves and that it keeps the content.
+
+For every fixture in benchmarks/fixtures/normalizer_expectations.json,
+normalizes the text as uploaded (line structure intact) and as the old
+frontend sent it (whitespace collapsed to single spaces), reports bytes
+and estimated tokens saved, and checks that every ``keep`` phrase
+survives, every ``drop`` phrase is gone from the line-structured variant
+and the token savings are within ``min_token_savings``/``max_token_savings``::
+
+    python benchmarks/normalizer_quality.py
+    python benchmarks/normalizer_quality.py --analyze --latency fixed:50
+    GEMINI_API_KEY=... python benchmarks/normalizer_quality.py --analyze --live
+
+``--analyze`` also runs every fixture through the pipeline with
+normalization off and on and compares Gemini request bytes, prompt tokens,
+valid outputs and how similar the summaries and wireframe screens are.
+Against the mock only the byte and token columns mean anything; use
+``--live`` to judge output quality. Exits non-zero when a check fails.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import mock_gemini  # noqa: E402
+from combined_benchmark import OUTPUTS, valid_outputs  # noqa: E402
+
+FIXTURES = os.path.join(HERE, "fixtures")
+
+
+def squash(text):
+    return " ".join(text.split())
+
+
+def check_fixture(normalize, name, expected):
+    """Normalize one fixture both ways; return (rows, failures)."""
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        text = f.read()
+
+    rows, failures = [], []
+    for variant, source in (("lines", text), ("collapsed", squash(text))):
+        normalized, report = normalize(source)
+        flat = squash(normalized)
+        saved = 1 - report["tokens_after"] / max(1, report["tokens_before"])
+        rows.append((name, variant, report, saved))
+
+        for phrase in expected.get("keep", []):
+            if squash(phrase) not in flat:
+                failures.append(f"{name} ({variant}): lost {phrase!r}")
+        if variant == "lines":
+            for phrase in expected.get("drop", []):
+                if squash(phrase) in flat:
+                    failures.append(f"{name} ({variant}): kept {phrase!r}")
+            if saved < expected.get("min_token_savings", 0):
+                failures.append(f"{name}: saved only {saved:.0%} of tokens")
+        if saved > expected.get("max_token_savings", 1):
+            failures.append(f"{name} ({variant}): removed {saved:.0%} of tokens")
+    return rows, failures
+
+
+def word_similarity(a, b):
+    a, b = set(re.findall(r"\w+", (a or "").lower())), set(re.findall(r"\w+", (b or "").lower()))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def screen_similarity(a, b):
+    def labels(wireframes):
+        screens = (wireframes or {}).get("screens", []) if isinstance(wireframes, dict) else []
+        return {squash(str(screen.get("label", ""))).lower() for screen in screens}
+
+    a, b = labels(a), labels(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def compare_analysis(service, metrics, text_normalizer, text):
+    """Analyze ``text`` without and with normalization."""
+    results = {}
+    for enabled in (False, True):
+        text_normalizer.ENABLED = enabled
+        before = (
+            metrics.GEMINI_REQUEST_BYTES.total(),
+            metrics.GEMINI_TOKENS.total(kind="prompt"),
+        )
+        response, _ = service.runAnalysis(text, OUTPUTS, "pipeline")
+        results[enabled] = {
+            "request_bytes": metrics.GEMINI_REQUEST_BYTES.total() - before[0],
+            "prompt_tokens": metrics.GEMINI_TOKENS.total(kind="prompt") - before[1],
+            "valid": sum(valid_outputs(response).values()),
+            "response": response,
+        }
+    text_normalizer.ENABLED = True
+    raw, normalized = results[False], results[True]
+    return {
+        "request_bytes": (raw["request_bytes"], normalized["request_bytes"]),
+        "prompt_tokens": (raw["prompt_tokens"], normalized["prompt_tokens"]),
+        "valid": (raw["valid"], normalized["valid"]),
+        "summary_similarity": word_similarity(
+            raw["response"].get("summarizedText"), normalized["response"].get("summarizedText")
+        ),
+        "screen_similarity": screen_similarity(
+            raw["response"].get("wireframes"), normalized["response"].get("wireframes")
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--expectations", default=os.path.join(FIXTURES, "normalizer_expectations.json")
+    )
+    parser.add_argument("--analyze", action="store_true", help="compare pipeline runs")
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API")
+    mock_gemini.add_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.expectations, encoding="utf-8") as f:
+        expectations = json.load(f)
+
+    from routes import text_normalizer
+
+    print(f"{'fixture':28} {'variant':10} {'bytes':>15} {'tokens':>13} {'saved':>6}  removed")
+    failures = []
+    for name, expected in expectations.items():
+        rows, fixture_failures = check_fixture(text_normalizer.normalize, name, expected)
+        failures.extend(fixture_failures)
+        for name, variant, report, saved in rows:
+            removed = " ".join(f"{k}={v}" for k, v in report["removed"].items() if v)
+            print(
+                f"{name:28} {variant:10} "
+                f"{report['bytes_before']:>7}>{report['bytes_after']:<7} "
+                f"{report['tokens_before']:>6}>{report['tokens_after']:<6} "
+                f"{saved:6.0%}  {removed}"
+            )
+
+    if args.analyze:
+        server = None
+        if not args.live:
+            server = mock_gemini.start_server(mock_gemini.from_arguments(args))
+            os.environ["GEMINI_API_BASE"] = mock_gemini.base_url(server)
+            os.environ.setdefault("GEMINI_API_KEY", "mock")
+        os.environ["PRD_CACHE_PATH"] = ""
+        os.environ["PRD_CACHE_MEMORY_ENTRIES"] = "0"
+
+        import app as service
+        from routes import metrics
+
+        print(
+            f"\n{'fixture':28} {'request KB':>15} {'prompt tok':>13} {'valid':>6} "
+            f"{'summary sim':>11} {'screen sim':>10}"
+        )
+        for name in expectations:
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                result = compare_analysis(service, metrics, text_normalizer, f.read())
+            raw_kb, normalized_kb = (b / 1024 for b in result["request_bytes"])
+            print(
+                f"{name:28} {raw_kb:7.1f}>{normalized_kb:<7.1f} "
+                f"{result['prompt_tokens'][0]:6.0f}>{result['prompt_tokens'][1]:<6.0f} "
+                f"{result['valid'][0]}>{result['valid'][1]:<4} "
+                f"{result['summary_similarity']:11.2f} {result['screen_similarity']:10.2f}"
+            )
+            if result["valid"][1] < result["valid"][0]:
+                failures.append(f"{name}: fewer valid outputs after normalization")
+
+        if server:
+            server.shutdown()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
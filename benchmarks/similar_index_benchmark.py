@@ -0,0 +1,147 @@
+"""Measure the near-duplicate PRD index at realistic sizes.
+
+Fills a fresh SimilarityIndex with ``--documents`` synthetic PRDs (random
+paragraphs over a shared product vocabulary), then looks up edited copies
+of some of them (``--edit-words`` words replaced), revised copies (a run of
+``--revision-words`` words rewritten) and unrelated documents. Reports
+insert throughput, lookup latency percentiles, how many edited copies found
+their original (recall), how many revised copies or unrelated documents
+matched anything (false matches) and the on-disk bytes per document.
+Pass ``--min-recall``/``--max-lookup-ms`` to exit non-zero on a regression.
+
+    python benchmarks/similar_index_benchmark.py --documents 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.similar_documents import SimilarityIndex, signature  # noqa: E402
+from routes.text_normalizer import WORD  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def vocabulary():
+    words = set()
+    for name in os.listdir(FIXTURES):
+        if name.endswith((".txt", ".md")):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                words.update(WORD.findall(f.read().lower()))
+    return sorted(words)
+
+
+def document(rng, words, length):
+    return " ".join(rng.choice(words) for _ in range(length))
+
+
+def edited(rng, text, count):
+    words = text.split()
+    for i in rng.sample(range(len(words)), min(count, len(words))):
+        words[i] = f"edit{rng.randrange(10**6)}"
+    return " ".join(words)
+
+
+def revised(rng, text, count):
+    words = text.split()
+    start = rng.randrange(max(1, len(words) - count))
+    for i in range(start, min(start + count, len(words))):
+        words[i] = f"revision{rng.randrange(10**6)}"
+    return " ".join(words)
+
+
+def percentile(values, q):
+    return sorted(values)[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=400, help="words per document")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--edit-words", type=int, default=2, help="words changed per copy")
+    parser.add_argument(
+        "--revision-words", type=int, default=40, help="words rewritten per revision"
+    )
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--max-changed-words", type=int, default=3)
+    parser.add_argument("--min-recall", type=float, default=0.0)
+    parser.add_argument("--max-lookup-ms", type=float, default=float("inf"))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary()
+    directory = tempfile.mkdtemp(prefix="similar-index-")
+    path = os.path.join(directory, "index.sqlite3")
+    index = SimilarityIndex(
+        path,
+        threshold=args.threshold,
+        max_entries=args.documents,
+        max_changed_words=args.max_changed_words,
+    )
+
+    originals = {}
+    signing, inserting, batch = 0.0, 0.0, []
+    for i in range(args.documents):
+        text = document(rng, words, args.words)
+        digest = f"{i:064x}"
+        if len(originals) < args.queries:
+            originals[digest] = text
+        start = time.perf_counter()
+        batch.append((digest, signature(text)))
+        signing += time.perf_counter() - start
+        if len(batch) == 1000 or i == args.documents - 1:
+            start = time.perf_counter()
+            index.add_many(batch)
+            inserting += time.perf_counter() - start
+            batch = []
+
+    latencies, found, revisions_matched, false_matches = [], 0, 0, 0
+    for digest, text in originals.items():
+        sig = signature(edited(rng, text, args.edit_words))
+        start = time.perf_counter()
+        match = index.find(sig)
+        latencies.append(time.perf_counter() - start)
+        found += bool(match and match[0] == digest)
+        revisions_matched += index.find(signature(revised(rng, text, args.revision_words))) is not None
+    for _ in range(args.queries):
+        sig = signature(document(rng, words, args.words))
+        start = time.perf_counter()
+        false_matches += index.find(sig) is not None
+        latencies.append(time.perf_counter() - start)
+
+    size = sum(
+        os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+    )
+    recall = found / len(originals)
+    p50, p99 = (percentile(latencies, q) * 1000 for q in (0.5, 0.99))
+    print(f"documents        {args.documents} x {args.words} words")
+    print(f"signature        {signing / args.documents * 1000:.3f} ms/document")
+    print(f"insert           {args.documents / inserting:,.0f} documents/s")
+    print(f"lookup           p50 {p50:.2f} ms  p99 {p99:.2f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:.2f} ms")
+    print(f"recall           {recall:.1%} of {len(originals)} copies with {args.edit_words} words edited")
+    print(f"false matches    {revisions_matched} of {len(originals)} copies with "
+          f"{args.revision_words} words revised, {false_matches} of {args.queries} unrelated documents")
+    print(f"on disk          {size / 1024 / 1024:.1f} MB ({size / args.documents:.0f} bytes/document)")
+
+    failures = []
+    if recall < args.min_recall:
+        failures.append(f"recall {recall:.1%} below {args.min_recall:.1%}")
+    if revisions_matched:
+        failures.append(f"{revisions_matched} revised copies matched their original")
+    if p99 > args.max_lookup_ms:
+        failures.append(f"p99 lookup {p99:.2f} ms above {args.max_lookup_ms} ms")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
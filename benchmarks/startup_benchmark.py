@@ -0,0 +1,87 @@
+"""Measure the cold-start cost of importing app.py.
+
+Runs ``import app`` in a fresh interpreter a few times and reports the
+wall-clock import time, the peak resident memory of the child process and
+the slowest top-level imports reported by ``-X importtime``. Pass
+``--max-seconds``/``--max-rss-mb`` to exit non-zero on a regression.
+
+    python benchmarks/startup_benchmark.py --runs 5 --max-rss-mb 150
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import resource, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(f"RESULT {elapsed:.6f} {rss_kb}")
+"""
+
+
+def run_once(with_importtime=False):
+    command = [sys.executable]
+    if with_importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", CHILD]
+    completed = subprocess.run(
+        command, cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    match = re.search(r"RESULT (\S+) (\d+)", completed.stdout)
+    return float(match.group(1)), int(match.group(2)) / 1024, completed.stderr
+
+
+def slowest_imports(importtime_log, limit):
+    """Top-level packages ordered by cumulative import time (microseconds)."""
+    totals = {}
+    for line in importtime_log.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(2)) == 1:
+            totals[match.group(3)] = int(match.group(1))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-seconds", type=float)
+    parser.add_argument("--max-rss-mb", type=float)
+    args = parser.parse_args()
+
+    timings, rss = [], []
+    for _ in range(args.runs):
+        seconds, rss_mb = run_once()
+        timings.append(seconds)
+        rss.append(rss_mb)
+
+    print(f"import app over {args.runs} runs")
+    print(f"  time  median {statistics.median(timings):.3f}s  max {max(timings):.3f}s")
+    print(f"  rss   median {statistics.median(rss):.1f}MB  max {max(rss):.1f}MB")
+
+    _, _, log = run_once(with_importtime=True)
+    print("slowest top-level imports:")
+    for module, micros in slowest_imports(log, args.top):
+        print(f"  {micros / 1000:8.1f}ms  {module}")
+
+    failures = []
+    if args.max_seconds is not None and statistics.median(timings) > args.max_seconds:
+        failures.append(f"median import time above {args.max_seconds}s")
+    if args.max_rss_mb is not None and max(rss) > args.max_rss_mb:
+        failures.append(f"peak RSS above {args.max_rss_mb}MB")
+    for failure in failures:
+        print("REGRESSION:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
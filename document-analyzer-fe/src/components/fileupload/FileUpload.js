@@ -2,7 +2,6 @@ import React, { useState, useRef, useEffect } from "react";
 import UploadIcon from "../../assets/ic_upload_icon.svg";
 import MermaidBgIcon from "../../assets/ic_mermaid_container_bg.png";
 import "./FileUpload.css";
-import axios from "axios";
 import * as pdfjsLib from "pdfjs-dist";
 import MermaidRenderer from "./MermaidRenderer";
 import mammoth from "mammoth";
@@ -14,6 +13,9 @@ import ReactFlowRenderer from "../wireframe/ReactFlowRenderer";
 // Set the pdf.js worker source
 pdfjsLib.GlobalWorkerOptions.workerSrc = `https://cdnjs.cloudflare.com/ajax/libs/pdf.js/2.10.377/pdf.worker.min.js`;
 
+// Response keys that hold a renderable output (the rest is metadata)
+const OUTPUT_KEYS = ["summarizedText", "Flowchart", "userFlow", "wireframes"];
+
 function FileUpload() {
   const [selectedFile, setSelectedFile] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -35,6 +37,7 @@ function FileUpload() {
   const [scrollTop, setScrollTop] = useState(0);
   const [showZoomControls, setZoomControls] = useState(true);
   const [showZoomIcons, setZoomIcons] = useState(true);
+  const selectedKeyRef = useRef("");
 
   useEffect(() => {
     setIsSummaryView(selectedKey === "summarizedText");
@@ -93,13 +96,18 @@ function FileUpload() {
 
   const extractTextFromPDF = async (pdfData) => {
     const pdf = await pdfjsLib.getDocument({ data: pdfData }).promise;
-    let text = "";
+    const pages = [];
     for (let pageNum = 1; pageNum <= pdf.numPages; pageNum++) {
       const page = await pdf.getPage(pageNum);
       const textContent = await page.getTextContent();
-      text += textContent.items.map((item) => item.str).join(" ");
+      pages.push(
+        textContent.items
+          .map((item) => item.str + (item.hasEOL ? "\n" : " "))
+          .join("")
+      );
     }
-    return text;
+    // Page breaks let the server drop running headers and page numbers
+    return pages.join("\f");
   };
 
   const extractTextFromTXT = (file) => {
@@ -133,35 +141,85 @@ function FileUpload() {
     return text
       .replace(/•|●|▪|◦|‣|★|☆/g, "")
       .replace(/[^\w\s.,!?]/g, "")
-      .replace(/\s+/g, " ")
+      // Keep line and page breaks; the server normalizes the rest
+      .replace(/[^\S\n\f]+/g, " ")
       .trim();
   };
 
+  // Show whatever outputs have arrived so far; the first one becomes the
+  // selected view and later events only fill in the rest.
+  const showResponse = (resData) => {
+    const outputKeys = OUTPUT_KEYS.filter((key) => resData[key]);
+    if (outputKeys.length === 0) return;
+
+    setSavedResponse(resData);
+    setAvailableKeys(outputKeys);
+    setSummaryText(resData.summarizedText || "");
+    if (!selectedKeyRef.current) {
+      selectedKeyRef.current = outputKeys[0];
+      setSelectedKey(outputKeys[0]);
+      setMermaidChart(resData[outputKeys[0]]);
+      setWireframeScreens(resData[outputKeys[0]]);
+      setLoading(false);
+    }
+    setIsResponseReceived(true);
+  };
+
+  const applyStreamEvent = (resData, event) => {
+    if (event.event === "summary_delta") {
+      return {
+        ...resData,
+        summarizedText: (resData.summarizedText || "") + event.text,
+      };
+    }
+    if (event.event === "result") {
+      return { ...resData, [event.key]: event.data };
+    }
+    if (event.event === "error") {
+      console.warn(`Failed to generate ${event.key}:`, event.message);
+    }
+    return resData;
+  };
+
   const analyzeText = async (text) => {
     console.log("Sending cleaned text to backend...", text);
     setLoading(true);
+    selectedKeyRef.current = "";
 
     try {
-      const response = await axios.post(
-        "http://127.0.0.1:8000/analyze",
-        { text },
-        {
-          headers: {
-            "Content-Type": "application/json",
-            Accept: "application/json",
-          },
-        }
-      );
+      const response = await fetch("http://127.0.0.1:8000/analyze/stream", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Accept: "application/x-ndjson",
+        },
+        body: JSON.stringify({ text }),
+      });
+      if (!response.ok) {
+        throw new Error(`Analysis failed with status ${response.status}`);
+      }
 
-      console.log("Response from backend:", response.data);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let resData = {};
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        lines
+          .filter((line) => line.trim())
+          .forEach((line) => {
+            resData = applyStreamEvent(resData, JSON.parse(line));
+          });
+        showResponse(resData);
+      }
 
-      const resData = response.data;
-      setSavedResponse(resData);
-      setAvailableKeys(Object.keys(resData));
-      setSelectedKey(Object.keys(resData)[0]);
-      setMermaidChart(Object.values(resData)[0]);
-      setWireframeScreens(Object.values(resData)[0]);
-      setIsResponseReceived(true);
+      console.log("Response from backend:", resData);
     } catch (error) {
       console.error("Error analyzing text:", error);
     } finally {
@@ -170,6 +228,7 @@ function FileUpload() {
   };
 
   const handleKeySelection = (newKey) => {
+    selectedKeyRef.current = newKey;
     setSelectedKey(newKey);
     setZoomControls(true);
     setZoomIcons(false)
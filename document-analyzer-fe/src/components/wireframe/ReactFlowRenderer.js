@@ -89,6 +89,16 @@ const getLayoutedElements = (nodes, edges) => {
   return { nodes, edges };
 };
 
+// Positions from the backend's layered layout (top-left corner per screen)
+const applyServerLayout = (nodes, edges, layout) => {
+  nodes.forEach((node, index) => {
+    const { x, y } = layout.nodes[index];
+    node.position = { x, y };
+  });
+
+  return { nodes, edges };
+};
+
 const FlowComponent = ({ wireframeData }) => {
   const [nodes, setNodes] = useState([]);
   const [edges, setEdges] = useState([]);
@@ -112,8 +122,11 @@ const FlowComponent = ({ wireframeData }) => {
         type: "custom",
       }));
 
-      // Apply Dagre layout
-      const layoutedElements = getLayoutedElements(nodesData, edgesData);
+      // Use the layout computed by the backend; fall back to Dagre
+      const layout = wireframeData.screens.layout;
+      const layoutedElements = layout
+        ? applyServerLayout(nodesData, edgesData, layout)
+        : getLayoutedElements(nodesData, edgesData);
       setNodes(layoutedElements.nodes);
       setEdges(layoutedElements.edges);
     }
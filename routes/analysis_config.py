@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+
+from routes.deadline import Deadline
+from routes.metrics import CACHE_LOOKUPS, REGISTRY, record_stage
+from routes.prd_summarizer import PRDSummarizer
+from routes.result_cache import ResultCache, cache_key, text_digest
+from routes.similar_documents import SimilarityIndex, signature
+from routes.stage_scheduler import add_stage_listener
+from routes.wireframe_generator import WireframeGenerator
+
+logger = logging.getLogger(__name__)
+
+# Settings shared by the Flask app (app.py) and the asyncio app (async_app.py)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+RESULT_CACHE = ResultCache(
+    path=os.getenv("PRD_CACHE_PATH", "cache/prd_results.sqlite3"),
+    memory_entries=int(os.getenv("PRD_CACHE_MEMORY_ENTRIES", "256")),
+    ttl=int(os.getenv("PRD_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_disk_entries=int(os.getenv("PRD_CACHE_MAX_ENTRIES", "10000")),
+    max_disk_bytes=int(os.getenv("PRD_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+
+add_stage_listener(record_stage)
+REGISTRY.gauge(
+    "prd_result_cache",
+    "Result cache counters and sizes (see /cache/stats).",
+    lambda: {
+        name: value
+        for name, value in RESULT_CACHE.stats().items()
+        if isinstance(value, (int, float))
+    },
+    ["field"],
+)
+
+# Near-identical PRDs (a few words apart) reuse the results of an earlier
+# one; off unless PRD_SIMILAR_INDEX_PATH is set
+SIMILAR_INDEX_PATH = os.getenv("PRD_SIMILAR_INDEX_PATH", "")
+SIMILAR_INDEX = (
+    SimilarityIndex(
+        SIMILAR_INDEX_PATH,
+        threshold=float(os.getenv("PRD_SIMILAR_THRESHOLD", "0.9")),
+        max_entries=int(os.getenv("PRD_SIMILAR_MAX_ENTRIES", "200000")),
+        max_changed_words=int(os.getenv("PRD_SIMILAR_MAX_CHANGED_WORDS", "3")),
+    )
+    if SIMILAR_INDEX_PATH
+    else None
+)
+
+# Requested output name -> (stage producing it, key in the JSON response)
+OUTPUTS = {
+    "summary": ("summary", "summarizedText"),
+    "flowchart": ("mermaid", "Flowchart"),
+    "user_flows": ("user_flows", "userFlow"),
+    "wireframes": ("wireframes", "wireframes"),
+}
+DEFAULT_OUTPUTS = ["summary", "flowchart", "wireframes"]
+
+# "pipeline" makes one Gemini call per stage; "combined" asks for every
+# output in a single structured-output call
+MODES = ("pipeline", "combined")
+DEFAULT_MODE = os.getenv("PRD_ANALYSIS_MODE", "pipeline")
+
+# Seconds a request may take when it sets no "deadline_seconds"; 0 means none
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("PRD_DEADLINE_SECONDS", "0"))
+# Share of the deadline the Gemini summary gets before the extractive
+# fallback is used, leaving the rest for the stages that need the summary
+SUMMARY_DEADLINE_SHARE = float(os.getenv("PRD_SUMMARY_DEADLINE_SHARE", "0.7"))
+
+# Which class's prompt/model produce each pipeline stage's cached result
+PIPELINE_OWNERS = {
+    "summary": PRDSummarizer,
+    "user_flows": PRDSummarizer,
+    "mermaid": PRDSummarizer,
+    "wireframes": WireframeGenerator,
+}
+
+
+def options_error(outputs, mode, deadline_seconds=None, reuse_similar=True):
+    """Return the error message for bad ``outputs``/``mode``/
+    ``deadline_seconds``/``reuse_similar``, or None."""
+    if not isinstance(outputs, list) or not all(isinstance(name, str) for name in outputs):
+        return "outputs must be a list of output names"
+    unknown = [name for name in outputs if name not in OUTPUTS]
+    if unknown:
+        return f"Unknown outputs: {', '.join(unknown)}"
+    if mode not in MODES:
+        return f"Unknown mode: {mode}"
+    if deadline_seconds is not None:
+        try:
+            if float(deadline_seconds) <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return "deadline_seconds must be a positive number"
+    if not isinstance(reuse_similar, bool):
+        return "reuse_similar must be true or false"
+    return None
+
+
+def form_flag(value, default=True):
+    """A boolean form field ("true"/"1" or "false"/"0"); anything else is
+    returned as is, for options_error to reject."""
+    if value is None or value == "":
+        return default
+    return {"true": True, "1": True, "false": False, "0": False}.get(value.lower(), value)
+
+
+def request_deadline(deadline_seconds=None):
+    """The Deadline for a request starting now, or None for no deadline."""
+    seconds = float(deadline_seconds or DEFAULT_DEADLINE_SECONDS)
+    return Deadline(seconds) if seconds > 0 else None
+
+
+def output_sources(sources, outputs, results):
+    """Map the response key of every produced output to where it came from:
+    "gemini", "cache", "similar" (a near-duplicate PRD's cached result) or
+    "extractive" (the local fallback summary)."""
+    return {
+        OUTPUTS[name][1]: sources.get(OUTPUTS[name][0])
+        for name in outputs
+        if OUTPUTS[name][0] in results
+    }
+
+
+def stage_cache_key(stage, owner, digest):
+    return cache_key(stage, digest, owner.PROMPT_VERSIONS[stage], owner.MODEL)
+
+
+class DocumentResults:
+    """Cached stage results of one PRD, falling back to a near-duplicate.
+
+    A stage missing from the cache under this document's own digest is
+    looked up under the digest of the most similar indexed PRD (see
+    SIMILAR_INDEX) and, if found there, copied to this document's key;
+    ``reuse_similar=False`` (a request's ``reuse_similar``) skips that.
+    Documents are indexed once one of their results is stored.
+    """
+
+    def __init__(self, text, reuse_similar=True):
+        self.text = text
+        self.reuse_similar = reuse_similar
+        self.digest = text_digest(text)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._similar = None
+        self._indexed = False
+
+    def _signature_once(self):
+        with self._lock:
+            if self._signature is None:
+                self._signature = signature(self.text) or ()
+            return self._signature or None
+
+    def similar(self):
+        """``(digest, similarity)`` of the closest earlier PRD, or None."""
+        if SIMILAR_INDEX is None or not self.reuse_similar:
+            return None
+        sig = self._signature_once()
+        with self._lock:
+            if self._similar is None:
+                self._similar = SIMILAR_INDEX.find(sig, exclude=self.digest) or ()
+            return self._similar or None
+
+    def get(self, stage, owner):
+        """Return ``(source, value)`` for a stage result, counting the
+        lookup; ``source`` is "cache", "similar" or None on a miss."""
+        hit, value = RESULT_CACHE.get(stage_cache_key(stage, owner, self.digest))
+        if hit:
+            CACHE_LOOKUPS.inc(stage=stage, result="hit")
+            return "cache", value
+        similar = self.similar()
+        if similar:
+            digest, score = similar
+            hit, value = RESULT_CACHE.get(stage_cache_key(stage, owner, digest))
+            if hit:
+                CACHE_LOOKUPS.inc(stage=stage, result="similar")
+                logger.info(
+                    "Reusing %s of PRD %s (similarity %.2f)", stage, digest[:12], score
+                )
+                RESULT_CACHE.set(stage_cache_key(stage, owner, self.digest), value)
+                return "similar", value
+        CACHE_LOOKUPS.inc(stage=stage, result="miss")
+        return None, None
+
+    def set(self, stage, owner, value):
+        RESULT_CACHE.set(stage_cache_key(stage, owner, self.digest), value)
+        if SIMILAR_INDEX is None:
+            return
+        with self._lock:
+            if self._indexed:
+                return
+            self._indexed = True
+        SIMILAR_INDEX.add(self.digest, self._signature_once())
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from routes.gemini_client import (
+    RETRY_STATUSES,
+    GeminiClientBase,
+    GeminiError,
+    GeminiResponse,
+    client_settings,
+)
+from routes.metrics import (
+    GEMINI_FIRST_TOKEN,
+    GEMINI_HEDGES,
+    GEMINI_LATENCY,
+    GEMINI_REQUEST_BYTES,
+    GEMINI_REQUESTS,
+    GEMINI_RESPONSE_BYTES,
+    GEMINI_RETRIES,
+)
+from routes.hedging import SendTimer
+from routes.rate_limiter import AdmissionTimeout
+
+
+class AsyncGeminiClient(GeminiClientBase):
+    """asyncio counterpart of GeminiClient built on ``httpx.AsyncClient``.
+
+    Waiting on Gemini only suspends a coroutine, so one event loop can keep
+    hundreds of calls in flight. Retries, metrics and admission control
+    behave as in the sync client; the admission controller is shared with
+    it for the same API key. Hedged calls cancel the losing request outright.
+    An instance is bound to the event loop it is first used on.
+    """
+
+    def __init__(self, api_key, pool_size=100, **settings):
+        super().__init__(api_key, **settings)
+        # Permit releases still running in worker threads
+        self._releases = set()
+        connect_timeout, read_timeout = self.timeout
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def generate(
+        self,
+        model,
+        prompt,
+        stage="unknown",
+        generation_config=None,
+        hedge=False,
+        document=None,
+    ):
+        """Call generateContent; ``stage`` labels the call in the metrics."""
+        url = self.model_url(model)
+        post = self.hedged_post if hedge and self.hedging is not None else self.post
+        handle = await self.cached_content(model, document)
+        try:
+            return await post(
+                url, self.payload(prompt, generation_config, document, handle), stage
+            )
+        except GeminiError as e:
+            if not self._cache_lost(handle, e, model, document):
+                raise
+        return await post(url, self.payload(prompt, generation_config, document), stage)
+
+    async def cached_content(self, model, document):
+        """Handle of the cached content holding ``document``, uploading it
+        if needed; None when it is to be sent inline."""
+        if self.context_cache is None or document is None:
+            return None
+        return await self.context_cache.handle_async(
+            model, document, lambda: self.create_cached_content(model, document)
+        )
+
+    async def create_cached_content(self, model, document):
+        """Upload ``document`` as cachedContents for ``model``; returns its name."""
+        url = f"{self.base_url}/cachedContents"
+        result = await self.post(
+            url, self.cached_content_payload(model, document), "context_cache"
+        )
+        return self._cached_content_name(result)
+
+    async def hedged_post(self, url, payload, stage="unknown"):
+        """``post``, racing a second identical request against a slow first
+        one; the first success is returned and the other is cancelled.
+
+        The delay runs from when the first request is actually sent, so a
+        call still queued for admission is never hedged.
+        """
+        policy = self.hedging
+        policy.started()
+
+        async def attempt(timer):
+            result = await self.post(url, payload, stage, on_sent=timer.sent)
+            if timer.sent_at is not None:
+                policy.observe(stage, timer.elapsed())
+            return result
+
+        # Set once the primary's request goes out, or it finished without one
+        primary_sent = asyncio.Event()
+        primary_timer = SendTimer(on_sent=primary_sent.set)
+        primary = asyncio.ensure_future(attempt(primary_timer))
+        primary.add_done_callback(lambda _: primary_sent.set())
+        pending, hedge, error = {primary}, None, None
+        try:
+            await primary_sent.wait()
+            finished, _ = await asyncio.wait(
+                pending, timeout=primary_timer.left(policy.delay(stage))
+            )
+            if not finished:
+                if policy.allow():
+                    GEMINI_HEDGES.inc(stage=stage, event="fired")
+                    hedge = asyncio.ensure_future(attempt(SendTimer()))
+                    pending.add(hedge)
+                else:
+                    GEMINI_HEDGES.inc(stage=stage, event="throttled")
+            while pending:
+                finished, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is hedge:
+                        GEMINI_HEDGES.inc(stage=stage, event="won")
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def post(self, url, payload, stage="unknown", on_sent=None):
+        replayed = self._replayed(url, payload, stage)
+        if replayed is not None:
+            result = GeminiResponse(200, replayed)
+            self._record_usage(result, stage)
+            return result
+        start = time.perf_counter()
+        response, permit = await self._send(url, payload, stage=stage, on_sent=on_sent)
+        GEMINI_RESPONSE_BYTES.inc(len(response.content), stage=stage)
+        result = GeminiResponse(response.status_code, self._decode(response))
+        self._release(permit, result)
+        self._record_usage(result, stage)
+        GEMINI_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        self._record(url, payload, result.body, stage)
+        return result
+
+    async def stream_generate(self, model, prompt, stage="unknown", document=None):
+        """Async-iterate GeminiResponse chunks of a streamGenerateContent call."""
+        start = time.perf_counter()
+        url = self.model_url(model, "streamGenerateContent")
+        handle = await self.cached_content(model, document)
+        payload = self.payload(prompt, None, document, handle)
+        replayed = self._replayed(url, payload, stage)
+        if replayed is not None:
+            for body in replayed:
+                yield GeminiResponse(200, body)
+            return
+        try:
+            response, permit = await self._send(
+                url, payload, params={"alt": "sse"}, stream=True, stage=stage
+            )
+        except GeminiError as e:
+            if not self._cache_lost(handle, e, model, document):
+                raise
+            payload = self.payload(prompt, None, document)
+            response, permit = await self._send(
+                url, payload, params={"alt": "sse"}, stream=True, stage=stage
+            )
+        chunk, bodies = None, []
+        try:
+            async for line in response.aiter_lines():
+                if line and line.startswith("data:"):
+                    GEMINI_RESPONSE_BYTES.inc(len(line), stage=stage)
+                    if chunk is None:
+                        GEMINI_FIRST_TOKEN.observe(time.perf_counter() - start, stage=stage)
+                    chunk = GeminiResponse(response.status_code, json.loads(line[5:]))
+                    bodies.append(chunk.body)
+                    yield chunk
+        except httpx.HTTPError as e:
+            raise GeminiError(f"Gemini stream interrupted: {e}") from e
+        finally:
+            await response.aclose()
+            self._release(permit, chunk)
+            GEMINI_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        # The last chunk carries the usage totals for the whole stream
+        if chunk is not None:
+            self._record_usage(chunk, stage)
+        self._record(url, payload, bodies, stage)
+
+    async def _send(
+        self, url, payload, params=None, stream=False, stage="unknown", on_sent=None
+    ):
+        """POST with retries; return the successful response and its permit.
+
+        ``on_sent`` is called as each attempt goes out, once admitted.
+        """
+        params = dict(params or {}, key=self.api_key)
+        data = json.dumps(payload).encode("utf-8")
+        tokens = self.estimate_tokens(payload)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            permit = await self._admit(tokens, stage)
+            connect_timeout, read_timeout = self._attempt_timeout(permit, stage)
+            if on_sent is not None:
+                on_sent()
+            GEMINI_REQUEST_BYTES.inc(len(data), stage=stage)
+            try:
+                request = self.http.build_request(
+                    "POST",
+                    url,
+                    params=params,
+                    content=data,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                )
+                response = await self.http.send(request, stream=stream)
+            except httpx.TransportError as e:
+                self._release(permit)
+                GEMINI_REQUESTS.inc(stage=stage, status="connection_error")
+                if last_attempt:
+                    raise GeminiError(f"Gemini request failed: {e}") from e
+                GEMINI_RETRIES.inc(stage=stage, reason=type(e).__name__)
+                await asyncio.sleep(self._pause(self._backoff(attempt)))
+                continue
+            except asyncio.CancelledError:
+                # A lost hedge or a disconnected client; free the slot
+                self._release(permit)
+                GEMINI_REQUESTS.inc(stage=stage, status="cancelled")
+                raise
+            except httpx.HTTPError as e:
+                self._release(permit)
+                GEMINI_REQUESTS.inc(stage=stage, status="request_error")
+                raise GeminiError(f"Gemini request failed: {e}") from e
+            except BaseException:
+                # Never keep an in-flight slot for a call that did not happen
+                self._release(permit)
+                raise
+
+            GEMINI_REQUESTS.inc(stage=stage, status=str(response.status_code))
+            if permit is not None:
+                permit.latency = time.monotonic() - permit.start
+            if response.status_code != 200:
+                self._release(permit, throttled=response.status_code == 429)
+                if stream:
+                    await response.aread()
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                GEMINI_RETRIES.inc(stage=stage, reason=str(response.status_code))
+                await response.aclose()
+                await asyncio.sleep(self._pause(self._retry_delay(response, attempt)))
+                continue
+
+            if response.status_code != 200:
+                raise self._error(
+                    response.status_code, self._decode(response), response.reason_phrase
+                )
+            return response, permit
+
+    def _release(self, permit, result=None, throttled=False):
+        """Hand a permit back from a worker thread: with SQLiteBuckets that
+        is file I/O under a cross-process lock, which must not stall the
+        event loop. Callers do not wait for it."""
+        if permit is None:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # A stream closed after its loop stopped
+            super()._release(permit, result, throttled)
+            return
+        release = asyncio.ensure_future(
+            asyncio.to_thread(super()._release, permit, result, throttled)
+        )
+        self._releases.add(release)
+        release.add_done_callback(self._releases.discard)
+
+    async def _admit(self, tokens, stage):
+        if self.admission is None:
+            return None
+        try:
+            return await self.admission.acquire_async(tokens, stage)
+        except AdmissionTimeout as e:
+            raise self._admission_error(e, stage) from e
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+
+
+def get_async_client(api_key):
+    """Return the process-wide async client for ``api_key``, configured from env.
+
+    GEMINI_ASYNC_POOL_SIZE sets its connection limit, which is usually much
+    larger than the sync pool.
+    """
+    with _async_clients_lock:
+        client = _async_clients.get(api_key)
+        if client is None:
+            settings = client_settings(api_key)
+            settings["pool_size"] = int(os.getenv("GEMINI_ASYNC_POOL_SIZE", "100"))
+            client = _async_clients[api_key] = AsyncGeminiClient(api_key, **settings)
+        return client
@@ -0,0 +1,157 @@
+import json
+import logging
+
+from routes.gemini_client import GeminiError, get_client
+from routes.metrics import log_payload
+
+logger = logging.getLogger(__name__)
+
+_COMPONENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING"},
+        "label": {"type": "STRING"},
+        "placeholder": {"type": "STRING"},
+        "src": {"type": "STRING"},
+        "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "tabs": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "progress": {"type": "NUMBER"},
+        "value": {"type": "NUMBER"},
+        "secure": {"type": "BOOLEAN"},
+    },
+    "required": ["type"],
+}
+
+# Gemini responseSchema (OpenAPI subset) for the combined analysis
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "user_flows": {"type": "STRING"},
+        "mermaid": {"type": "STRING"},
+        "wireframes": {
+            "type": "OBJECT",
+            "properties": {
+                "screens": {
+                    "type": "ARRAY",
+                    "items": {
+                        "type": "OBJECT",
+                        "properties": {
+                            "label": {"type": "STRING"},
+                            "components": {"type": "ARRAY", "items": _COMPONENT_SCHEMA},
+                        },
+                        "required": ["label", "components"],
+                    },
+                },
+                "edges": {
+                    "type": "ARRAY",
+                    "items": {
+                        "type": "OBJECT",
+                        "properties": {
+                            "from": {"type": "INTEGER"},
+                            "to": {"type": "INTEGER"},
+                        },
+                        "required": ["from", "to"],
+                    },
+                },
+            },
+            "required": ["screens", "edges"],
+        },
+    },
+    "required": ["summary", "user_flows", "mermaid", "wireframes"],
+}
+
+GENERATION_CONFIG = {
+    "responseMimeType": "application/json",
+    "responseSchema": RESPONSE_SCHEMA,
+}
+
+
+class CombinedAnalyzer:
+    """Produce every /analyze output from a single Gemini request.
+
+    The PRD is sent once and the model answers with one JSON object
+    constrained by RESPONSE_SCHEMA, instead of the separate summary, user
+    flow, flowchart and wireframe calls.
+    """
+
+    MODEL = "gemini-1.5-flash"
+    # Bump when the combined prompt or schema changes to invalidate cached results.
+    PROMPT_VERSIONS = {"combined": 1}
+
+    def __init__(self, api_key, prd_text, client=None):
+        self.prd_text = prd_text
+        self.api_key = api_key
+        self.client = client or get_client(api_key)
+
+    def analysis_prompt(self):
+        return f"""
+        You are an expert in product analysis, user experience design and Mermaid.js. Analyze the Product Requirement Document (PRD) below and return a single JSON object with these fields:
+
+        "summary": A concise, structured summary within 5000 characters with these sections: 🔹 **Overview:** product, purpose and target users; 🔹 **Key Features:** core functionalities as bullet points with checkmarks (✅); 🔹 **Core UI Components:** essential UI elements with pin icons (📌); 🔹 **System Architecture:** key technologies, databases and frameworks as bullets (🔹); 🔹 **Future Enhancements:** planned upgrades with rocket icons (🚀).
+
+        "user_flows": The complete user flow as a step-by-step list with entry points, actions, decision points, transitions, outcomes and alternative paths.
+
+        "mermaid": Valid, error-free Mermaid.js flowchart code (graph TD or graph LR) for that user flow, without markdown fences or comments. Represent decision points with ? and yes/no branches, use subgraphs for modular steps and capture loops, conditions and alternate paths.
+
+        "wireframes": The UI screens in user-flow order, each with a "label" and its "components" (text fields, buttons, modals, dropdowns, notifications, avatars, progress bars, switches, image and video views where relevant), plus "edges" between screens given as 0-based screen indexes in "from" and "to", covering primary and alternative paths.
+
+        PRD Text:
+        {self.prd_text}
+        """
+
+    def analyze(self):
+        try:
+            response = self.client.generate(
+                self.MODEL,
+                self.analysis_prompt(),
+                stage="combined",
+                generation_config=GENERATION_CONFIG,
+            )
+        except GeminiError as e:
+            raise Exception("Failed to get combined analysis.") from e
+        return self.read_result(response)
+
+    def read_result(self, response):
+        log_payload(logger, "Combined analysis response", response.body)
+        try:
+            result = json.loads(response.text)
+        except GeminiError as e:
+            raise Exception("Failed to get combined analysis.") from e
+        except ValueError as e:
+            raise Exception("Combined analysis returned invalid JSON.") from e
+
+        missing = [field for field in RESPONSE_SCHEMA["required"] if field not in result]
+        if missing:
+            raise Exception(f"Combined analysis is missing: {', '.join(missing)}")
+        return result
+
+    def process(self):
+        return self.analyze()
+
+
+class AsyncCombinedAnalyzer(CombinedAnalyzer):
+    """CombinedAnalyzer on an AsyncGeminiClient."""
+
+    def __init__(self, api_key, prd_text, client=None):
+        if client is None:
+            # httpx is only needed by the async app
+            from routes.async_gemini_client import get_async_client
+
+            client = get_async_client(api_key)
+        super().__init__(api_key, prd_text, client=client)
+
+    async def analyze(self):
+        try:
+            response = await self.client.generate(
+                self.MODEL,
+                self.analysis_prompt(),
+                stage="combined",
+                generation_config=GENERATION_CONFIG,
+            )
+        except GeminiError as e:
+            raise Exception("Failed to get combined analysis.") from e
+        return self.read_result(response)
+
+    async def process(self):
+        return await self.analyze()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from routes.tokens import estimate_tokens
+from routes.metrics import CONTEXT_CACHE
+from routes.result_cache import text_digest
+
+logger = logging.getLogger(__name__)
+
+# Heads the document turn of every document-first prompt, cached or not
+DOCUMENT_HEADER = "Product Requirement Document (PRD):\n\n"
+
+
+def document_content(document):
+    """The user turn carrying ``document`` ahead of a stage's instructions.
+
+    It is identical for every stage, so the same bytes can be uploaded once
+    as cached content and referred to by handle.
+    """
+    return {"role": "user", "parts": [{"text": DOCUMENT_HEADER + document}]}
+
+
+class ContextCache:
+    """Local record of the Gemini cached contents holding PRD documents.
+
+    A document is uploaded once per model (``cachedContents``) and later
+    calls about it send only their instructions and the handle. Each handle
+    is dropped ``margin`` seconds before its ``ttl`` runs out, or as soon as
+    Gemini no longer knows it; documents under ``min_tokens`` are not worth
+    caching, and a document whose upload failed is sent inline until the
+    ``ttl`` has passed. Concurrent stages wait for a single upload.
+    """
+
+    def __init__(self, ttl=600, min_tokens=4096, margin=30.0, max_entries=256):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.margin = margin
+        self.max_entries = max_entries
+        # (model, digest) -> (name, or None after a failed upload; expiry)
+        self._entries = OrderedDict()
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def key(self, model, document):
+        return model, text_digest(document)
+
+    def handle(self, model, document, create):
+        """Name of the cached content holding ``document`` for ``model``,
+        calling ``create()`` to upload it when there is none; None means
+        send the document inline."""
+        if estimate_tokens(document) < self.min_tokens:
+            return None
+        key = self.key(model, document)
+        with self._upload_lock(key, threading.Lock):
+            found, name = self._lookup(key)
+            if found:
+                return name
+            started = time.monotonic()
+            try:
+                name = create()
+            except Exception as e:
+                return self._failed(key, e)
+            return self._store(key, name, started)
+
+    async def handle_async(self, model, document, create):
+        """``handle`` for a coroutine function ``create``."""
+        if estimate_tokens(document) < self.min_tokens:
+            return None
+        key = self.key(model, document)
+        async with self._upload_lock(key, asyncio.Lock):
+            found, name = self._lookup(key)
+            if found:
+                return name
+            started = time.monotonic()
+            try:
+                name = await create()
+            except Exception as e:
+                return self._failed(key, e)
+            return self._store(key, name, started)
+
+    def invalidate(self, model, document):
+        """Forget the handle for ``document``, e.g. after Gemini lost it."""
+        key = self.key(model, document)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                CONTEXT_CACHE.inc(event="invalidated")
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            live = [name for name, expires in self._entries.values() if expires > now]
+        return {"handles": sum(1 for name in live if name), "rejected": live.count(None)}
+
+    def _upload_lock(self, key, factory):
+        with self._lock:
+            lock = self._uploads.get(key)
+            if lock is None:
+                lock = self._uploads[key] = factory()
+            return lock
+
+    def _lookup(self, key):
+        """``(found, name)`` for a live entry of ``key``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                CONTEXT_CACHE.inc(event="expired")
+                entry = None
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+        CONTEXT_CACHE.inc(event="hit" if entry[0] else "inline")
+        return True, entry[0]
+
+    def _store(self, key, name, started):
+        # The ttl runs from when Gemini received the upload, so count from
+        # before it was sent
+        self._put(key, name, started + self.ttl - self.margin)
+        CONTEXT_CACHE.inc(event="created")
+        return name
+
+    def _failed(self, key, error):
+        logger.warning("Could not cache PRD context, sending it inline: %s", error)
+        self._put(key, None, time.monotonic() + self.ttl)
+        CONTEXT_CACHE.inc(event="failed")
+        return None
+
+    def _put(self, key, name, expires):
+        with self._lock:
+            self._entries[key] = (name, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                # Gemini deletes the evicted content itself when its ttl ends
+                evicted, _ = self._entries.popitem(last=False)
+                self._uploads.pop(evicted, None)
+
+
+def create_context_cache():
+    """Build a ContextCache from the GEMINI_CONTEXT_CACHE_* settings, or
+    None when GEMINI_CONTEXT_CACHE is not enabled."""
+    if os.getenv("GEMINI_CONTEXT_CACHE", "0") != "1":
+        return None
+    return ContextCache(
+        ttl=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "600")),
+        min_tokens=int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096")),
+        max_entries=int(os.getenv("GEMINI_CONTEXT_CACHE_MAX_ENTRIES", "256")),
+    )
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_deadline = contextvars.ContextVar("analysis_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised for a stage that did not finish before the request deadline."""
+
+
+class Deadline:
+    """A point in time by which a request (or part of it) must answer."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def share(self, fraction):
+        """A deadline ``fraction`` of the way from now to this one."""
+        return Deadline(self.remaining() * fraction)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Run the block (and stages it schedules) under ``deadline``; Gemini
+    calls made inside give up once it has passed."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def _fall_back(name, deadline, fallback, error):
+    if fallback is None:
+        if error is not None:
+            raise error
+        raise DeadlineExceeded(
+            f"Stage '{name}' did not finish within {deadline.seconds:.1f}s."
+        )
+    logger.info("Stage '%s' fell back: %s", name, error or "deadline reached")
+    return fallback()
+
+
+def call_within(name, deadline, func, *args, fallback=None):
+    """Return ``func(*args)`` if it finishes before ``deadline``.
+
+    Otherwise, and also when it fails, return ``fallback()``, or raise
+    DeadlineExceeded when there is none. ``func`` runs on its own thread and
+    is left to finish in the background (its Gemini calls stop at the
+    request deadline), so a late result can still be cached.
+    """
+    future = Future()
+
+    def target():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(target,), daemon=True).start()
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FutureTimeout:
+        return _fall_back(name, deadline, fallback, None)
+    except Exception as e:
+        if fallback is None:
+            raise
+        return _fall_back(name, deadline, fallback, e)
+
+
+async def call_within_async(name, deadline, func, *args, fallback=None):
+    """``call_within`` for a coroutine function; ``fallback`` runs on a
+    worker thread so it does not block the event loop."""
+    task = asyncio.ensure_future(func(*args))
+    # A task left running after a fallback must not log an unretrieved error
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+    except asyncio.TimeoutError:
+        error = None
+    except Exception as e:
+        if fallback is None:
+            raise
+        error = e
+    if fallback is None:
+        return _fall_back(name, deadline, None, None)
+    return await asyncio.to_thread(_fall_back, name, deadline, fallback, error)
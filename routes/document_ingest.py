@@ -0,0 +1,162 @@
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+PDF_WORKERS = int(os.getenv("PRD_PDF_WORKERS", str(os.cpu_count() or 2)))
+# Pages extracted per worker task; smaller PDFs are extracted in-process
+PAGES_PER_TASK = int(os.getenv("PRD_PDF_PAGES_PER_TASK", "16"))
+# Lines this close to the top or bottom of a page may be headers/footers
+EDGE_LINES = 3
+# A candidate line repeated on at least this share of pages is dropped
+REPEATED_LINE_RATIO = 0.5
+
+CONTENT_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/plain": "txt",
+}
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+class UnsupportedDocument(Exception):
+    """Raised for uploads that are not PDF, DOCX or TXT."""
+
+
+class UnreadableDocument(Exception):
+    """Raised for a PDF or DOCX upload that is corrupt or truncated."""
+
+
+def detect_type(filename, content_type):
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension in ("pdf", "docx", "txt"):
+        return extension
+    raise UnsupportedDocument(
+        "Unsupported file format. Please upload a PDF, TXT, or DOCX file."
+    )
+
+
+def upload_file(total_content_length=None, content_type=None, filename=None, content_length=None):
+    """Stream factory for multipart file parts (see ``Request._get_file_stream``).
+
+    The part is written straight to a named temporary file, so it can be
+    extracted (and opened by the PDF workers) where it lies instead of
+    being copied again. The file is removed when the request closes it.
+    """
+    suffix = os.path.splitext(filename or "")[1]
+    return tempfile.NamedTemporaryFile("wb+", suffix=suffix)
+
+
+def _page_key(line):
+    """Normalize a line so "Page 3 of 80" and "Page 4 of 80" compare equal."""
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+
+def strip_repeated_lines(pages):
+    """Remove running headers and footers from a list of page texts.
+
+    Only lines near the top or bottom of a page are candidates, and they
+    are removed when (ignoring digits) they repeat on enough pages.
+    """
+    if len(pages) < 3:
+        return pages
+
+    counts = Counter()
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        edges = lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+        counts.update({_page_key(line) for line in edges})
+    repeated = {
+        key for key, count in counts.items() if count >= len(pages) * REPEATED_LINE_RATIO
+    }
+
+    cleaned = []
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        head = [line for line in lines[:EDGE_LINES] if _page_key(line) not in repeated]
+        tail_start = max(EDGE_LINES, len(lines) - EDGE_LINES)
+        body = lines[EDGE_LINES:tail_start]
+        tail = [line for line in lines[tail_start:] if _page_key(line) not in repeated]
+        cleaned.append("\n".join(head + body + tail))
+    return cleaned
+
+
+def _extract_pdf_range(path, start, stop):
+    """Worker task: extract the text of pages ``start``..``stop - 1``."""
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        texts = []
+        for page in pdf.pages[start:stop]:
+            texts.append(page.extract_text() or "")
+            # Drop the parsed page objects as we go to keep memory flat
+            page.flush_cache()
+        return texts
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pdf_pool
+
+
+def extract_pdf_pages(path):
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+
+    if page_count <= PAGES_PER_TASK or PDF_WORKERS <= 1:
+        return _extract_pdf_range(path, 0, page_count)
+
+    pool = _get_pdf_pool()
+    futures = [
+        pool.submit(_extract_pdf_range, path, start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def extract_docx(path):
+    import docx
+
+    document = docx.Document(path)
+    return "\n".join(paragraph.text for paragraph in document.paragraphs)
+
+
+def extract_txt(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def extract_text(path, kind):
+    """Extract clean text from a spooled PDF, DOCX or TXT file.
+
+    Raises UnreadableDocument when the parser rejects the file.
+    """
+    if kind == "txt":
+        return extract_txt(path).strip()
+    if kind not in ("pdf", "docx"):
+        raise UnsupportedDocument(f"Unsupported document type: {kind}")
+    try:
+        if kind == "pdf":
+            return "\n\n".join(strip_repeated_lines(extract_pdf_pages(path))).strip()
+        return extract_docx(path).strip()
+    except ImportError:
+        raise
+    except Exception as e:
+        # pdfplumber and python-docx raise a variety of parser errors
+        raise UnreadableDocument(
+            f"The {kind.upper()} file could not be read; it may be corrupt or truncated."
+        ) from e
@@ -0,0 +1,150 @@
+import re
+
+from routes.large_document import HEADING, SENTENCE_END
+
+# Length of the summary, matching the limit the Gemini summary prompt asks for
+SUMMARY_CHARS = 5000
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+# Sentences with fewer content words carry too little to rank
+MIN_CONTENT_WORDS = 3
+# Longer sentences (usually run-together bullets) are cut in the summary
+MAX_SENTENCE_CHARS = 400
+# A candidate this similar (cosine) to a chosen sentence is skipped
+REDUNDANCY = 0.6
+# Only this many of the best-ranked sentences are considered for the summary
+MAX_CANDIDATES = 400
+
+WORD = re.compile(r"[^\W\d_]{2,}")
+STOPWORDS = frozenset(
+    """
+    a about all also an and any are as at be been but by can could do does each
+    for from has have how if in into is it its may more must no not of on or
+    other our shall should so such than that the their them then there these
+    they this those to up use used using was we were what when where which
+    while who will with within would you your
+    """.split()
+)
+
+
+def _sentences(text):
+    """Split ``text`` into ``(heading, sentence)`` pairs in document order."""
+    heading, pairs = None, []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if HEADING.match(line) and len(line.split()) <= 8 and not line.endswith("."):
+            heading = line.lstrip("#").strip()
+            continue
+        for sentence in SENTENCE_END.split(line):
+            sentence = sentence.strip(" -*•\t")
+            if sentence:
+                pairs.append((heading, sentence))
+    return pairs
+
+
+def _shorten(sentence):
+    if len(sentence) <= MAX_SENTENCE_CHARS:
+        return sentence
+    return sentence[:MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+def _rank(np, rows, cols, values, n):
+    """TextRank scores of ``n`` sentences whose unit-length TF-IDF vectors
+    are the sparse matrix X given as ``(rows, cols, values)``.
+
+    The similarity graph X·Xᵀ is never built: each iteration multiplies by
+    Xᵀ and then X, so a step costs O(words) rather than O(sentences²).
+    """
+    terms = int(cols.max()) + 1
+
+    def similarity_times(y):
+        # (X·Xᵀ - I)·y; rows are unit length, so the diagonal is all ones
+        per_term = np.bincount(cols, weights=values * y[rows], minlength=terms)
+        product = np.bincount(rows, weights=values * per_term[cols], minlength=n) - y
+        return np.maximum(product, 0.0)
+
+    degree = similarity_times(np.ones(n))
+    degree[degree <= 0] = 1.0
+    scores = np.full(n, 1.0 / n)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * similarity_times(scores / degree)
+        converged = np.abs(updated - scores).sum() < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def summarize(text, max_chars=SUMMARY_CHARS):
+    """Extractive summary of a PRD: its most central sentences.
+
+    Ranks sentences with TextRank over TF-IDF vectors, then picks the best
+    ones that do not repeat each other until ``max_chars`` is reached, and
+    lists them in document order under their section headings. Runs
+    locally on the CPU in well under a second for a 200-page PRD, so it
+    serves as the fallback when Gemini cannot answer in time.
+    """
+    import numpy as np
+
+    pairs = _sentences(text)
+    vocabulary, rows, cols, kept = {}, [], [], []
+    for heading, sentence in pairs:
+        words = [w for w in WORD.findall(sentence.lower()) if w not in STOPWORDS]
+        if len(words) < MIN_CONTENT_WORDS:
+            continue
+        row = len(kept)
+        kept.append((heading, sentence))
+        rows.extend([row] * len(words))
+        cols.extend(vocabulary.setdefault(word, len(vocabulary)) for word in words)
+    if not kept:
+        return text[:max_chars].strip()
+
+    n, terms = len(kept), len(vocabulary)
+    # One entry per (sentence, term), sorted by sentence, with its count
+    keys, counts = np.unique(
+        np.array(rows, dtype=np.int64) * terms + np.array(cols, dtype=np.int64),
+        return_counts=True,
+    )
+    rows, cols = keys // terms, keys % terms
+    idf = np.log((1 + n) / (1 + np.bincount(cols, minlength=terms))) + 1
+    values = (1 + np.log(counts)) * idf[cols]
+    values /= np.sqrt(np.bincount(rows, weights=values**2, minlength=n))[rows]
+
+    scores = _rank(np, rows, cols, values, n)
+    starts = np.searchsorted(rows, np.arange(n + 1))
+
+    def vector(i):
+        span = slice(starts[i], starts[i + 1])
+        return dict(zip(cols[span].tolist(), values[span].tolist()))
+
+    chosen, vectors, headings, total = [], [], set(), 0
+    for i in np.argsort(-scores, kind="stable")[:MAX_CANDIDATES].tolist():
+        heading, sentence = kept[i]
+        # "- sentence" line, plus a "### heading" line for a new section
+        cost = len(_shorten(sentence)) + 3
+        if heading and heading not in headings:
+            cost += len(heading) + 6
+        if total + cost > max_chars:
+            continue
+        candidate = vector(i)
+        if any(
+            sum(weight * other.get(term, 0.0) for term, weight in candidate.items()) > REDUNDANCY
+            for other in vectors
+        ):
+            continue
+        chosen.append(i)
+        vectors.append(candidate)
+        headings.add(heading)
+        total += cost
+
+    lines, current = [], None
+    for i in sorted(chosen):
+        heading, sentence = kept[i]
+        if heading != current and heading:
+            lines.append(f"\n### {heading}")
+        current = heading
+        lines.append(f"- {_shorten(sentence)}")
+    return "\n".join(lines).strip()
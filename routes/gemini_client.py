@@ -0,0 +1,573 @@
+import contextvars
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from routes.context_cache import create_context_cache, document_content
+from routes.deadline import current_deadline
+from routes.hedging import SendTimer, create_hedge_policy
+from routes.metrics import (
+    GEMINI_FIRST_TOKEN,
+    GEMINI_HEDGES,
+    GEMINI_LATENCY,
+    GEMINI_REQUEST_BYTES,
+    GEMINI_REQUESTS,
+    GEMINI_RESPONSE_BYTES,
+    GEMINI_RETRIES,
+    GEMINI_TOKENS,
+)
+from routes.rate_limiter import AdmissionTimeout, create_controller
+from routes.replay import create_replay_store
+from routes.tokens import payload_tokens
+
+# Point at a local stand-in (see benchmarks/mock_gemini.py) to run offline
+GEMINI_API_BASE = os.getenv(
+    "GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta"
+)
+
+# Statuses worth retrying: quota exhaustion and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses of a call whose cached content has expired or been deleted
+CACHE_LOST_STATUSES = {403, 404}
+
+
+class GeminiError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GeminiResponse:
+    """A parsed generateContent response; the body is decoded exactly once."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    @property
+    def candidates(self):
+        return self.body.get("candidates", [])
+
+    @property
+    def text(self):
+        if not self.candidates:
+            raise GeminiError("No candidates found in response.", self.status_code)
+        parts = self.candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    @property
+    def usage(self):
+        return self.body.get("usageMetadata", {})
+
+
+class GeminiClientBase:
+    """Settings and transport-independent helpers shared by the sync
+    GeminiClient and the asyncio AsyncGeminiClient."""
+
+    def __init__(
+        self,
+        api_key,
+        connect_timeout=5.0,
+        read_timeout=120.0,
+        max_retries=3,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        base_url=None,
+        admission=None,
+        expected_output_tokens=1024,
+        hedging=None,
+        context_cache=None,
+        replay=None,
+    ):
+        self.api_key = api_key
+        self.base_url = (base_url or GEMINI_API_BASE).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.admission = admission
+        # Output tokens charged to the TPM bucket up front, corrected on completion
+        self.expected_output_tokens = expected_output_tokens
+        # HedgePolicy for calls made with hedge=True; None disables hedging
+        self.hedging = hedging
+        # ContextCache for calls made with a document; None sends it inline
+        self.context_cache = context_cache
+        # ReplayStore that records calls or answers them offline; None is off
+        self.replay = replay
+
+    def model_url(self, model, method="generateContent"):
+        return f"{self.base_url}/models/{model}:{method}"
+
+    def payload(self, prompt, generation_config=None, document=None, cached_content=None):
+        """Request body for ``prompt``, preceded by ``document`` when given:
+        by reference to its ``cached_content`` handle, or else inline."""
+        if document is None:
+            payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        else:
+            instructions = {"role": "user", "parts": [{"text": prompt}]}
+            if cached_content is None:
+                payload = {"contents": [document_content(document), instructions]}
+            else:
+                payload = {"cachedContent": cached_content, "contents": [instructions]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return payload
+
+    def cached_content_payload(self, model, document):
+        return {
+            "model": f"models/{model}",
+            "contents": [document_content(document)],
+            "ttl": f"{self.context_cache.ttl}s",
+        }
+
+    def _cached_content_name(self, result):
+        name = result.body.get("name")
+        if not name:
+            raise GeminiError("Gemini returned no cached content name.", result.status_code)
+        return name
+
+    def _cache_lost(self, handle, error, model, document):
+        """Whether a call failed because Gemini no longer has the cached
+        content ``handle``; forgets the handle so the call can go inline."""
+        if handle is None or error.status_code not in CACHE_LOST_STATUSES:
+            return False
+        self.context_cache.invalidate(model, document)
+        return True
+
+    def _replayed(self, url, payload, stage):
+        """The recorded response body for a call when replaying, else None;
+        raises GeminiError for a call that was never recorded."""
+        if self.replay is None or not self.replay.replaying:
+            return None
+        body = self.replay.load(self._endpoint(url), payload)
+        if body is None:
+            GEMINI_REQUESTS.inc(stage=stage, status="not_recorded")
+            raise GeminiError(f"No recorded Gemini response for this {stage} call.")
+        GEMINI_REQUESTS.inc(stage=stage, status="replayed")
+        return body
+
+    def _record(self, url, payload, body, stage):
+        if self.replay is not None and not self.replay.replaying:
+            self.replay.save(self._endpoint(url), payload, body, stage)
+
+    def _endpoint(self, url):
+        # Relative to the base URL, so recordings replay against any base
+        return url[len(self.base_url):]
+
+    def estimate_tokens(self, payload):
+        """Tokens to charge at admission for a request body."""
+        return payload_tokens(payload) + self.expected_output_tokens
+
+    def _cancelled(self, permit, cancelled, stage):
+        """Whether a hedged duplicate already answered; releases ``permit``."""
+        if cancelled is None or not cancelled():
+            return False
+        self._release(permit)
+        GEMINI_REQUESTS.inc(stage=stage, status="cancelled")
+        return True
+
+    def _attempt_timeout(self, permit, stage):
+        """``(connect, read)`` timeout for the next attempt, cut to the time
+        left before the request deadline; raises GeminiError once it has
+        passed (releasing ``permit``)."""
+        deadline = current_deadline()
+        if deadline is None:
+            return self.timeout
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            self._release(permit)
+            GEMINI_REQUESTS.inc(stage=stage, status="deadline_exceeded")
+            raise GeminiError("Request deadline passed before Gemini answered.", 504)
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    def _admission_error(self, error, stage):
+        """GeminiError for a call that was never admitted: a 504 when the
+        request deadline ran out, otherwise a 429."""
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            GEMINI_REQUESTS.inc(stage=stage, status="deadline_exceeded")
+            return GeminiError(str(error), 504)
+        GEMINI_REQUESTS.inc(stage=stage, status="admission_timeout")
+        return GeminiError(str(error), 429)
+
+    def _pause(self, delay):
+        """A retry delay, cut to the time left before the request deadline."""
+        deadline = current_deadline()
+        return delay if deadline is None else min(delay, deadline.remaining())
+
+    def _error(self, status_code, body, reason):
+        message = body.get("error", {}).get("message", reason)
+        return GeminiError(f"Gemini returned {status_code}: {message}", status_code)
+
+    def _release(self, permit, result=None, throttled=False):
+        """Hand a permit back, with the call's latency and real token usage
+        when it succeeded."""
+        if permit is None:
+            return
+        if result is None:
+            self.admission.release(permit, throttled=throttled)
+        else:
+            self.admission.release(
+                permit,
+                latency=permit.latency,
+                tokens=result.usage.get("totalTokenCount"),
+            )
+
+    def _record_usage(self, response, stage):
+        usage = response.usage
+        GEMINI_TOKENS.inc(usage.get("promptTokenCount", 0), stage=stage, kind="prompt")
+        GEMINI_TOKENS.inc(usage.get("candidatesTokenCount", 0), stage=stage, kind="output")
+        # Part of the prompt tokens, read from cached content
+        GEMINI_TOKENS.inc(usage.get("cachedContentTokenCount", 0), stage=stage, kind="cached")
+
+    def _decode(self, response):
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(self.backoff_max, max(0.0, delay))
+        return self._backoff(attempt)
+
+
+class GeminiClient(GeminiClientBase):
+    """Pooled HTTP client for the Gemini REST API.
+
+    One instance is meant to be shared by every caller in the process so
+    connections are kept alive across requests. Calls time out, and 429/5xx
+    responses and connection errors are retried with jittered exponential
+    backoff, honouring ``Retry-After`` when the server sends it. With an
+    ``admission`` controller, every attempt first waits for quota and a
+    concurrency slot. With a ``hedging`` policy, slow ``hedge=True`` calls
+    are duplicated and the first answer wins. With a ``context_cache``, the
+    ``document`` of a call is uploaded once and referred to by handle. With
+    a ``replay`` store, calls are recorded to disk or answered from it.
+    """
+
+    def __init__(self, api_key, pool_size=10, **settings):
+        super().__init__(api_key, **settings)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self._hedge_executor = None
+        self._hedge_workers = pool_size * 4
+
+    def generate(
+        self,
+        model,
+        prompt,
+        stage="unknown",
+        generation_config=None,
+        hedge=False,
+        document=None,
+    ):
+        """Call generateContent; ``stage`` labels the call in the metrics.
+
+        ``hedge=True`` lets the hedging policy (if any) send a duplicate
+        when the call is slow; only use it for idempotent prompts.
+        ``document`` is the text ``prompt`` is about; it goes first, as
+        cached content when the context cache has a handle for it.
+        """
+        url = self.model_url(model)
+        post = self.hedged_post if hedge and self.hedging is not None else self.post
+        handle = self.cached_content(model, document)
+        try:
+            return post(url, self.payload(prompt, generation_config, document, handle), stage)
+        except GeminiError as e:
+            if not self._cache_lost(handle, e, model, document):
+                raise
+        return post(url, self.payload(prompt, generation_config, document), stage)
+
+    def cached_content(self, model, document):
+        """Handle of the cached content holding ``document``, uploading it
+        if needed; None when it is to be sent inline."""
+        if self.context_cache is None or document is None:
+            return None
+        return self.context_cache.handle(
+            model, document, lambda: self.create_cached_content(model, document)
+        )
+
+    def create_cached_content(self, model, document):
+        """Upload ``document`` as cachedContents for ``model``; returns its name."""
+        url = f"{self.base_url}/cachedContents"
+        result = self.post(url, self.cached_content_payload(model, document), "context_cache")
+        return self._cached_content_name(result)
+
+    def hedged_post(self, url, payload, stage="unknown"):
+        """``post``, sending a second identical request if the first has not
+        answered within the policy's delay; the first success is returned.
+
+        The delay runs from when the first request is actually sent, so a
+        call still queued for admission is never hedged.
+
+        ``requests`` cannot abort a call already on the wire, so the losing
+        call is cancelled at its next admission or retry and otherwise
+        finishes in the background with its result dropped.
+        """
+        policy = self.hedging
+        policy.started()
+        answered = threading.Event()
+
+        def attempt(timer):
+            result = self.post(
+                url, payload, stage, cancelled=answered.is_set, on_sent=timer.sent
+            )
+            if timer.sent_at is not None:
+                policy.observe(stage, timer.elapsed())
+            return result
+
+        def submit(timer):
+            # Keep the caller's priority class and other context
+            return self._executor().submit(contextvars.copy_context().run, attempt, timer)
+
+        # Set once the primary's request goes out, or it finished without one
+        primary_sent = threading.Event()
+        primary_timer = SendTimer(on_sent=primary_sent.set)
+        primary = submit(primary_timer)
+        primary.add_done_callback(lambda _: primary_sent.set())
+        primary_sent.wait()
+        try:
+            return primary.result(timeout=primary_timer.left(policy.delay(stage)))
+        except FutureTimeout:
+            pass
+        if not policy.allow():
+            GEMINI_HEDGES.inc(stage=stage, event="throttled")
+            return primary.result()
+
+        GEMINI_HEDGES.inc(stage=stage, event="fired")
+        hedge = submit(SendTimer())
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    if future is hedge:
+                        GEMINI_HEDGES.inc(stage=stage, event="won")
+                    return future.result()
+            raise error
+        finally:
+            answered.set()
+            for future in pending:
+                future.cancel()
+
+    def _executor(self):
+        with _clients_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self._hedge_workers, thread_name_prefix="gemini-hedge"
+                )
+            return self._hedge_executor
+
+    def post(self, url, payload, stage="unknown", cancelled=None, on_sent=None):
+        replayed = self._replayed(url, payload, stage)
+        if replayed is not None:
+            result = GeminiResponse(200, replayed)
+            self._record_usage(result, stage)
+            return result
+        start = time.perf_counter()
+        response, permit = self._send(
+            url, payload, stage=stage, cancelled=cancelled, on_sent=on_sent
+        )
+        GEMINI_RESPONSE_BYTES.inc(len(response.content), stage=stage)
+        result = GeminiResponse(response.status_code, self._decode(response))
+        self._release(permit, result)
+        self._record_usage(result, stage)
+        GEMINI_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        self._record(url, payload, result.body, stage)
+        return result
+
+    def stream_generate(self, model, prompt, stage="unknown", document=None):
+        """Yield a GeminiResponse for each chunk of a streamGenerateContent call.
+
+        Retries only happen before the stream starts; a connection lost
+        mid-stream raises GeminiError. ``document`` is as for ``generate``.
+        """
+        start = time.perf_counter()
+        url = self.model_url(model, "streamGenerateContent")
+        handle = self.cached_content(model, document)
+        payload = self.payload(prompt, None, document, handle)
+        replayed = self._replayed(url, payload, stage)
+        if replayed is not None:
+            for body in replayed:
+                yield GeminiResponse(200, body)
+            return
+        try:
+            response, permit = self._send(
+                url, payload, params={"alt": "sse"}, stream=True, stage=stage
+            )
+        except GeminiError as e:
+            if not self._cache_lost(handle, e, model, document):
+                raise
+            payload = self.payload(prompt, None, document)
+            response, permit = self._send(
+                url, payload, params={"alt": "sse"}, stream=True, stage=stage
+            )
+        chunk, bodies = None, []
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    GEMINI_RESPONSE_BYTES.inc(len(line), stage=stage)
+                    if chunk is None:
+                        GEMINI_FIRST_TOKEN.observe(time.perf_counter() - start, stage=stage)
+                    chunk = GeminiResponse(response.status_code, json.loads(line[5:]))
+                    bodies.append(chunk.body)
+                    yield chunk
+        except requests.RequestException as e:
+            raise GeminiError(f"Gemini stream interrupted: {e}") from e
+        finally:
+            response.close()
+            self._release(permit, chunk)
+            GEMINI_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        # The last chunk carries the usage totals for the whole stream
+        if chunk is not None:
+            self._record_usage(chunk, stage)
+        self._record(url, payload, bodies, stage)
+
+    def _send(
+        self,
+        url,
+        payload,
+        params=None,
+        stream=False,
+        stage="unknown",
+        cancelled=None,
+        on_sent=None,
+    ):
+        """POST with retries; return the successful ``requests`` response and
+        its admission permit, which the caller releases once the body is read.
+
+        ``cancelled`` is checked before every attempt goes out and
+        ``on_sent`` is called as it does, once admitted.
+        """
+        params = dict(params or {}, key=self.api_key)
+        data = json.dumps(payload).encode("utf-8")
+        tokens = self.estimate_tokens(payload)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            permit = self._admit(tokens, stage)
+            if self._cancelled(permit, cancelled, stage):
+                raise GeminiError("Gemini call cancelled: a hedged duplicate answered first")
+            timeout = self._attempt_timeout(permit, stage)
+            if on_sent is not None:
+                on_sent()
+            GEMINI_REQUEST_BYTES.inc(len(data), stage=stage)
+            try:
+                response = self.session.post(
+                    url,
+                    params=params,
+                    data=data,
+                    timeout=timeout,
+                    stream=stream,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(permit)
+                GEMINI_REQUESTS.inc(stage=stage, status="connection_error")
+                if last_attempt:
+                    raise GeminiError(f"Gemini request failed: {e}") from e
+                GEMINI_RETRIES.inc(stage=stage, reason=type(e).__name__)
+                time.sleep(self._pause(self._backoff(attempt)))
+                continue
+            except requests.RequestException as e:
+                self._release(permit)
+                GEMINI_REQUESTS.inc(stage=stage, status="request_error")
+                raise GeminiError(f"Gemini request failed: {e}") from e
+            except BaseException:
+                # Never keep an in-flight slot for a call that did not happen
+                self._release(permit)
+                raise
+
+            GEMINI_REQUESTS.inc(stage=stage, status=str(response.status_code))
+            if permit is not None:
+                permit.latency = time.monotonic() - permit.start
+            if response.status_code != 200:
+                self._release(permit, throttled=response.status_code == 429)
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                GEMINI_RETRIES.inc(stage=stage, reason=str(response.status_code))
+                response.close()
+                time.sleep(self._pause(self._retry_delay(response, attempt)))
+                continue
+
+            if response.status_code != 200:
+                raise self._error(
+                    response.status_code, self._decode(response), response.reason
+                )
+            return response, permit
+
+    def _admit(self, tokens, stage):
+        if self.admission is None:
+            return None
+        try:
+            return self.admission.acquire(tokens, stage)
+        except AdmissionTimeout as e:
+            raise self._admission_error(e, stage) from e
+
+
+_clients = {}
+_admission = {}
+_clients_lock = threading.Lock()
+_admission_lock = threading.Lock()
+
+
+def get_admission(api_key):
+    """Return the admission controller shared by every client of ``api_key``,
+    sync or async."""
+    with _admission_lock:
+        controller = _admission.get(api_key)
+        if controller is None:
+            # Buckets are per key, since quotas are per API key/project
+            fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+            controller = _admission[api_key] = create_controller(prefix=f"{fingerprint}:")
+        return controller
+
+
+def client_settings(api_key):
+    """Client keyword arguments configured from the GEMINI_* environment."""
+    return {
+        "pool_size": int(os.getenv("GEMINI_POOL_SIZE", "10")),
+        "connect_timeout": float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("GEMINI_READ_TIMEOUT", "120")),
+        "max_retries": int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+        "admission": get_admission(api_key),
+        "expected_output_tokens": int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", "1024")),
+        "hedging": create_hedge_policy(),
+        "context_cache": create_context_cache(),
+        "replay": create_replay_store(),
+    }
+
+
+def get_client(api_key):
+    """Return the process-wide client for ``api_key``, configured from env."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = GeminiClient(api_key, **client_settings(api_key))
+        return client
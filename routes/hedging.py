@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class HedgePolicy:
+    """When to send a second copy of a slow Gemini call, and how often.
+
+    The hedge delay for a stage is the ``percentile`` of its recent call
+    latencies, clamped to ``[min_delay, max_delay]``, so only calls slower
+    than nearly all of their peers are duplicated; ``initial_delay`` is used
+    until ``min_samples`` calls have completed. Every call earns
+    ``max_ratio`` of a hedge credit (up to ``burst``) and every hedge spends
+    one, so hedges add at most about ``max_ratio`` extra calls to quota use.
+    """
+
+    def __init__(
+        self,
+        percentile=0.95,
+        min_delay=2.0,
+        max_delay=60.0,
+        initial_delay=20.0,
+        min_samples=20,
+        window=200,
+        max_ratio=0.05,
+        burst=5.0,
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self._latencies = {}
+        self._credits = 1.0
+        self._lock = threading.Lock()
+
+    def delay(self, stage):
+        """Seconds to wait for a ``stage`` call before hedging it."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(stage, ()))
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            delay = latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))]
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def observe(self, stage, seconds):
+        """Record the latency of a successful call (primary or hedge)."""
+        with self._lock:
+            latencies = self._latencies.get(stage)
+            if latencies is None:
+                latencies = self._latencies[stage] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def started(self):
+        """Count a hedgeable call towards the hedge budget."""
+        with self._lock:
+            self._credits = min(self.burst, self._credits + self.max_ratio)
+
+    def allow(self):
+        """Spend a hedge credit; False when the hedge budget is used up."""
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            return True
+
+
+class SendTimer:
+    """When the first request of one copy of a hedged call went out.
+
+    Admission control and the hedge executor can hold a call back before
+    it is sent; neither counts towards the hedge delay or the latency the
+    policy learns. ``on_sent`` is called once, when the request goes out.
+    """
+
+    def __init__(self, on_sent=None):
+        self.sent_at = None
+        self.on_sent = on_sent
+
+    def sent(self):
+        if self.sent_at is None:
+            self.sent_at = time.monotonic()
+            if self.on_sent is not None:
+                self.on_sent()
+
+    def elapsed(self):
+        """Seconds since the request went out, or None if it never did."""
+        return None if self.sent_at is None else time.monotonic() - self.sent_at
+
+    def left(self, delay):
+        """Seconds of ``delay`` still to wait; 0 if nothing was sent."""
+        elapsed = self.elapsed()
+        return 0.0 if elapsed is None else max(0.0, delay - elapsed)
+
+
+def create_hedge_policy():
+    """Build a HedgePolicy from the GEMINI_HEDGE_* settings, or None when
+    GEMINI_HEDGING is not enabled."""
+    if os.getenv("GEMINI_HEDGING", "0") != "1":
+        return None
+    return HedgePolicy(
+        percentile=float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95")),
+        min_delay=float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "2")),
+        max_delay=float(os.getenv("GEMINI_HEDGE_MAX_DELAY", "60")),
+        initial_delay=float(os.getenv("GEMINI_HEDGE_INITIAL_DELAY", "20")),
+        max_ratio=float(os.getenv("GEMINI_HEDGE_MAX_RATIO", "0.05")),
+    )
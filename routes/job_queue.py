@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        job = {"id": self.id, "status": self.status}
+        if self.result is not None:
+            job["result"] = self.result
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+
+class JobQueue:
+    """Run jobs on a fixed pool of worker threads behind a bounded queue.
+
+    ``handler(payload)`` returns the job result; an exception marks the job
+    failed. ``submit`` never blocks: once ``max_queued`` jobs are waiting it
+    raises ``QueueFull`` so callers can shed load immediately. Finished jobs
+    are kept for ``retention`` seconds.
+    """
+
+    def __init__(self, handler, workers=4, max_queued=32, retention=3600):
+        self.handler = handler
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        for index in range(workers):
+            threading.Thread(
+                target=self._work, name=f"job-worker-{index}", daemon=True
+            ).start()
+
+    def submit(self, payload):
+        self._prune()
+        job = Job(payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull("Job queue is full.")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            try:
+                job.result = self.handler(job.payload)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job.finished is not None and job.finished < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,155 @@
+import json
+import re
+
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class WireframeSchemaError(ValueError):
+    """Raised when parsed wireframe JSON does not match the screens/edges shape."""
+
+
+def find_json_object(text):
+    """Return the outermost ``{...}`` in model output, or None.
+
+    Scans once, tracking string literals so braces inside strings do not
+    count. If the text ends before the object closes (truncated output),
+    everything from the opening brace is returned for repair.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    quote = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : index + 1]
+    return text[start:]
+
+
+def _convert_single_quotes(text):
+    """Rewrite single-quoted strings as double-quoted JSON strings."""
+    out = []
+    quote = None
+    escaped = False
+    for char in text:
+        if quote:
+            if escaped:
+                # \' is not a valid JSON escape; keep the bare quote
+                out.append(char if char == "'" else "\\" + char)
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def _close_truncated(text):
+    """Close any string, array and object left open by truncated output."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    # A dangling key, colon or comma cannot be completed; drop it
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', "", text.rstrip())
+    return text + "".join(reversed(stack))
+
+
+def parse_json_object(text):
+    """Parse the outermost JSON object in ``text``, repairing it if needed.
+
+    Returns ``(value, repaired)``; ``repaired`` is True when the raw
+    candidate did not parse and one of the repairs was needed. Raises
+    ValueError when no repair works.
+    """
+    candidate = find_json_object(text)
+    if candidate is None:
+        raise ValueError("No JSON object found in response.")
+
+    try:
+        return json.loads(candidate), False
+    except ValueError:
+        pass
+
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate)
+    if "'" in repaired:
+        try:
+            return json.loads(repaired), True
+        except ValueError:
+            repaired = _convert_single_quotes(repaired)
+    for attempt in (repaired, _TRAILING_COMMA.sub(r"\1", _close_truncated(repaired))):
+        try:
+            return json.loads(attempt), True
+        except ValueError:
+            continue
+    raise ValueError("Could not repair JSON in response.")
+
+
+def validate_wireframes(wireframes):
+    """Check the screens/edges shape, including that edges index real screens."""
+    if not isinstance(wireframes, dict):
+        raise WireframeSchemaError("Wireframes must be a JSON object.")
+    screens = wireframes.get("screens")
+    if not isinstance(screens, list) or not screens:
+        raise WireframeSchemaError("Wireframes need a non-empty 'screens' list.")
+    for index, screen in enumerate(screens):
+        if not isinstance(screen, dict) or not isinstance(screen.get("components", []), list):
+            raise WireframeSchemaError(f"Screen {index} is not a valid screen object.")
+
+    edges = wireframes.setdefault("edges", [])
+    if not isinstance(edges, list):
+        raise WireframeSchemaError("'edges' must be a list.")
+    for edge in edges:
+        if not isinstance(edge, dict):
+            raise WireframeSchemaError("Each edge must be an object.")
+        for end in ("from", "to"):
+            value = edge.get(end)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise WireframeSchemaError(f"Edge {edge} has a non-integer '{end}'.")
+            if not 0 <= value < len(screens):
+                raise WireframeSchemaError(
+                    f"Edge {edge} points outside the {len(screens)} screens."
+                )
+    return wireframes
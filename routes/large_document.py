@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from routes.result_cache import cache_key, text_digest
+from routes.tokens import estimate_tokens
+
+# Documents estimated above this many tokens are processed chunk by chunk
+LARGE_DOC_TOKENS = int(os.getenv("PRD_LARGE_DOC_TOKENS", "30000"))
+# Token budget for a single chunk in the map step
+CHUNK_TOKENS = int(os.getenv("PRD_CHUNK_TOKENS", "8000"))
+CHUNK_WORKERS = int(os.getenv("PRD_CHUNK_WORKERS", "4"))
+# Upper bound on reduce rounds when condensed notes are still too large
+MAX_REDUCE_ROUNDS = 3
+# A chunk also ends after a section whose fingerprint is divisible by this,
+# so chunk boundaries depend on content rather than on position
+BOUNDARY_MODULUS = 4
+# Bump when FLOW_NOTES_PROMPT changes so cached per-section notes are dropped
+FLOW_NOTES_VERSION = 1
+
+HEADING = re.compile(
+    r"^\s*(#{1,6}\s+\S"  # markdown heading
+    r"|\d+(\.\d+)*\.?\s+[A-Z]"  # numbered heading: "2.", "3.1 Scope"
+    r"|[A-Z][A-Z0-9 &/\-]{3,}$)"  # ALL CAPS heading
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+FLOW_NOTES_PROMPT = """
+        You are an AI expert in product analysis. The text below is one part of a larger Product Requirement Document (PRD). Extract, as terse bullet points, everything needed to later draw the product's user flow and its UI screens:
+        - screens or pages and the UI components they contain
+        - user actions, transitions between screens and decision points
+        - alternative paths, error cases and dependencies
+
+        Keep the names used in the document. Leave out anything unrelated to user flows or UI. Return only the bullet points.
+
+        PRD Part:
+        {chunk}
+        """
+
+
+def is_large(text, threshold=None):
+    return estimate_tokens(text) > (threshold or LARGE_DOC_TOKENS)
+
+
+def split_sections(text):
+    """Split a PRD into sections at heading lines.
+
+    Text without line structure (the frontend collapses whitespace) falls
+    back to sentence boundaries.
+    """
+    lines = text.splitlines()
+    if len(lines) <= 1:
+        return [s for s in SENTENCE_END.split(text) if s.strip()]
+
+    sections, current = [], []
+    for line in lines:
+        if HEADING.match(line) and any(line.strip() for line in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(line.strip() for line in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _split_oversized(section, chunk_tokens):
+    """Break a section larger than the budget at sentence boundaries."""
+    if estimate_tokens(section) <= chunk_tokens:
+        return [section]
+    pieces, current, current_tokens = [], "", 0
+    for sentence in SENTENCE_END.split(section):
+        tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > chunk_tokens:
+            pieces.append(current)
+            current, current_tokens = "", 0
+        current = f"{current} {sentence}" if current else sentence
+        current_tokens += tokens
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def is_boundary(section):
+    return int(text_digest(section)[:8], 16) % BOUNDARY_MODULUS == 0
+
+
+def chunk_text(text, chunk_tokens=None):
+    """Pack consecutive sections into chunks of at most ``chunk_tokens``.
+
+    Besides the budget, a chunk also ends after any section whose
+    fingerprint marks it as a boundary (content-defined chunking). An edit
+    to one section can then only shift boundaries up to the next such
+    section; the chunks after it, and their cached results, stay the same
+    across revisions of the document.
+    """
+    chunk_tokens = chunk_tokens or CHUNK_TOKENS
+    chunks, current, current_tokens = [], [], 0
+    for section in split_sections(text):
+        for piece in _split_oversized(section, chunk_tokens):
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+            if current_tokens >= chunk_tokens // 4 and is_boundary(piece):
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def map_chunks(func, chunks, max_workers=None):
+    """Apply ``func`` to every chunk in parallel, preserving chunk order."""
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=max_workers or CHUNK_WORKERS) as executor:
+        return list(executor.map(lambda chunk: context.copy().run(func, chunk), chunks))
+
+
+def cached(extract, cache, stage, version, model):
+    """Wrap a map function so each chunk's result is cached by its content.
+
+    When a revised PRD comes in, only chunks whose text changed miss the
+    cache; the reduce step is then rebuilt from the cached pieces.
+    """
+    if cache is None:
+        return extract
+
+    def run(chunk):
+        key = cache_key(stage, text_digest(chunk), version, model)
+        return cache.get_or_compute(key, lambda: extract(chunk))
+
+    return run
+
+
+def condense(text, extract, chunk_tokens=None, threshold=None):
+    """Map ``extract`` over the chunks of ``text`` and join the results.
+
+    Repeats on the joined notes while they are still above the large
+    document threshold, so the reduce prompt always gets a bounded input.
+    """
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if not is_large(text, threshold):
+            break
+        notes = map_chunks(extract, chunk_text(text, chunk_tokens))
+        text = "\n\n".join(note.strip() for note in notes if note.strip())
+    return text
+
+
+def flow_notes(client, model, text, cache=None):
+    """Condense a large PRD into the flow/UI notes the diagram prompts need.
+
+    The notes are shared by the flowchart and wireframe stages, which run
+    at the same time; with a cache each chunk is only extracted once for
+    both, as concurrent misses of one key share a single computation.
+    """
+
+    def extract(chunk):
+        return client.generate(
+            model, FLOW_NOTES_PROMPT.format(chunk=chunk), stage="flow_notes", hedge=True
+        ).text
+
+    return condense(text, cached(extract, cache, "flow_notes", FLOW_NOTES_VERSION, model))
+
+
+async def map_chunks_async(func, chunks, max_workers=None):
+    """``map_chunks`` for a coroutine function, at most ``max_workers`` at once."""
+    semaphore = asyncio.Semaphore(max_workers or CHUNK_WORKERS)
+
+    async def run(chunk):
+        async with semaphore:
+            return await func(chunk)
+
+    return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+
+def cached_async(extract, cache, stage, version, model):
+    """``cached`` for a coroutine map function; the cache's SQLite reads
+    and writes run on worker threads, off the event loop."""
+    if cache is None:
+        return extract
+
+    async def run(chunk):
+        key = cache_key(stage, text_digest(chunk), version, model)
+        return await cache.get_or_compute_async(key, lambda: extract(chunk))
+
+    return run
+
+
+async def condense_async(text, extract, chunk_tokens=None, threshold=None):
+    """``condense`` for a coroutine map function."""
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if not is_large(text, threshold):
+            break
+        notes = await map_chunks_async(extract, chunk_text(text, chunk_tokens))
+        text = "\n\n".join(note.strip() for note in notes if note.strip())
+    return text
+
+
+async def flow_notes_async(client, model, text, cache=None):
+    """``flow_notes`` with an AsyncGeminiClient."""
+
+    async def extract(chunk):
+        response = await client.generate(
+            model, FLOW_NOTES_PROMPT.format(chunk=chunk), stage="flow_notes", hedge=True
+        )
+        return response.text
+
+    return await condense_async(
+        text, cached_async(extract, cache, "flow_notes", FLOW_NOTES_VERSION, model)
+    )
@@ -0,0 +1,472 @@
+import os
+import re
+
+# Flowcharts with more nodes than this get their largest subgraphs collapsed
+# into single nodes; 0 disables collapsing.
+NODE_BUDGET = int(os.getenv("PRD_MERMAID_NODE_BUDGET", "60"))
+
+HEADER = re.compile(r"^(graph|flowchart)(?:\s+(TB|TD|BT|RL|LR))?\s*;?\s*$", re.IGNORECASE)
+FENCE = re.compile(r"```[ \t]*(?:mermaid)?[ \t]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+# "login-page" is one id; the "-" of a link never starts a word
+NODE_ID = re.compile(r"\w+(?:-\w+)*")
+CLASS_SUFFIX = re.compile(r":::([\w-]+)")
+# "A e1@--> B": an id naming the link that follows
+EDGE_ID = re.compile(r"\s*(\w+)@(?=[-=<.])")
+# "e1@{ animate: true }": settings for a node or a named link
+METADATA = re.compile(r"^(\w+(?:-\w+)*)@\{(.*)\}$")
+# "-- text -->", "-. text .->", "== text ==>"
+TEXT_LINK = re.compile(
+    r"\s*(<?)(--|==|-\.)\s+(?![->=.])(.+?)\s*(--+[>ox]?|==+[>ox]?|\.-+[>ox]?)(?=\s|$|[\w\"])"
+)
+# "-->", "---", "-.->", "==>", "<-->", "--o", optionally followed by |text|
+LINK = re.compile(
+    r"\s*(<?)(-{2,}|={2,}|-\.+-)(>|[ox](?=\s))?\s*(?:\|([^|]*)\|)?"
+)
+PLAIN_LABEL = re.compile(r"^\w[\w ?!.,']*$")
+# Styling and interaction statements, kept as written with their ids renamed
+DIRECTIVES = ("classDef", "class", "style", "linkStyle", "click")
+
+# Opening bracket -> closing bracket, longest openers first
+SHAPES = [
+    ("(((", ")))"),
+    ("((", "))"),
+    ("([", "])"),
+    ("[[", "]]"),
+    ("[(", ")]"),
+    ("{{", "}}"),
+    ("[/", "/]"),
+    ("[\\", "\\]"),
+    ("(", ")"),
+    ("[", "]"),
+    ("{", "}"),
+    (">", "]"),
+]
+
+
+class MermaidSyntaxError(ValueError):
+    """Raised when flowchart text cannot be parsed; the message names the line."""
+
+
+def extract_mermaid(text):
+    """Return the flowchart source from model output, fenced or bare."""
+    match = FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+class MermaidGraph:
+    """A parsed flowchart: nodes, edges and (possibly nested) subgraphs.
+
+    Node ids are kept as written while parsing; ``to_mermaid`` renames them
+    to short sequential ids in the order they are written out, so the same
+    graph always renders to the same text. Styling, click and metadata
+    statements are carried along and point at the renamed nodes and links;
+    those whose nodes or links were collapsed away are dropped.
+    """
+
+    def __init__(self, keyword="graph", direction="TD"):
+        self.keyword = keyword
+        self.direction = direction
+        # id -> {"label", "shape", "subgraph"}; dicts keep declaration order
+        self.nodes = {}
+        # (source, target, arrow, label, (index as written, link id or None))
+        self.edges = []
+        # id -> {"title", "parent", "direction"}
+        self.subgraphs = {}
+        # (keyword, ids or link indexes or None, rest of the statement)
+        self.directives = []
+        # Merged-away node id -> node it was merged into; same for link indexes
+        self.aliases = {}
+        self.edge_aliases = {}
+
+    def add_node(self, node_id, label=None, shape=None, subgraph=None):
+        node = self.nodes.get(node_id)
+        if node is None:
+            self.nodes[node_id] = {
+                "label": label if label is not None else node_id,
+                "shape": shape or ("[", "]"),
+                "subgraph": subgraph,
+            }
+        elif label is not None:
+            # A later definition gives the label to a node first seen bare
+            node["label"], node["shape"] = label, shape
+        return node_id
+
+    def add_edge(self, source, target, arrow="-->", label=None, edge_id=None):
+        self.edges.append((source, target, arrow, label or None, (len(self.edges), edge_id)))
+
+    def dedupe(self):
+        """Merge same-label nodes within a subgraph and drop repeated edges."""
+        seen, merged = {}, {}
+        for node_id, node in list(self.nodes.items()):
+            key = (node["subgraph"], node["shape"], " ".join(node["label"].lower().split()))
+            if key in seen:
+                merged[node_id] = self.aliases[node_id] = seen[key]
+                del self.nodes[node_id]
+            else:
+                seen[key] = node_id
+        self._rewire(merged)
+
+    def collapse(self, budget):
+        """Collapse the largest subgraphs into single nodes until at most
+        ``budget`` nodes remain or there is nothing left to collapse."""
+        while budget and len(self.nodes) > budget and self.subgraphs:
+            members = {sub: self._members(sub) for sub in self.subgraphs}
+            sub = max(self.subgraphs, key=lambda s: (len(members[s]), -self._depth(s)))
+            nested = [s for s in self.subgraphs if self._within(s, sub)]
+            linked = {end for edge in self.edges for end in edge[:2]}
+            if not members[sub] and linked.isdisjoint(nested):
+                self._drop_subgraph(sub)
+                continue
+
+            parent = self.subgraphs[sub]["parent"]
+            collapsed = f"{sub}__collapsed"
+            self.nodes[collapsed] = {
+                "label": self.subgraphs[sub]["title"],
+                "shape": ("[[", "]]"),
+                "subgraph": parent,
+            }
+            for node_id in members[sub]:
+                del self.nodes[node_id]
+            self._drop_subgraph(sub)
+            # Edges to the subgraph itself now end at the collapsed node too
+            self._rewire(dict.fromkeys(members[sub] + nested, collapsed), collapsed)
+
+    def _rewire(self, mapping, collapsed=None):
+        edges, seen = [], {}
+        for source, target, arrow, label, ref in self.edges:
+            source, target = mapping.get(source, source), mapping.get(target, target)
+            if collapsed in (source, target):
+                if source == target:
+                    continue
+                # Labels of edges into a collapsed group no longer say much
+                label = None
+            key = (source, target, arrow, label)
+            if key in seen:
+                self.edge_aliases[ref[0]] = seen[key]
+            else:
+                seen[key] = ref[0]
+                edges.append(key + (ref,))
+        self.edges = edges
+
+    def _members(self, sub):
+        nested = {s for s in self.subgraphs if self._within(s, sub)}
+        return [n for n, node in self.nodes.items() if node["subgraph"] in nested]
+
+    def _within(self, sub, ancestor):
+        while sub is not None:
+            if sub == ancestor:
+                return True
+            sub = self.subgraphs[sub]["parent"]
+        return False
+
+    def _depth(self, sub):
+        depth = 0
+        while self.subgraphs[sub]["parent"] is not None:
+            sub = self.subgraphs[sub]["parent"]
+            depth += 1
+        return depth
+
+    def _drop_subgraph(self, sub):
+        for nested in [s for s in self.subgraphs if self._within(s, sub)]:
+            del self.subgraphs[nested]
+
+    def to_mermaid(self):
+        """Render canonical flowchart text with short, normalized ids."""
+        blocks = []
+
+        def walk(parent, depth):
+            for node_id, node in self.nodes.items():
+                if node["subgraph"] == parent:
+                    blocks.append(("node", node_id, depth))
+            for sub, info in self.subgraphs.items():
+                if info["parent"] == parent:
+                    blocks.append(("subgraph", sub, depth))
+                    if info.get("direction"):
+                        blocks.append(("direction", sub, depth + 1))
+                    walk(sub, depth + 1)
+                    blocks.append(("end", sub, depth))
+
+        walk(None, 1)
+        # Number nodes in the order they are written so output round-trips
+        ids = {key: f"n{i}" for i, key in enumerate((k for t, k, _ in blocks if t == "node"), 1)}
+        sub_ids = {key: f"s{i}" for i, key in enumerate((k for t, k, _ in blocks if t == "subgraph"), 1)}
+        # Edge endpoints are nodes or subgraphs, sorted by where they are written
+        refs = {**ids, **sub_ids}
+        order = {key: i for i, (kind, key, _) in enumerate(blocks) if kind in ("node", "subgraph")}
+
+        lines = [f"{self.keyword} {self.direction}"]
+        for kind, key, depth in blocks:
+            indent = "    " * depth
+            if kind == "node":
+                opener, closer = self.nodes[key]["shape"]
+                lines.append(f"{indent}{ids[key]}{opener}{_quote(self.nodes[key]['label'])}{closer}")
+            elif kind == "subgraph":
+                lines.append(f"{indent}subgraph {sub_ids[key]}[{_quote(self.subgraphs[key]['title'])}]")
+            elif kind == "direction":
+                lines.append(f"{indent}direction {self.subgraphs[key]['direction']}")
+            else:
+                lines.append(f"{indent}end")
+        edges = sorted(self.edges, key=lambda edge: (order[edge[0]], order[edge[1]]))
+        for source, target, arrow, label, (_, edge_id) in edges:
+            link = f"{arrow}|{_quote(label)}|" if label else arrow
+            name = f"{edge_id}@" if edge_id else ""
+            lines.append(f"    {refs[source]} {name}{link} {refs[target]}")
+        positions = {edge[4][0]: position for position, edge in enumerate(edges)}
+        edge_ids = {edge[4][1] for edge in edges} - {None}
+        for directive in self.directives:
+            line = self._render_directive(directive, refs, positions, edge_ids)
+            if line:
+                lines.append(f"    {line}")
+        return "\n".join(lines)
+
+    def _render_directive(self, directive, refs, positions, edge_ids):
+        """One styling/click/metadata line in terms of the rendered ids, or
+        None when nothing it points at is left."""
+        keyword, targets, rest = directive
+        if keyword == "classDef" or (keyword == "linkStyle" and targets is None):
+            return f"{keyword} {rest}"
+        if keyword == "linkStyle":
+            indexes = [self._resolve(self.edge_aliases, index) for index in targets]
+            found = sorted({positions[index] for index in indexes if index in positions})
+            return f"linkStyle {','.join(map(str, found))} {rest}" if found else None
+        if keyword == "metadata":
+            (target,) = targets
+            if target in edge_ids:
+                return f"{target}@{{{rest}}}"
+            target = refs.get(self._resolve(self.aliases, target))
+            return f"{target}@{{{rest}}}" if target else None
+        found = []
+        for target in targets:
+            target = refs.get(self._resolve(self.aliases, target))
+            if target and target not in found:
+                found.append(target)
+        if not found:
+            return None
+        return f"{keyword} {','.join(found)} {rest}".rstrip()
+
+    @staticmethod
+    def _resolve(aliases, key):
+        while key in aliases:
+            key = aliases[key]
+        return key
+
+
+def _quote(text):
+    """Quote a label only when it holds characters Mermaid would misread."""
+    if PLAIN_LABEL.match(text) and text.lower() != "end":
+        return text
+    return '"' + text.replace('"', "#quot;") + '"'
+
+
+def _split_statements(line):
+    """Split a line on ``;`` outside of brackets and quotes."""
+    statements, depth, quoted, start = [], 0, False, 0
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth = max(depth - 1, 0)
+        elif char == ";" and depth == 0:
+            statements.append(line[start:index])
+            start = index + 1
+    statements.append(line[start:])
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _read_node(text, pos, line_no):
+    """Parse ``id`` plus an optional shape and ``:::class`` at ``pos``;
+    return (id, label, shape, class, end)."""
+    match = NODE_ID.match(text, pos)
+    if not match:
+        raise MermaidSyntaxError(f"line {line_no}: expected a node id at '{text[pos:]}'")
+    node_id, pos = match.group(0), match.end()
+
+    for opener, closer in SHAPES:
+        if not text.startswith(opener, pos):
+            continue
+        start = pos + len(opener)
+        if text.startswith('"', start):
+            end_quote = text.find('"', start + 1)
+            if end_quote == -1 or not text.startswith(closer, end_quote + 1):
+                raise MermaidSyntaxError(f"line {line_no}: unclosed label for node '{node_id}'")
+            label, end = text[start + 1 : end_quote], end_quote + 1 + len(closer)
+        else:
+            end = _find_closer(text, start, opener[-1], closer)
+            if end == -1:
+                raise MermaidSyntaxError(f"line {line_no}: unclosed '{opener}' for node '{node_id}'")
+            label, end = text[start:end], end + len(closer)
+        label = label.strip() or node_id
+        return (node_id, label, (opener, closer)) + _read_class(text, end)
+
+    return (node_id, None, None) + _read_class(text, pos)
+
+
+def _read_class(text, pos):
+    match = CLASS_SUFFIX.match(text, pos)
+    return (match.group(1), match.end()) if match else (None, pos)
+
+
+def _find_closer(text, start, open_char, closer):
+    depth = 0
+    for index in range(start, len(text)):
+        if text.startswith(closer, index) and depth == 0:
+            return index
+        if text[index] == open_char and open_char != ">":
+            depth += 1
+        elif text[index] == closer[0] and depth:
+            depth -= 1
+    return -1
+
+
+def _arrow(start, body, head):
+    """Canonical arrow for a link body (``--``, ``==`` or dotted) and head."""
+    if body.startswith("="):
+        return f"{start}=={head or '='}"
+    if "." in body:
+        return f"{start}-.-{head or ''}"
+    return f"{start}--{head or '-'}"
+
+
+def _read_link(text, pos):
+    """Parse a link at ``pos``; return (arrow, label, end) or None."""
+    match = TEXT_LINK.match(text, pos)
+    if match:
+        start, body, label, tail = match.groups()
+        head = tail[-1] if tail[-1] in ">ox" else ""
+        return _arrow(start, body, head), label.strip().strip('"'), match.end()
+    match = LINK.match(text, pos)
+    if match and match.group(2):
+        start, body, head, label = match.groups()
+        return _arrow(start, body, head), (label or "").strip().strip('"') or None, match.end()
+    return None
+
+
+def _read_directive(keyword, statement, line_no):
+    """Parse a DIRECTIVES statement into ``(keyword, targets, rest)``."""
+    if keyword == "classDef":
+        return keyword, None, statement[len(keyword):].strip()
+    parts = statement.split(None, 2)
+    if len(parts) < 3 and keyword != "click":
+        raise MermaidSyntaxError(f"line {line_no}: incomplete '{keyword}' statement")
+    targets, rest = parts[1] if len(parts) > 1 else "", parts[2] if len(parts) > 2 else ""
+    if keyword == "linkStyle":
+        if targets == "default":
+            return keyword, None, f"default {rest}"
+        try:
+            return keyword, [int(index) for index in targets.split(",")], rest
+        except ValueError:
+            raise MermaidSyntaxError(f"line {line_no}: bad link numbers '{targets}'") from None
+    if not targets:
+        raise MermaidSyntaxError(f"line {line_no}: '{keyword}' without a node id")
+    return keyword, targets.split(","), rest
+
+
+def _parse_statement(graph, statement, subgraph, line_no):
+    pos, previous, arrow, label, edge_id = 0, None, None, None, None
+    while True:
+        group = []
+        while True:
+            pos = len(statement) - len(statement[pos:].lstrip())
+            node_id, node_label, shape, css_class, pos = _read_node(statement, pos, line_no)
+            if css_class:
+                graph.directives.append(("class", [node_id], css_class))
+            if node_id in graph.subgraphs:
+                # A link to or from a whole subgraph
+                group.append(node_id)
+            else:
+                group.append(graph.add_node(node_id, node_label, shape, subgraph))
+            rest = statement[pos:].lstrip()
+            if not rest.startswith("&"):
+                break
+            pos = len(statement) - len(rest) + 1
+
+        if previous:
+            for source in previous:
+                for target in group:
+                    graph.add_edge(source, target, arrow, label, edge_id)
+
+        if pos >= len(statement.rstrip()):
+            return
+        match = EDGE_ID.match(statement, pos)
+        edge_id, pos = (match.group(1), match.end()) if match else (None, pos)
+        link = _read_link(statement, pos)
+        if link is None:
+            raise MermaidSyntaxError(f"line {line_no}: cannot parse '{statement[pos:].strip()}'")
+        arrow, label, pos = link
+        if pos >= len(statement.rstrip()):
+            raise MermaidSyntaxError(f"line {line_no}: link without a target in '{statement}'")
+        previous = group
+
+
+def parse_mermaid(text):
+    """Parse flowchart source into a MermaidGraph, raising MermaidSyntaxError."""
+    lines = [line.strip() for line in extract_mermaid(text).splitlines()]
+    lines = [(n, line) for n, line in enumerate(lines, 1) if line and not line.startswith("%%")]
+    if not lines:
+        raise MermaidSyntaxError("empty flowchart")
+
+    line_no, header = lines[0]
+    first, _, rest = header.partition(";")
+    match = HEADER.match(first.strip())
+    if not match:
+        raise MermaidSyntaxError(f"line {line_no}: expected 'graph' or 'flowchart' header")
+    graph = MermaidGraph(match.group(1).lower(), (match.group(2) or "TD").upper())
+    body = ([(line_no, rest)] if rest.strip() else []) + lines[1:]
+
+    stack = []
+    for line_no, line in body:
+        for statement in _split_statements(line):
+            keyword = statement.split(None, 1)[0]
+            if keyword == "subgraph":
+                title = statement[len("subgraph"):].strip()
+                if not title:
+                    raise MermaidSyntaxError(f"line {line_no}: subgraph without a title")
+                match = re.match(r"([\w-]+)\s*\[(.*)\]$", title)
+                if match:
+                    sub, title = match.group(1), match.group(2).strip('" ')
+                else:
+                    title = title.strip('"')
+                    sub = title
+                sub = sub if sub not in graph.subgraphs else f"{sub}_{len(graph.subgraphs)}"
+                # An id linked before its subgraph was declared meant the subgraph
+                graph.nodes.pop(sub, None)
+                graph.subgraphs[sub] = {"title": title, "parent": stack[-1] if stack else None}
+                stack.append(sub)
+            elif keyword == "end":
+                if not stack:
+                    raise MermaidSyntaxError(f"line {line_no}: 'end' without a subgraph")
+                stack.pop()
+            elif keyword == "direction":
+                # Only a subgraph's direction; the header sets the graph's
+                if stack:
+                    graph.subgraphs[stack[-1]]["direction"] = statement.split()[-1].upper()
+            elif keyword in DIRECTIVES:
+                graph.directives.append(_read_directive(keyword, statement, line_no))
+            elif METADATA.match(statement):
+                target, rest = METADATA.match(statement).groups()
+                if target not in {edge[4][1] for edge in graph.edges}:
+                    graph.add_node(target, subgraph=stack[-1] if stack else None)
+                graph.directives.append(("metadata", [target], rest))
+            else:
+                _parse_statement(graph, statement, stack[-1] if stack else None, line_no)
+
+    if stack:
+        raise MermaidSyntaxError(f"subgraph '{graph.subgraphs[stack[-1]]['title']}' is not closed")
+    if not graph.nodes:
+        raise MermaidSyntaxError("flowchart has no nodes")
+    return graph
+
+
+def canonicalize(text, budget=NODE_BUDGET):
+    """Validate, dedupe and (past ``budget`` nodes) collapse a flowchart.
+
+    Returns compact canonical Mermaid text; raises MermaidSyntaxError.
+    """
+    graph = parse_mermaid(text)
+    graph.dedupe()
+    graph.collapse(budget)
+    return graph.to_mermaid()
@@ -0,0 +1,233 @@
+import logging
+import os
+import random
+import threading
+
+# Share of payload log calls that are actually written, and their size cap
+LOG_SAMPLE_RATE = float(os.getenv("PRD_LOG_SAMPLE_RATE", "0.01"))
+LOG_MAX_CHARS = int(os.getenv("PRD_LOG_MAX_CHARS", "2000"))
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def total(self, **labels):
+        """Sum over every series matching the given labels."""
+        positions = [(self.labelnames.index(name), value) for name, value in labels.items()]
+        with self._lock:
+            return sum(
+                value
+                for key, value in self._values.items()
+                if all(key[index] == wanted for index, wanted in positions)
+            )
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _label_text(names, key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _label_text(names, key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose labelled values are read from ``collect()`` at scrape time."""
+
+    def __init__(self, name, help, collect, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.collect().items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, collect, labelnames=()):
+        return self.register(Gauge(name, help, collect, labelnames))
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "prd_stage_duration_seconds", "Wall time of an analysis stage.", ["stage", "outcome"]
+)
+# result is hit, similar (served from a near-duplicate PRD) or miss
+CACHE_LOOKUPS = REGISTRY.counter(
+    "prd_stage_cache_lookups_total", "Stage result cache lookups.", ["stage", "result"]
+)
+SIMILAR_LOOKUPS = REGISTRY.counter(
+    "prd_similar_lookups_total", "Near-duplicate PRD index lookups.", ["result"]
+)
+GEMINI_REQUESTS = REGISTRY.counter(
+    "prd_gemini_requests_total", "Gemini HTTP requests by final status.", ["stage", "status"]
+)
+GEMINI_LATENCY = REGISTRY.histogram(
+    "prd_gemini_request_duration_seconds",
+    "Gemini call latency including retries.",
+    ["stage"],
+)
+GEMINI_RETRIES = REGISTRY.counter(
+    "prd_gemini_retries_total", "Gemini request retries.", ["stage", "reason"]
+)
+GEMINI_REQUEST_BYTES = REGISTRY.counter(
+    "prd_gemini_request_bytes_total", "Bytes sent to Gemini.", ["stage"]
+)
+GEMINI_RESPONSE_BYTES = REGISTRY.counter(
+    "prd_gemini_response_bytes_total", "Bytes received from Gemini.", ["stage"]
+)
+GEMINI_TOKENS = REGISTRY.counter(
+    "prd_gemini_tokens_total", "Tokens reported by Gemini usage metadata.", ["stage", "kind"]
+)
+# event is fired, won (the hedge answered first) or throttled (over budget)
+GEMINI_HEDGES = REGISTRY.counter(
+    "prd_gemini_hedges_total", "Hedged duplicate Gemini requests.", ["stage", "event"]
+)
+GEMINI_FIRST_TOKEN = REGISTRY.histogram(
+    "prd_gemini_first_token_seconds",
+    "Time from starting a streamed Gemini call to its first chunk.",
+    ["stage"],
+)
+# event is created, hit, inline (upload failed earlier), failed, expired or
+# invalidated (Gemini no longer had the content)
+CONTEXT_CACHE = REGISTRY.counter(
+    "prd_gemini_context_cache_total", "Cached PRD context handle events.", ["event"]
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "prd_gemini_admission_wait_seconds",
+    "Time Gemini calls waited for admission.",
+    ["priority"],
+)
+CONCURRENCY_DECREASES = REGISTRY.counter(
+    "prd_gemini_concurrency_decreases_total",
+    "Multiplicative decreases of the Gemini concurrency limit.",
+    ["reason"],
+)
+# result is clean, repaired or failed; repaired / total is the repair rate
+JSON_PARSES = REGISTRY.counter(
+    "prd_json_parses_total", "Model JSON outputs parsed, by repair result.", ["stage", "result"]
+)
+
+# kind is before or after; 1 - after / before is the share normalization saved
+NORMALIZED_BYTES = REGISTRY.counter(
+    "prd_normalizer_bytes_total", "PRD text bytes around normalization.", ["kind"]
+)
+NORMALIZED_TOKENS = REGISTRY.counter(
+    "prd_normalizer_tokens_total", "Estimated PRD tokens around normalization.", ["kind"]
+)
+NORMALIZER_REMOVED = REGISTRY.counter(
+    "prd_normalizer_removed_total", "Lines and paragraphs dropped as noise.", ["kind"]
+)
+NORMALIZER_SAVINGS = REGISTRY.histogram(
+    "prd_normalizer_token_savings_ratio",
+    "Share of estimated PRD tokens removed per request.",
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75),
+)
+
+
+def record_stage(stage, seconds, error):
+    """Stage listener (see ``add_stage_listener``) feeding STAGE_DURATION."""
+    STAGE_DURATION.observe(seconds, stage=stage, outcome="error" if error else "ok")
+
+
+def log_payload(logger, label, payload):
+    """Log a payload for a sample of calls, truncated to LOG_MAX_CHARS.
+
+    Full PRDs and model responses can be megabytes, so hot paths must not
+    write them on every request.
+    """
+    if not logger.isEnabledFor(logging.INFO) or random.random() >= LOG_SAMPLE_RATE:
+        return
+    text = str(payload)
+    if len(text) > LOG_MAX_CHARS:
+        text = f"{text[:LOG_MAX_CHARS]}... [{len(text) - LOG_MAX_CHARS} more chars]"
+    logger.info("%s: %s", label, text)
@@ -1,19 +1,55 @@
-import requests
-import re
+import logging
+
+from routes.gemini_client import GeminiError, get_client
+from routes.large_document import (
+    cached,
+    cached_async,
+    condense,
+    condense_async,
+    flow_notes,
+    flow_notes_async,
+)
+from routes.mermaid_graph import MermaidSyntaxError, canonicalize, extract_mermaid
+from routes.metrics import log_payload
+
+logger = logging.getLogger(__name__)
 
 
 class PRDSummarizer:
-    def __init__(self, api_key, prd_text):
+    MODEL = "gemini-1.5-flash"
+    # Bump a stage's version whenever its prompt changes so cached results
+    # produced by the old prompt are no longer served.
+    PROMPT_VERSIONS = {"summary": 3, "summary_notes": 1, "user_flows": 1, "mermaid": 5}
+
+    def __init__(self, api_key, prd_text, client=None, cache=None):
         self.prd_text = prd_text
         self.summarized_text = ""
         self.user_flow_text = ""
         self.ui_components = []
         self.api_key = api_key
-        self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        self.client = client or get_client(api_key)
+        # Optional ResultCache for per-section results of large PRDs
+        self.cache = cache
+
+    def chunk_prompt(self, chunk):
+        return f"""
+        You are an expert in summarizing Product Requirements Documents (PRDs). The text below is one part of a larger PRD. Summarize it as concise bullet points covering the product purpose and users, features and functionalities, UI components, technical or business requirements, constraints and planned enhancements it mentions. Leave out anything it does not mention. Return only the bullet points.
+
+        PRD Part:
+        {chunk}
+        """
+
+    def summarize_chunk(self, chunk):
+        """Map step for large PRDs: condense one chunk into summary notes."""
+        prompt = self.chunk_prompt(chunk)
+        return self.client.generate(
+            self.MODEL, prompt, stage="summary_notes", hedge=True
+        ).text
 
-    def summarize_text(self):
-        prompt = f"""
-        You are an expert in summarizing Product Requirements Documents (PRDs). Your task is to generate a concise, structured, and comprehensive summary of the provided PRD text. The summary should be well-organized, easy to understand, and formatted for readability. Ensure it captures key points, objectives, features, and requirements within a 5000-character limit.
+    def summary_prompt(self):
+        """Instructions that follow the PRD (sent as the call's document)."""
+        return """
+        You are an expert in summarizing Product Requirements Documents (PRDs). Your task is to generate a concise, structured, and comprehensive summary of the PRD above. The summary should be well-organized, easy to understand, and formatted for readability. Ensure it captures key points, objectives, features, and requirements within a 5000-character limit.
 
         **Summary Format:**
         🔹 **Overview:** Briefly describe the product, its purpose, and target users.  
@@ -29,57 +65,71 @@ class PRDSummarizer:
         4. Include constraints, assumptions, or dependencies if relevant.  
         5. Avoid unnecessary details, examples, or repetitions.  
         6. Ensure logical flow and structured formatting.  
-
-        **PRD Text to Summarize:**  
-        {self.prd_text}
         """
 
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    def summarize_text(self, on_delta=None):
+        """Summarize the PRD; ``on_delta`` streams partial text as it arrives.
 
-        response = requests.post(
-            f"{self.api_url}?key={self.api_key}",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
+        Large PRDs are summarized chunk by chunk in parallel first and the
+        final summary is written from the merged partial summaries.
+        """
+        try:
+            summarize_chunk = cached(
+                self.summarize_chunk,
+                self.cache,
+                "summary_notes",
+                self.PROMPT_VERSIONS["summary_notes"],
+                self.MODEL,
+            )
+            source_text = condense(self.prd_text, summarize_chunk)
+        except GeminiError as e:
+            raise Exception("Failed to summarize text") from e
 
-        print("\n\nSummarize text response - ", response.json())
+        prompt = self.summary_prompt()
 
-        if response.status_code == 200:
-            candidates = response.json().get("candidates", [])
-            summary_response = candidates[0]["content"]["parts"][0]["text"]
-            self.summarized_text = summary_response.strip()
-        else:
-            raise Exception("Failed to summarize text")
+        try:
+            if on_delta is None:
+                response = self.client.generate(
+                    self.MODEL, prompt, stage="summary", hedge=True, document=source_text
+                )
+                log_payload(logger, "Summarize text response", response.body)
+                summary = response.text
+            else:
+                chunks = []
+                for chunk in self.client.stream_generate(
+                    self.MODEL, prompt, stage="summary", document=source_text
+                ):
+                    if chunk.candidates:
+                        chunks.append(chunk.text)
+                        on_delta(chunks[-1])
+                summary = "".join(chunks)
+            self.summarized_text = summary.strip()
+        except GeminiError as e:
+            raise Exception("Failed to summarize text") from e
 
-    def extract_user_flows(self):
-        prompt = f"""
+    def user_flows_prompt(self):
+        return f"""
         You are an AI expert in product analysis and user experience design. Given a Product Requirement Document (PRD), your task is to extract and map the complete user flow. Identify key steps, decision points, and interactions a user takes while engaging with the product. Structure the user flow in a clear, step-by-step manner, including entry points, actions, transitions, and outcomes. If applicable, highlight alternative paths, edge cases, and dependencies. Present the result in an easy-to-understand format, such as a flowchart-style list or structured diagram description.
 
         PRD Text to for User Flow Extraction:
         {self.summarized_text}
         """
 
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-
-        response = requests.post(
-            f"{self.api_url}?key={self.api_key}",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-        print("\n\nUser flow response - ", response.json())
-
-        if response.status_code == 200:
-            candidates = response.json().get("candidates", [])
-            user_flow_response = candidates[0]["content"]["parts"][0]["text"]
-            self.user_flow_text = user_flow_response.strip()
-        else:
-            raise Exception("Failed to summarize user flow.")
-
-    def generate_mermaid_code(self):
-        """Generate Mermaid code based on the user flows."""
+    def extract_user_flows(self):
+        prompt = self.user_flows_prompt()
+        try:
+            response = self.client.generate(
+                self.MODEL, prompt, stage="user_flows", hedge=True
+            )
+            log_payload(logger, "User flow response", response.body)
+            self.user_flow_text = response.text.strip()
+        except GeminiError as e:
+            raise Exception("Failed to summarize user flow.") from e
 
-        prompt = f"""
-        You are an AI expert in workflow visualization and Mermaid.js. Your task is to generate valid and error-free Mermaid.js code based on the given user flow from a Product Requirement Document (PRD). The output must not contain any syntax errors or comments.
+    def mermaid_prompt(self):
+        """Instructions that follow the PRD (sent as the call's document)."""
+        return """
+        You are an AI expert in workflow visualization and Mermaid.js. Your task is to generate valid and error-free Mermaid.js code for the user flow of the Product Requirement Document (PRD) above. The output must not contain any syntax errors or comments.
 
         Ensure the following:
 
@@ -90,34 +140,59 @@ class PRDSummarizer:
         Accurately capture loops, conditions, and alternate paths.
         No comments should be included in the output.
         Return only the Mermaid.js code, without any additional explanation.
-        User Flow to Convert:
-        {self.prd_text}
         """
 
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    def generate_mermaid_code(self):
+        """Generate Mermaid code based on the user flows."""
+        try:
+            source_text = flow_notes(self.client, self.MODEL, self.prd_text, self.cache)
+        except GeminiError as e:
+            raise Exception("Failed to get mermaid code.") from e
+
+        prompt = self.mermaid_prompt()
 
-        response = requests.post(
-            f"{self.api_url}?key={self.api_key}",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-        print("\n\nMermaid response - ", response.json())
-
-        if response.status_code == 200:
-            candidates = response.json().get("candidates", [])
-            mermaid_code = candidates[0]["content"]["parts"][0]["text"]
-            # Extracting the graph definition using regex
-            match = re.search(r"```mermaid\n(.*?)\n```", mermaid_code, re.DOTALL)
-            if match:
-                mermaid_graph = match.group(1)
-            else:
-                # If the mermaid code is not wrapped in markdown format, assume the entire text is the graph
-                mermaid_graph = mermaid_code.strip()
-                print("\n\nMermaid graph:", mermaid_graph)
-        else:
-            raise Exception("Failed to get mermaid code.")
+        try:
+            response = self.client.generate(
+                self.MODEL, prompt, stage="mermaid", hedge=True, document=source_text
+            )
+            log_payload(logger, "Mermaid response", response.body)
+            mermaid_code = response.text
+        except GeminiError as e:
+            raise Exception("Failed to get mermaid code.") from e
+
+        return self.finalize_mermaid(mermaid_code)
+
+    def mermaid_fix_prompt(self, mermaid_code, error):
+        return f"""
+        The Mermaid.js flowchart below fails to parse with this error: {error}
+        Fix only that syntax error. Keep every node, edge, label and subgraph otherwise unchanged. Return only the corrected Mermaid.js code.
+
+        Flowchart:
+        {extract_mermaid(mermaid_code)}
+        """
 
-        return mermaid_graph
+    def finalize_mermaid(self, mermaid_code):
+        """Validate and simplify model Mermaid output into a canonical graph.
+
+        When the graph does not parse, the model is asked once to fix just
+        the reported error rather than regenerating the flowchart.
+        """
+        try:
+            return canonicalize(mermaid_code)
+        except MermaidSyntaxError as e:
+            logger.warning("Mermaid output failed validation: %s", e)
+            error = e
+
+        prompt = self.mermaid_fix_prompt(mermaid_code, error)
+
+        try:
+            response = self.client.generate(
+                self.MODEL, prompt, stage="mermaid_fix", hedge=True
+            )
+            log_payload(logger, "Mermaid fix response", response.body)
+            return canonicalize(response.text)
+        except (GeminiError, MermaidSyntaxError) as e:
+            raise Exception("Failed to get mermaid code.") from e
 
     def process(self):
         """Process the PRD text and return the summarized information."""
@@ -130,3 +205,121 @@ class PRDSummarizer:
             "user_flows": self.user_flow_text,
             "mermaid_code": mermaid_code,
         }
+
+
+class AsyncPRDSummarizer(PRDSummarizer):
+    """PRDSummarizer whose stages are coroutines on an AsyncGeminiClient.
+
+    Prompts, model and prompt versions are shared with the sync class, so
+    both produce (and can reuse cached) identical results.
+    """
+
+    def __init__(self, api_key, prd_text, client=None, cache=None):
+        if client is None:
+            # httpx is only needed by the async app
+            from routes.async_gemini_client import get_async_client
+
+            client = get_async_client(api_key)
+        super().__init__(api_key, prd_text, client=client, cache=cache)
+
+    async def summarize_chunk(self, chunk):
+        """Map step for large PRDs: condense one chunk into summary notes."""
+        prompt = self.chunk_prompt(chunk)
+        response = await self.client.generate(
+            self.MODEL, prompt, stage="summary_notes", hedge=True
+        )
+        return response.text
+
+    async def summarize_text(self, on_delta=None):
+        try:
+            summarize_chunk = cached_async(
+                self.summarize_chunk,
+                self.cache,
+                "summary_notes",
+                self.PROMPT_VERSIONS["summary_notes"],
+                self.MODEL,
+            )
+            source_text = await condense_async(self.prd_text, summarize_chunk)
+        except GeminiError as e:
+            raise Exception("Failed to summarize text") from e
+
+        prompt = self.summary_prompt()
+
+        try:
+            if on_delta is None:
+                response = await self.client.generate(
+                    self.MODEL, prompt, stage="summary", hedge=True, document=source_text
+                )
+                log_payload(logger, "Summarize text response", response.body)
+                summary = response.text
+            else:
+                chunks = []
+                async for chunk in self.client.stream_generate(
+                    self.MODEL, prompt, stage="summary", document=source_text
+                ):
+                    if chunk.candidates:
+                        chunks.append(chunk.text)
+                        on_delta(chunks[-1])
+                summary = "".join(chunks)
+            self.summarized_text = summary.strip()
+        except GeminiError as e:
+            raise Exception("Failed to summarize text") from e
+
+    async def extract_user_flows(self):
+        prompt = self.user_flows_prompt()
+        try:
+            response = await self.client.generate(
+                self.MODEL, prompt, stage="user_flows", hedge=True
+            )
+            log_payload(logger, "User flow response", response.body)
+            self.user_flow_text = response.text.strip()
+        except GeminiError as e:
+            raise Exception("Failed to summarize user flow.") from e
+
+    async def generate_mermaid_code(self):
+        try:
+            source_text = await flow_notes_async(
+                self.client, self.MODEL, self.prd_text, self.cache
+            )
+            response = await self.client.generate(
+                self.MODEL,
+                self.mermaid_prompt(),
+                stage="mermaid",
+                hedge=True,
+                document=source_text,
+            )
+            log_payload(logger, "Mermaid response", response.body)
+            mermaid_code = response.text
+        except GeminiError as e:
+            raise Exception("Failed to get mermaid code.") from e
+
+        return await self.finalize_mermaid(mermaid_code)
+
+    async def finalize_mermaid(self, mermaid_code):
+        try:
+            return canonicalize(mermaid_code)
+        except MermaidSyntaxError as e:
+            logger.warning("Mermaid output failed validation: %s", e)
+            error = e
+
+        prompt = self.mermaid_fix_prompt(mermaid_code, error)
+
+        try:
+            response = await self.client.generate(
+                self.MODEL, prompt, stage="mermaid_fix", hedge=True
+            )
+            log_payload(logger, "Mermaid fix response", response.body)
+            return canonicalize(response.text)
+        except (GeminiError, MermaidSyntaxError) as e:
+            raise Exception("Failed to get mermaid code.") from e
+
+    async def process(self):
+        await self.summarize_text()
+        await self.extract_user_flows()
+        mermaid_code = await self.generate_mermaid_code()
+
+        return {
+            "summarized_text": self.summarized_text,
+            "user_flows": self.user_flow_text,
+            "mermaid_code": mermaid_code,
+        }
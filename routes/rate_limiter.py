@@ -0,0 +1,435 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from routes.deadline import current_deadline
+from routes.metrics import ADMISSION_WAIT, CONCURRENCY_DECREASES, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# How often waiting coroutines re-check for capacity when nothing wakes them
+ASYNC_POLL_SECONDS = 0.05
+
+# Lower rank is admitted first; anything unknown is treated as batch work
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_priority = contextvars.ContextVar("gemini_priority", default="interactive")
+
+
+@contextmanager
+def priority_class(name):
+    """Run the block (and stages it schedules) under priority ``name``."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a call waited longer than the admission timeout, or
+    the request deadline passed first."""
+
+
+class MemoryBuckets:
+    """Token buckets held in this process.
+
+    ``limits`` maps a bucket name to its per-minute quota; each bucket holds
+    up to one minute of quota and refills continuously.
+    """
+
+    def __init__(self, limits):
+        self.limits = {name: limit for name, limit in limits.items() if limit}
+        now = time.monotonic()
+        self._state = {name: (float(limit), now) for name, limit in self.limits.items()}
+        self._lock = threading.Lock()
+
+    def take(self, costs):
+        """Take ``costs`` from every bucket at once if they all have room.
+
+        Returns 0 on success, otherwise the seconds until they would.
+        """
+        with self._lock:
+            now = time.monotonic()
+            levels = {
+                name: self._refill(name, *self._state[name], now) for name in self.limits
+            }
+            wait = self._wait(levels, costs)
+            if wait == 0:
+                for name in self.limits:
+                    self._state[name] = (levels[name] - costs.get(name, 0), now)
+            return wait
+
+    def adjust(self, name, delta):
+        """Give back (or charge more) once the real cost is known."""
+        if name in self.limits:
+            with self._lock:
+                now = time.monotonic()
+                level = self._refill(name, *self._state[name], now)
+                self._state[name] = (min(self.limits[name], level + delta), now)
+
+    def _refill(self, name, level, updated, now):
+        limit = self.limits[name]
+        return min(limit, level + (now - updated) * limit / 60)
+
+    def _wait(self, levels, costs):
+        wait = 0.0
+        for name, limit in self.limits.items():
+            # A single call bigger than the whole quota waits for a full bucket
+            cost = min(costs.get(name, 0), limit)
+            if levels[name] < cost:
+                wait = max(wait, (cost - levels[name]) * 60 / limit)
+        return wait
+
+
+class SQLiteBuckets(MemoryBuckets):
+    """Token buckets shared by every process that uses the same SQLite file.
+
+    Keeps gunicorn workers (or several hosts on one volume) inside a single
+    quota. Each take runs in an immediate transaction so refill and charge
+    are atomic across processes.
+    """
+
+    def __init__(self, limits, path, prefix=""):
+        self.limits = {name: limit for name, limit in limits.items() if limit}
+        self.path = path
+        self.prefix = prefix
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def _transaction(self, update):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = {}
+            for name, limit in self.limits.items():
+                row = conn.execute(
+                    "SELECT level, updated FROM buckets WHERE name = ?",
+                    (self.prefix + name,),
+                ).fetchone()
+                level, updated = row if row else (float(limit), now)
+                levels[name] = self._refill(name, level, updated, now)
+            result, levels = update(levels)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                [(self.prefix + name, level, now) for name, level in levels.items()],
+            )
+            conn.execute("COMMIT")
+            return result
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            # Fall back to admitting the call rather than blocking all traffic
+            logger.warning("Shared rate limit store failed: %s", e)
+            return 0
+        finally:
+            conn.close()
+
+    def take(self, costs):
+        def update(levels):
+            wait = self._wait(levels, costs)
+            if wait == 0:
+                levels = {name: level - costs.get(name, 0) for name, level in levels.items()}
+            return wait, levels
+
+        return self._transaction(update)
+
+    def adjust(self, name, delta):
+        if name not in self.limits:
+            return
+
+        def update(levels):
+            levels[name] = min(self.limits[name], levels[name] + delta)
+            return None, levels
+
+        self._transaction(update)
+
+
+class Permit:
+    def __init__(self, stage, priority, tokens):
+        self.stage = stage
+        self.priority = priority
+        self.tokens = tokens
+        self.start = time.monotonic()
+        # Time to response headers, set by the client
+        self.latency = None
+
+
+class AdmissionController:
+    """Gate every Gemini call on quota, adaptive concurrency and priority.
+
+    A call is admitted when it is first in line (interactive before batch,
+    then arrival order), fewer than ``limit`` calls are in flight, and both
+    the requests-per-minute and tokens-per-minute buckets have room. The
+    concurrency limit follows AIMD: it grows by about one per round trip of
+    calls that come back quickly and halves on a 429 or when latency rises
+    past ``latency_tolerance`` times the stage's usual latency.
+    """
+
+    def __init__(
+        self,
+        buckets,
+        min_concurrency=1,
+        max_concurrency=16,
+        latency_tolerance=2.0,
+        decrease_factor=0.5,
+        cooldown=2.0,
+        timeout=60.0,
+    ):
+        self.buckets = buckets
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.in_flight = 0
+        self._baselines = {}
+        self._last_decrease = 0.0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        # Bumped on every notify, so a waiter can tell it missed one
+        self._changes = 0
+        # (loop, asyncio.Event) of waiting coroutines, set on every notify
+        self._async_waiters = set()
+
+    def acquire(self, tokens, stage="unknown", priority=None):
+        """Block until the call may go out; returns the Permit to release."""
+        permit, entry = self._enqueue(tokens, stage, priority)
+        try:
+            while True:
+                with self._condition:
+                    changes = self._changes
+                admitted, wait = self._try_admit(entry, tokens)
+                if admitted:
+                    break
+                with self._condition:
+                    # A release or dequeue since the check would be missed
+                    if self._changes == changes:
+                        self._condition.wait(self._wait_time(permit, wait))
+        finally:
+            self._dequeue(entry)
+        return self._admitted(permit)
+
+    async def acquire_async(self, tokens, stage="unknown", priority=None):
+        """``acquire`` for coroutines: waits in the same line as threads.
+
+        Coroutines cannot wait on the condition; every notify sets an event
+        on their loop instead, and they re-check at least every
+        ASYNC_POLL_SECONDS (or when the buckets say they will have room).
+        Each check runs in a worker thread, as charging SQLiteBuckets is
+        file I/O.
+        """
+        permit, entry = self._enqueue(tokens, stage, priority)
+        woken = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), woken)
+        with self._condition:
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                woken.clear()
+                check = asyncio.ensure_future(
+                    asyncio.to_thread(self._try_admit, entry, tokens)
+                )
+                try:
+                    admitted, wait = await asyncio.shield(check)
+                except asyncio.CancelledError:
+                    # The check finishes anyway; free a slot it admits
+                    check.add_done_callback(functools.partial(self._abandon, permit))
+                    raise
+                if admitted:
+                    break
+                try:
+                    await asyncio.wait_for(
+                        woken.wait(),
+                        min(self._wait_time(permit, wait), wait or ASYNC_POLL_SECONDS),
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+            self._dequeue(entry)
+        return self._admitted(permit)
+
+    def _enqueue(self, tokens, stage, priority):
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            raise AdmissionTimeout("Request deadline passed before Gemini capacity was free.")
+        priority = priority or current_priority()
+        entry = (PRIORITIES.get(priority, max(PRIORITIES.values())), next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+        return Permit(stage, priority, tokens), entry
+
+    def _try_admit(self, entry, tokens):
+        """Admit ``entry`` if it is first in line and there is capacity;
+        returns ``(admitted, bucket_wait)``.
+
+        Call without the condition held. The head of the line reserves an
+        in-flight slot under it, then charges the buckets outside it
+        (SQLiteBuckets holds a cross-process lock while it does). Once the
+        condition is held again it leaves the line if they had room, and
+        gives the slot back if not.
+        """
+        with self._condition:
+            if self._waiting[0] != entry or self.in_flight >= int(self.limit):
+                return False, None
+            self.in_flight += 1
+        wait = None
+        try:
+            wait = self.buckets.take({"requests": 1, "tokens": tokens})
+        finally:
+            with self._condition:
+                if wait == 0:
+                    self._remove(entry)
+                else:
+                    self.in_flight -= 1
+        return (False, wait) if wait else (True, None)
+
+    def _abandon(self, permit, check):
+        """Free the slot of an admission check whose coroutine was cancelled."""
+        if not check.cancelled() and check.exception() is None and check.result()[0]:
+            self.release(permit)
+
+    def _wait_time(self, permit, wait):
+        """How long to wait before checking again, bounded by the admission
+        timeout and the request deadline; raises once either has passed."""
+        remaining = permit.start + self.timeout - time.monotonic()
+        if remaining <= 0:
+            raise AdmissionTimeout(f"Waited over {self.timeout:g}s for Gemini capacity.")
+        deadline = current_deadline()
+        if deadline is not None:
+            if deadline.expired():
+                raise AdmissionTimeout("Request deadline passed before Gemini capacity was free.")
+            remaining = min(remaining, deadline.remaining())
+        return min(remaining, wait) if wait else remaining
+
+    def _dequeue(self, entry):
+        with self._condition:
+            if entry in self._waiting:
+                self._remove(entry)
+
+    def _remove(self, entry):
+        # Call with the condition held
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        self._notify()
+
+    def _admitted(self, permit):
+        ADMISSION_WAIT.observe(time.monotonic() - permit.start, priority=permit.priority)
+        permit.start = time.monotonic()
+        return permit
+
+    def release(self, permit, latency=None, throttled=False, tokens=None):
+        """Return a permit; ``latency`` is the call's time to response headers.
+
+        ``tokens`` is the real token usage, used to correct the estimate
+        charged at admission. Blocks on file I/O with SQLiteBuckets.
+        """
+        if tokens is not None:
+            self.buckets.adjust("tokens", permit.tokens - tokens)
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self._decrease(now, "throttled")
+            elif latency is not None:
+                baseline = self._baselines.get(permit.stage)
+                if baseline is not None and latency > baseline * self.latency_tolerance:
+                    self._decrease(now, "latency")
+                else:
+                    # Additive increase: about +1 per limit's worth of fast calls
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                # Slow-moving latency estimate per stage
+                self._baselines[permit.stage] = (
+                    latency if baseline is None else baseline * 0.9 + latency * 0.1
+                )
+            self._notify()
+
+    def _notify(self):
+        # Call with the condition held
+        self._changes += 1
+        self._condition.notify_all()
+        for loop, woken in self._async_waiters:
+            loop.call_soon_threadsafe(woken.set)
+
+    def _decrease(self, now, reason):
+        # Calls already in flight when the first 429 lands all see it; only
+        # back off once per cooldown so one burst does not collapse the limit
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+        CONCURRENCY_DECREASES.inc(reason=reason)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiting),
+            }
+
+
+_controllers = []
+
+REGISTRY.gauge(
+    "prd_gemini_admission",
+    "Gemini admission controller concurrency limit, in-flight and waiting calls.",
+    lambda: {
+        name: sum(controller.stats()[name] for controller in _controllers)
+        for name in ("limit", "in_flight", "waiting")
+    },
+    ["field"],
+)
+
+
+def create_controller(prefix=""):
+    """Build an AdmissionController from the GEMINI_* environment settings.
+
+    Set GEMINI_RATE_LIMIT_PATH to share the quota buckets between processes.
+    """
+    limits = {
+        "requests": int(os.getenv("GEMINI_RPM", "1000")),
+        "tokens": int(os.getenv("GEMINI_TPM", "1000000")),
+    }
+    path = os.getenv("GEMINI_RATE_LIMIT_PATH", "")
+    buckets = SQLiteBuckets(limits, path, prefix) if path else MemoryBuckets(limits)
+    controller = AdmissionController(
+        buckets,
+        min_concurrency=int(os.getenv("GEMINI_MIN_CONCURRENCY", "1")),
+        max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+        latency_tolerance=float(os.getenv("GEMINI_LATENCY_TOLERANCE", "2.0")),
+        timeout=float(os.getenv("GEMINI_ADMISSION_TIMEOUT", "60")),
+    )
+    _controllers.append(controller)
+    return controller
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MODES = ("record", "replay")
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class ReplayStore:
+    """Gemini request/response pairs on disk, for runs without the network.
+
+    In ``record`` mode the clients store every successful call; in
+    ``replay`` mode they answer calls from the store alone, and a call that
+    was never recorded fails. Pairs are keyed by endpoint and request body,
+    so a replayed run gets exactly the answers the recorded run got, and
+    are kept as zlib-compressed JSON in SQLite, indexed by stage.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode '{mode}', expected one of {MODES}.")
+        self.path = path
+        self.mode = mode
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS exchanges (
+                    key BLOB PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    request BLOB NOT NULL,
+                    response BLOB NOT NULL,
+                    created REAL NOT NULL
+                ) WITHOUT ROWID"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS exchanges_stage ON exchanges (stage)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def key(self, endpoint, payload):
+        raw = endpoint + "\n" + json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).digest()
+
+    def save(self, endpoint, payload, response, stage="unknown"):
+        """Store the ``response`` body (a list of bodies for a stream)."""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        self.key(endpoint, payload),
+                        stage,
+                        endpoint,
+                        _pack(payload),
+                        _pack(response),
+                        time.time(),
+                    ),
+                )
+        except sqlite3.Error as e:
+            logger.warning("Could not record Gemini response: %s", e)
+
+    def load(self, endpoint, payload):
+        """The recorded response to a request, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response FROM exchanges WHERE key = ?",
+                (self.key(endpoint, payload),),
+            ).fetchone()
+        return None if row is None else _unpack(row[0])
+
+    def responses(self, stage):
+        """Every recorded response of ``stage``, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT response FROM exchanges WHERE stage = ? ORDER BY created", (stage,)
+            ).fetchall()
+        return [_unpack(blob) for blob, in rows]
+
+    def stats(self):
+        with self._connect() as conn:
+            count, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(request) + LENGTH(response)), 0) "
+                "FROM exchanges"
+            ).fetchone()
+        return {"mode": self.mode, "exchanges": count, "bytes": size}
+
+
+def create_replay_store():
+    """Build a ReplayStore from GEMINI_REPLAY_MODE (``record`` or
+    ``replay``) and GEMINI_REPLAY_PATH, or None when replay is off."""
+    mode = os.getenv("GEMINI_REPLAY_MODE", "off")
+    if mode in ("", "off"):
+        return None
+    return ReplayStore(os.getenv("GEMINI_REPLAY_PATH", "cache/gemini_replay.sqlite3"), mode)
@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# The disk tier is expired and trimmed on one write in EVICT_EVERY, since
+# that needs a scan of the whole table; it may exceed its limits by up to
+# that many rows in between
+EVICT_EVERY = 64
+
+
+def normalize_text(text):
+    """Collapse whitespace so cosmetic differences map to the same key."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def text_digest(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cache_key(stage, digest, prompt_version, model):
+    """Key for one stage result of one document under one prompt/model."""
+    raw = f"{stage}|{prompt_version}|{model}|{digest}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for stage results: an in-process LRU over SQLite.
+
+    The SQLite file is the shared tier; every worker process pointing at the
+    same path sees the same entries, and they survive restarts. Entries
+    expire after ``ttl`` seconds and the least recently used ones are evicted
+    once the disk tier holds more than ``max_disk_entries`` rows or
+    ``max_disk_bytes`` of values. Values must be JSON-serializable.
+    """
+
+    def __init__(
+        self,
+        path,
+        memory_entries=256,
+        ttl=7 * 24 * 3600,
+        max_disk_entries=10000,
+        max_disk_bytes=512 * 1024 * 1024,
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        self._writes = 0
+        # Computations in progress, by key (and event loop for coroutines)
+        self._flights = {}
+        self._async_flights = {}
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS results (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        accessed REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+                )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection with a transaction around the block, closed after."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key):
+        """Return ``(hit, value)`` for ``key``."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return True, value
+                del self._memory[key]
+
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT value, created FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] < self.ttl:
+                        conn.execute(
+                            "UPDATE results SET accessed = ? WHERE key = ?", (now, key)
+                        )
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self._count("disk_hits")
+                        return True, value
+            except sqlite3.Error as e:
+                logger.warning("Result cache read failed: %s", e)
+
+        self._count("misses")
+        return False, None
+
+    def set(self, key, value):
+        now = time.time()
+        self._remember(key, now, value)
+        self._count("stores")
+        if not self.path:
+            return
+
+        encoded = json.dumps(value)
+        with self._lock:
+            evict = self._writes % EVICT_EVERY == 0
+            self._writes += 1
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, len(encoded), now, now),
+                )
+                if evict:
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning("Result cache write failed: %s", e)
+
+    def get_or_compute(self, key, compute):
+        """Return the value for ``key``, computing and storing it on a miss.
+
+        Callers missing the same key at the same time share one ``compute``:
+        the first runs it and the others wait for its result or exception.
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            return flight.result()
+        try:
+            value = compute()
+            if value is not None:
+                self.set(key, value)
+            flight.set_result(value)
+            return value
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    async def get_or_compute_async(self, key, compute):
+        """``get_or_compute`` for a coroutine function, with SQLite I/O on
+        worker threads.
+
+        The computation runs as a task of its own that is cancelled only
+        once every caller waiting for it has been.
+        """
+        hit, value = await asyncio.to_thread(self.get, key)
+        if hit:
+            return value
+        flight_key = (asyncio.get_running_loop(), key)
+        flight = self._async_flights.get(flight_key)
+        if flight is None:
+            task = asyncio.ensure_future(self._compute_async(key, compute))
+            flight = self._async_flights[flight_key] = [task, 0]
+            task.add_done_callback(lambda _: self._async_flights.pop(flight_key, None))
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if not flight[1]:
+                task.cancel()
+
+    async def _compute_async(self, key, compute):
+        value = await compute()
+        if value is not None:
+            await asyncio.to_thread(self.set, key, value)
+        return value
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if count <= self.max_disk_entries and total <= self.max_disk_bytes:
+            return
+
+        # Drop least recently used rows until both limits hold again
+        removed_rows, removed_bytes = [], 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM results ORDER BY accessed"
+        ):
+            if (
+                count - len(removed_rows) <= self.max_disk_entries
+                and total - removed_bytes <= self.max_disk_bytes
+            ):
+                break
+            removed_rows.append((key,))
+            removed_bytes += size
+        conn.executemany("DELETE FROM results WHERE key = ?", removed_rows)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    count, total = conn.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+                    ).fetchone()
+                stats.update(disk_entries=count, disk_bytes=total)
+            except sqlite3.Error as e:
+                logger.warning("Result cache stats failed: %s", e)
+        return stats
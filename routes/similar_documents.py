@@ -0,0 +1,221 @@
+import array
+import logging
+import os
+import sqlite3
+import threading
+
+from routes.metrics import SIMILAR_LOOKUPS
+from routes.text_normalizer import SHINGLE_WORDS, shingles
+
+logger = logging.getLogger(__name__)
+
+# MinHash slots per signature; LSH_BANDS bands of LSH_ROWS slots each
+SIGNATURE_SLOTS = 128
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_SLOTS // LSH_BANDS
+# Bits kept per slot on disk (b-bit MinHash); two slots agree by chance
+# with probability 2**-16, which is negligible next to the threshold
+STORED_BITS = 16
+# Candidates sharing the most bands that are checked per lookup
+MAX_CANDIDATES = 50
+MASK64 = (1 << 64) - 1
+
+
+def signature(text):
+    """MinHash signature of ``text``'s word shingles.
+
+    Uses one-permutation hashing: each shingle hash picks a slot and the
+    slot keeps the smallest value it sees, so the signature costs one pass
+    over the shingles rather than one per hash function. Empty slots are
+    filled from the next filled slot (rotation densification).
+
+    Returns ``(values, band_keys, shingle_count)``, or None for text
+    without words.
+    Shingles are tuples of ints, whose hashes are the same in every
+    process, so signatures can be stored and compared across restarts.
+    """
+    slots = [None] * SIGNATURE_SLOTS
+    text_shingles = shingles(text)
+    for shingle in text_shingles:
+        value, slot = divmod(hash(shingle) & MASK64, SIGNATURE_SLOTS)
+        current = slots[slot]
+        if current is None or value < current:
+            slots[slot] = value
+    if all(value is None for value in slots):
+        return None
+
+    values = list(slots)
+    for i in range(SIGNATURE_SLOTS):
+        distance = 1
+        while values[i] is None:
+            donor = slots[(i + distance) % SIGNATURE_SLOTS]
+            if donor is not None:
+                values[i] = (donor + distance * 0x9E3779B97F4A7C15) & MASK64
+            distance += 1
+
+    band_keys = [
+        hash((band,) + tuple(values[band * LSH_ROWS : (band + 1) * LSH_ROWS]))
+        for band in range(LSH_BANDS)
+    ]
+    stored = array.array("H", (value & ((1 << STORED_BITS) - 1) for value in values))
+    return stored, band_keys, len(text_shingles)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two stored signatures."""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SLOTS
+
+
+class SimilarityIndex:
+    """LSH index of MinHash signatures of previously analyzed PRDs.
+
+    Each document is stored once as a 256-byte signature plus one row per
+    LSH band, about 650 bytes on disk in all. A lookup reads the
+    documents sharing a band with the query (an indexed IN query),
+    re-scores the best MAX_CANDIDATES by signature and returns the most
+    similar one that passes ``required_similarity``. The oldest documents
+    are dropped beyond ``max_entries``. Like ResultCache, every process
+    using the same path shares the index.
+    """
+
+    def __init__(self, path, threshold=0.9, max_entries=200000, max_changed_words=3):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_changed_words = max_changed_words
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "matches": 0, "added": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    digest BLOB NOT NULL UNIQUE,
+                    signature BLOB NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS bands (
+                    key INTEGER NOT NULL,
+                    doc INTEGER NOT NULL,
+                    PRIMARY KEY (key, doc)
+                ) WITHOUT ROWID"""
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def required_similarity(self, shingle_count):
+        """Similarity a match for a document of ``shingle_count`` shingles
+        needs, or None when no match can be trusted.
+
+        Besides ``threshold``, at most ``max_changed_words`` words may
+        differ, so the bar rises with the document's size: a re-upload with
+        a typo fixed matches, a revised paragraph does not. Past the
+        signature's resolution (one slot in SIGNATURE_SLOTS) a small edit
+        cannot be told from a revision, and such documents never match.
+        """
+        changed = self.max_changed_words * SHINGLE_WORDS
+        required = max(
+            self.threshold, (shingle_count - changed) / (shingle_count + changed)
+        )
+        return required if required <= 1 - 1 / SIGNATURE_SLOTS else None
+
+    def find(self, signature, exclude=None):
+        """Return ``(digest, similarity)`` of the most similar indexed
+        document at or above ``required_similarity``, or None."""
+        if signature is None:
+            return None
+        values, band_keys, shingle_count = signature
+        self._count("lookups")
+        required = self.required_similarity(shingle_count)
+        if required is None:
+            SIMILAR_LOOKUPS.inc(result="too_large")
+            return None
+        try:
+            with self._connect() as conn:
+                candidates = [
+                    doc
+                    for doc, _ in conn.execute(
+                        f"""SELECT doc, COUNT(*) AS shared FROM bands
+                            WHERE key IN ({",".join("?" * len(band_keys))})
+                            GROUP BY doc ORDER BY shared DESC LIMIT ?""",
+                        (*band_keys, MAX_CANDIDATES),
+                    )
+                ]
+                rows = conn.execute(
+                    f"""SELECT digest, signature FROM documents
+                        WHERE id IN ({",".join("?" * len(candidates))})""",
+                    candidates,
+                ).fetchall() if candidates else []
+        except sqlite3.Error as e:
+            logger.warning("Similarity index lookup failed: %s", e)
+            return None
+
+        best = None
+        for digest, stored in rows:
+            digest = digest.hex()
+            if digest == exclude:
+                continue
+            score = similarity(values, array.array("H", stored))
+            if score >= required and (best is None or score > best[1]):
+                best = (digest, score)
+        SIMILAR_LOOKUPS.inc(result="match" if best else "none")
+        if best:
+            self._count("matches")
+        return best
+
+    def add(self, digest, signature):
+        self.add_many([(digest, signature)])
+
+    def add_many(self, documents):
+        """Index ``(digest, signature)`` pairs; known digests are skipped."""
+        documents = [(d, s) for d, s in documents if s is not None]
+        if not documents:
+            return
+        try:
+            with self._connect() as conn:
+                added = 0
+                for digest, (values, band_keys, _) in documents:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO documents (digest, signature) VALUES (?, ?)",
+                        (bytes.fromhex(digest), values.tobytes()),
+                    )
+                    if cursor.rowcount:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO bands VALUES (?, ?)",
+                            [(key, cursor.lastrowid) for key in band_keys],
+                        )
+                        added += 1
+                self._prune(conn)
+            self._count("added", added)
+        except sqlite3.Error as e:
+            logger.warning("Similarity index write failed: %s", e)
+
+    def _prune(self, conn):
+        # Deleting band rows by document scans the table, so only prune once
+        # the index is a tenth over its limit
+        oldest, newest = conn.execute("SELECT MIN(id), MAX(id) FROM documents").fetchone()
+        if newest is None or newest - oldest < self.max_entries * 1.1:
+            return
+        cutoff = newest - self.max_entries
+        conn.execute("DELETE FROM documents WHERE id <= ?", (cutoff,))
+        conn.execute("DELETE FROM bands WHERE doc <= ?", (cutoff,))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        try:
+            with self._connect() as conn:
+                stats["entries"] = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Similarity index stats failed: %s", e)
+        return stats
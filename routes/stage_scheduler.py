@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Callables notified as ``listener(stage, seconds, error)`` after every stage
+_stage_listeners = []
+
+
+def add_stage_listener(listener):
+    _stage_listeners.append(listener)
+
+
+def remove_stage_listener(listener):
+    _stage_listeners.remove(listener)
+
+
+def _timed(name, func, *args):
+    """Run a stage function and report its wall time to the listeners."""
+    start = time.perf_counter()
+    error = None
+    try:
+        return func(*args)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in list(_stage_listeners):
+            listener(name, elapsed, error)
+
+
+async def _timed_async(name, func, *args):
+    """``_timed`` for a coroutine stage function."""
+    start = time.perf_counter()
+    error = None
+    try:
+        return await func(*args)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in list(_stage_listeners):
+            listener(name, elapsed, error)
+
+
+class StageFailed(Exception):
+    """Raised for a stage that could not run because a dependency failed."""
+
+
+class Stage:
+    def __init__(self, name, func, depends_on=(), label=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        # Name reported to stage listeners; merged stages keep their original one
+        self.label = label or name
+
+
+class StageRun:
+    """Outcome of a scheduler run: per-stage results and errors."""
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def failed(self):
+        return sorted(self.errors)
+
+
+class StageScheduler:
+    """Run a small DAG of stages, executing independent stages in parallel.
+
+    Each stage function is called with the results of its dependencies as
+    positional arguments, in the order they were declared. A failing stage
+    does not abort the run: its error is recorded and only the stages that
+    depend on it are skipped.
+    """
+
+    def __init__(self, max_workers=4, executor=None):
+        self.max_workers = max_workers
+        # A shared executor caps concurrency across schedulers; when given,
+        # ``max_workers`` is ignored and the executor is not shut down
+        self.executor = executor
+        self.stages = {}
+        # Where each stage's result came from, for stage functions that say
+        self.sources = {}
+
+    def add_stage(self, name, func, depends_on=(), label=None):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined.")
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(
+                    f"Stage '{name}' depends on unknown stage '{dependency}'."
+                )
+        self.stages[name] = Stage(name, func, depends_on, label)
+        return self
+
+    def add_stages_from(self, other, prefix):
+        """Copy every stage of ``other`` in under ``prefix`` + its name.
+
+        Lets several independent DAGs run as one, e.g. one per document.
+        """
+        for stage in other.stages.values():
+            self.add_stage(
+                prefix + stage.name,
+                stage.func,
+                [prefix + dependency for dependency in stage.depends_on],
+                label=stage.label,
+            )
+        return self
+
+    def required_stages(self, targets):
+        """Return the target stages together with everything they depend on."""
+        required = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in required:
+                continue
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'.")
+            required.add(name)
+            stack.extend(self.stages[name].depends_on)
+        return required
+
+    def run(self, targets=None):
+        """Run the stages needed for ``targets`` (all stages when omitted)."""
+        run = StageRun()
+        for name, result, error in self.iter_run(targets):
+            if error is None:
+                run.results[name] = result
+            else:
+                run.errors[name] = error
+        return run
+
+    def iter_run(self, targets=None):
+        """Like ``run`` but yield ``(name, result, error)`` as each stage ends.
+
+        ``error`` is None for a stage that succeeded; skipped stages are
+        reported with a ``StageFailed`` error.
+        """
+        required = self.stages if targets is None else self.required_stages(targets)
+        pending = {name: self.stages[name] for name in self.stages if name in required}
+        results, errors = {}, set()
+        running = {}
+
+        executor = self.executor or ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    failed = [d for d in stage.depends_on if d in errors]
+                    if failed:
+                        del pending[name]
+                        errors.add(name)
+                        yield name, None, StageFailed(
+                            f"Skipped because stage '{failed[0]}' failed."
+                        )
+                    elif all(d in results for d in stage.depends_on):
+                        args = [results[d] for d in stage.depends_on]
+                        # Stages see the caller's context (e.g. its priority class)
+                        context = contextvars.copy_context()
+                        future = executor.submit(
+                            context.run, _timed, stage.label, stage.func, *args
+                        )
+                        running[future] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors.add(name)
+                        yield name, None, e
+                    else:
+                        yield name, results[name], None
+        finally:
+            if executor is not self.executor:
+                executor.shutdown()
+
+
+class AsyncStageScheduler(StageScheduler):
+    """StageScheduler whose stage functions are coroutine functions.
+
+    Ready stages run as tasks on the current event loop; ``max_workers`` and
+    ``executor`` are unused since waiting on Gemini does not hold a thread.
+    """
+
+    async def run(self, targets=None):
+        run = StageRun()
+        async for name, result, error in self.iter_run(targets):
+            if error is None:
+                run.results[name] = result
+            else:
+                run.errors[name] = error
+        return run
+
+    async def iter_run(self, targets=None):
+        required = self.stages if targets is None else self.required_stages(targets)
+        pending = {name: self.stages[name] for name in self.stages if name in required}
+        results, errors = {}, set()
+        running = {}
+
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    failed = [d for d in stage.depends_on if d in errors]
+                    if failed:
+                        del pending[name]
+                        errors.add(name)
+                        yield name, None, StageFailed(
+                            f"Skipped because stage '{failed[0]}' failed."
+                        )
+                    elif all(d in results for d in stage.depends_on):
+                        args = [results[d] for d in stage.depends_on]
+                        # Tasks copy the current context, like the threaded scheduler
+                        task = asyncio.ensure_future(
+                            _timed_async(stage.label, stage.func, *args)
+                        )
+                        running[task] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        results[name] = task.result()
+                    except Exception as e:
+                        errors.add(name)
+                        yield name, None, e
+                    else:
+                        yield name, results[name], None
+        finally:
+            # A consumer that stops early (e.g. a dropped client) cancels the rest
+            for task in running:
+                task.cancel()
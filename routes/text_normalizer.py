@@ -0,0 +1,334 @@
+import heapq
+import logging
+import os
+import re
+import zlib
+from collections import Counter
+
+from routes.large_document import SENTENCE_END
+from routes.metrics import (
+    NORMALIZED_BYTES,
+    NORMALIZED_TOKENS,
+    NORMALIZER_REMOVED,
+    NORMALIZER_SAVINGS,
+)
+from routes.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Set PRD_NORMALIZE_TEXT=0 to send PRDs to Gemini exactly as received
+ENABLED = os.getenv("PRD_NORMALIZE_TEXT", "1") != "0"
+
+# Paragraphs shorter than this are never treated as duplicates
+MIN_DUPLICATE_WORDS = 8
+# Word-shingle Jaccard similarity at which a paragraph repeats an earlier one
+NEAR_DUPLICATE_SIMILARITY = 0.8
+SHINGLE_WORDS = 3
+# Smallest shingle hashes indexed per paragraph to find duplicate candidates
+SKETCH_SIZE = 4
+# Single-line paragraphs longer than this are deduplicated sentence by sentence
+LONG_LINE_WORDS = 200
+# Short lines repeated this often (ignoring digits) are running headers/footers
+REPEATED_LINE_MIN = 3
+REPEATED_LINE_MAX_WORDS = 12
+# With page breaks, a line on at least this share of pages is a running header
+REPEATED_LINE_RATIO = 0.5
+# Longer paragraphs mentioning legal boilerplate are kept
+BOILERPLATE_MAX_WORDS = 80
+# Boilerplate is only dropped within this share of the words at the start
+# or the end of a document; elsewhere it is content
+BOILERPLATE_EDGE_SHARE = 0.15
+
+SPACES = re.compile(r"[^\S\n\f]+")
+INVISIBLE = re.compile("[\u200b\u200c\u200d\u2060\ufeff\u00ad]")
+DIGITS = re.compile(r"\d+")
+WORD = re.compile(r"\w+")
+PAGE_MARKER = re.compile(
+    r"^(?:page\s+)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?$|^[-–—]\s*\d{1,4}\s*[-–—]$", re.I
+)
+INLINE_PAGE_MARKER = re.compile(r"\bpage\s+\d{1,4}\s*(?:of|/)\s*\d{1,4}\b", re.I)
+TOC_HEADING = re.compile(r"^(?:#{1,6}\s*)?(?:table\s+of\s+)?contents:?$", re.I)
+# Dot leaders of a table of contents entry: "3.1 Login ......... 12"
+TOC_LEADER = re.compile(r"(?:\s?[.·…]){4,}\s*\d{1,4}\b")
+# A sentence end, but not the dot of a section number such as "2. Scope"
+SENTENCE_BREAK = re.compile(r"(?<=[^\d\s][.!?])\s")
+# Longest entry title removed in front of a leader in collapsed text
+TOC_TITLE_CHARS = 120
+BOILERPLATE_HEADING = re.compile(
+    r"^(?:#{1,6}\s*)?(?:\d+(?:\.\d+)*\.?\s+)?"
+    r"(?:legal\s+(?:notices?|disclaimers?)|disclaimers?|confidentiality\s+notice"
+    r"|copyright(?:\s+notice)?|terms\s+(?:and|&)\s+conditions|revision\s+history"
+    r"|document\s+(?:history|control)|change\s+log|distribution\s+list):?$",
+    re.I,
+)
+# Matched against lowercased text
+BOILERPLATE_PHRASE = re.compile(
+    r"all rights reserved|(?:confidential and proprietary|proprietary and confidential)"
+    r"|without (?:the )?prior written (?:consent|permission)|provided \"?as is\"?"
+    r"|do not distribute|©|\(c\)\s*\d{4}|subject to change"
+)
+# Matched against lowercased text; a notice saying any of this is a requirement
+REQUIREMENT = re.compile(
+    r"\b(?:must|shall|should|will|can|cannot|users?|customers?|admins?|allows?|lets"
+    r"|supports?|shows?|displays?|screens?)\b"
+)
+# Header and rows of a revision history table: "1.1 2024-02-02 K. Osei ..."
+HISTORY_ROW = re.compile(
+    r"^(?:(?:version|rev(?:ision)?)\b.*\b(?:date|author|changes?)\b"
+    r"|v?\d+(?:\.\d+)+\s.*\b\d{4}\b)",
+    re.I,
+)
+
+
+def _strip_toc(line):
+    """Remove table of contents entries from a line; returns ``(line, count)``.
+
+    Each entry runs from the previous sentence end (or entry) to the page
+    number after its dot leader.
+    """
+    if not any(leader in line for leader in ("..", ". .", "·", "…")):
+        return line, 0
+    pieces, end, count = [], 0, 0
+    for match in TOC_LEADER.finditer(line):
+        start = max(end, match.start() - TOC_TITLE_CHARS)
+        for sentence_end in SENTENCE_BREAK.finditer(line, start, match.start()):
+            start = sentence_end.end()
+        pieces.append(line[end:start])
+        end = match.end()
+        count += 1
+    if not count:
+        return line, 0
+    pieces.append(line[end:])
+    return SPACES.sub(" ", "".join(pieces)).strip(), count
+
+
+def _running_lines(lines, pages):
+    """Keys of short lines that repeat like running headers or footers."""
+    counts, variants = Counter(), {}
+    for line in lines:
+        if line and len(line.split()) <= REPEATED_LINE_MAX_WORDS:
+            key = DIGITS.sub("#", line.lower())
+            counts[key] += 1
+            variants.setdefault(key, set()).add(line)
+
+    running = set()
+    for key, count in counts.items():
+        if count < REPEATED_LINE_MIN:
+            continue
+        # Plain repeated lines ("Acceptance criteria:") are content; only
+        # drop ones with a changing number, on most pages, or boilerplate
+        if (
+            len(variants[key]) > 1
+            or (pages >= REPEATED_LINE_MIN and count >= pages * REPEATED_LINE_RATIO)
+            or BOILERPLATE_PHRASE.search(key)
+        ):
+            running.add(key)
+    return running
+
+
+def _clean_lines(text, removed):
+    """Drop page numbers, tables of contents and running headers; collapse
+    whitespace inside lines."""
+    pages = text.count("\f") + 1
+    lines = [SPACES.sub(" ", line).strip() for line in re.split(r"\n|\f", text)]
+    running = _running_lines(lines, pages)
+
+    kept = []
+    for line in lines:
+        if not line:
+            kept.append(line)
+        elif PAGE_MARKER.match(line):
+            removed["page_markers"] += 1
+        elif TOC_HEADING.match(line):
+            removed["toc"] += 1
+        elif DIGITS.sub("#", line.lower()) in running:
+            removed["running_lines"] += 1
+        else:
+            line, count = INLINE_PAGE_MARKER.subn("", line)
+            if count:
+                removed["page_markers"] += count
+                line = SPACES.sub(" ", line)
+            line, count = _strip_toc(line)
+            removed["toc"] += count
+            if line:
+                kept.append(line.strip())
+    return kept
+
+
+def _paragraphs(lines):
+    """Group lines into paragraphs at blank lines; very long single lines
+    (text whose line breaks were collapsed) are split into sentences."""
+    paragraphs, current = [], []
+    for line in lines + [""]:
+        if line:
+            current.append(line)
+            continue
+        if len(current) == 1 and len(current[0].split()) > LONG_LINE_WORDS:
+            paragraphs.append(SENTENCE_END.split(current[0]))
+        elif current:
+            paragraphs.append(["\n".join(current)])
+        current = []
+    return paragraphs
+
+
+def _is_boilerplate(unit, has_phrases):
+    """A legal notice (boilerplate phrases, no requirement language) or a
+    revision history table under its heading."""
+    lines = unit.split("\n")
+    if (
+        len(lines) > 1
+        and BOILERPLATE_HEADING.match(lines[0])
+        and all(HISTORY_ROW.match(line) for line in lines[1:])
+    ):
+        return True
+    if not has_phrases or len(unit.split()) > BOILERPLATE_MAX_WORDS:
+        return False
+    lower = unit.lower()
+    return BOILERPLATE_PHRASE.search(lower) is not None and not REQUIREMENT.search(lower)
+
+
+def _edge_boilerplate(paragraphs, has_phrases):
+    """``(paragraph, unit)`` positions of boilerplate at the start or end
+    of a document.
+
+    Notices in the body of a PRD are usually requirements about one (a
+    copyright line the app shows), so only the first and last
+    BOILERPLATE_EDGE_SHARE of the words are searched. A boilerplate heading
+    on its own goes with the boilerplate right after it; a section is never
+    dropped because of its heading alone.
+    """
+    sizes = [[len(unit.split()) for unit in units] for units in paragraphs]
+    total = sum(map(sum, sizes))
+    edge = total * BOILERPLATE_EDGE_SHARE
+    found, end = set(), 0
+    for i, units in enumerate(paragraphs):
+        for j, unit in enumerate(units):
+            start, end = end, end + sizes[i][j]
+            if (start < edge or end > total - edge) and _is_boilerplate(unit, has_phrases):
+                found.add((i, j))
+    for i, units in enumerate(paragraphs[:-1]):
+        if (
+            (i + 1, 0) in found
+            and len(units) == 1
+            and "\n" not in units[0]
+            and BOILERPLATE_HEADING.match(units[0])
+        ):
+            found.add((i, 0))
+    return found
+
+
+def _shingles(words, word_hashes):
+    """The SHINGLE_WORDS-word windows of ``words`` as tuples of word hashes.
+
+    Words are hashed with crc32 and tuples of ints hash the same in every
+    process (unlike strings), so duplicate detection is deterministic.
+    """
+    hashes = []
+    for word in words:
+        h = word_hashes.get(word)
+        if h is None:
+            h = word_hashes[word] = zlib.crc32(word.encode("utf-8"))
+        hashes.append(h)
+    return set(zip(*(hashes[i:] for i in range(SHINGLE_WORDS))))
+
+
+def shingles(text):
+    """Word shingles of ``text``, as used for near-duplicate detection."""
+    return _shingles(WORD.findall(text.lower()), {})
+
+
+class _DuplicateIndex:
+    """Finds paragraphs that nearly repeat one seen before.
+
+    Each paragraph is indexed under its SKETCH_SIZE smallest shingle hashes
+    (a bottom-k sketch); similar paragraphs very likely share one of them,
+    and candidates are confirmed with the exact shingle Jaccard similarity.
+    """
+
+    def __init__(self):
+        self.shingles = []
+        self.index = {}
+        self.word_hashes = {}
+
+    def seen(self, text):
+        words = WORD.findall(text.lower())
+        if len(words) < MIN_DUPLICATE_WORDS:
+            return False
+        shingles = _shingles(words, self.word_hashes)
+        sketch = heapq.nsmallest(SKETCH_SIZE, map(hash, shingles))
+        candidates = {i for h in sketch for i in self.index.get(h, ())}
+        for i in candidates:
+            shared = len(shingles & self.shingles[i])
+            union = len(shingles) + len(self.shingles[i]) - shared
+            if shared / union >= NEAR_DUPLICATE_SIMILARITY:
+                return True
+        for h in sketch:
+            self.index.setdefault(h, []).append(len(self.shingles))
+        self.shingles.append(shingles)
+        return False
+
+
+def normalize(text):
+    """Strip noise from PRD text before it is put into prompts.
+
+    Removes page numbers, tables of contents, running headers/footers,
+    legal notices and revision histories at the start or end of the
+    document, paragraphs that (nearly) repeat an earlier one, and collapses
+    whitespace. Returns ``(normalized_text, report)`` where the report has
+    bytes and estimated tokens before and after plus removal counts.
+    """
+    removed = Counter(
+        {"page_markers": 0, "toc": 0, "running_lines": 0, "boilerplate": 0, "duplicates": 0}
+    )
+    text = INVISIBLE.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    duplicates = _DuplicateIndex()
+    has_phrases = BOILERPLATE_PHRASE.search(text.lower()) is not None
+    units_by_paragraph = _paragraphs(_clean_lines(text, removed))
+    boilerplate = _edge_boilerplate(units_by_paragraph, has_phrases)
+
+    paragraphs = []
+    for i, units in enumerate(units_by_paragraph):
+        kept = []
+        for j, unit in enumerate(units):
+            if (i, j) in boilerplate:
+                removed["boilerplate"] += 1
+            elif duplicates.seen(unit):
+                removed["duplicates"] += 1
+            else:
+                kept.append(unit)
+        if kept:
+            paragraphs.append(" ".join(kept))
+    normalized = "\n\n".join(paragraphs)
+
+    report = {
+        "bytes_before": len(text.encode("utf-8")),
+        "bytes_after": len(normalized.encode("utf-8")),
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(normalized),
+        "removed": dict(removed),
+    }
+    return normalized, report
+
+
+def prepare_text(text):
+    """Normalize a request's PRD text and record what that saved."""
+    if not ENABLED:
+        return text
+    normalized, report = normalize(text)
+    NORMALIZED_BYTES.inc(report["bytes_before"], kind="before")
+    NORMALIZED_BYTES.inc(report["bytes_after"], kind="after")
+    NORMALIZED_TOKENS.inc(report["tokens_before"], kind="before")
+    NORMALIZED_TOKENS.inc(report["tokens_after"], kind="after")
+    for kind, count in report["removed"].items():
+        NORMALIZER_REMOVED.inc(count, kind=kind)
+    saved = report["tokens_before"] - report["tokens_after"]
+    if report["tokens_before"]:
+        NORMALIZER_SAVINGS.observe(saved / report["tokens_before"])
+    logger.info(
+        "Normalized PRD: saved %d bytes and ~%d tokens (%d -> %d tokens)",
+        report["bytes_before"] - report["bytes_after"],
+        saved,
+        report["tokens_before"],
+        report["tokens_after"],
+    )
+    return normalized
@@ -0,0 +1,17 @@
+def estimate_tokens(text):
+    """Cheap local estimate of Gemini's token count for ``text``.
+
+    About four characters per token for English. Every token count in this
+    service (normalizer savings, the large document threshold, context
+    cache sizes, admission charges) uses it, so they agree for one text.
+    """
+    return (len(text) + 3) // 4
+
+
+def payload_tokens(payload):
+    """Estimated tokens of the text parts of a Gemini request body."""
+    return sum(
+        estimate_tokens(part.get("text", ""))
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
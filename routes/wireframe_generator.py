@@ -1,21 +1,33 @@
-from transformers import pipeline, T5Tokenizer, T5ForConditionalGeneration
-import requests
-import re
-import json
+import logging
+
+from routes.gemini_client import GeminiError, get_client
+from routes.json_repair import parse_json_object, validate_wireframes
+from routes.large_document import flow_notes, flow_notes_async
+from routes.metrics import JSON_PARSES, log_payload
+from routes.wireframe_layout import with_layout
+
+logger = logging.getLogger(__name__)
 
 
 class WireframeGenerator:
-    def __init__(self, api_key, prd_text):
+    MODEL = "gemini-1.5-flash"
+    # Bump when the wireframe prompt or output changes to invalidate cached results.
+    PROMPT_VERSIONS = {"wireframes": 4}
+    # Generations tried in total when the response JSON cannot be repaired.
+    MAX_ATTEMPTS = 2
+
+    def __init__(self, api_key, prd_text, client=None, cache=None):
         self.prd_text = prd_text
         self.wireframe_components = []
         self.api_key = api_key
-        self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-
-    def getWireframeComponents(self):
-        """AI-based text processing & structured wireframe generation"""
+        self.client = client or get_client(api_key)
+        # Optional ResultCache for per-section results of large PRDs
+        self.cache = cache
 
-        prompt = f"""
-        You are an AI expert in product analysis, user experience design, and UI component identification. Given a Product Requirement Document (PRD) summary, extract a structured user journey while identifying necessary UI screens and components.
+    def wireframePrompt(self):
+        """Instructions that follow the PRD (sent as the call's document)."""
+        return """
+        You are an AI expert in product analysis, user experience design, and UI component identification. Given the Product Requirement Document (PRD) above, extract a structured user journey while identifying necessary UI screens and components.
 
         Task Details:
         1. User Flow Extraction:
@@ -38,73 +50,73 @@ class WireframeGenerator:
         - Maintain screen order based on user flow
 
         Example Output Structure:
-        {{
+        {
             "screens": [
-                {{
+                {
                     "label": "Login",
                     "components": [
-                        {{ "type": "TextField", "label": "Email" }},
-                        {{ "type": "TextField", "label": "Password" }},
-                        {{ "type": "Button", "label": "Login" }},
-                        {{ "type": "Button", "label": "Sign Up" }}
+                        { "type": "TextField", "label": "Email" },
+                        { "type": "TextField", "label": "Password" },
+                        { "type": "Button", "label": "Login" },
+                        { "type": "Button", "label": "Sign Up" }
                     ]
-                }},
-                {{
+                },
+                {
                     "label": "Sign Up",
                     "components": [
-                        {{ "type": "TextField", "label": "Full Name" }},
-                        {{ "type": "TextField", "label": "Email" }},
-                        {{ "type": "TextField", "label": "Password" }},
-                        {{ "type": "TextField", "label": "Confirm Password" }},
-                        {{ "type": "Button", "label": "Create Account" }}
+                        { "type": "TextField", "label": "Full Name" },
+                        { "type": "TextField", "label": "Email" },
+                        { "type": "TextField", "label": "Password" },
+                        { "type": "TextField", "label": "Confirm Password" },
+                        { "type": "Button", "label": "Create Account" }
                     ]
-                }},
-                {{
+                },
+                {
                     "label": "Home Feed",
                     "components": [
-                        {{ "type": "Avatar", "src": "https://example.com/user1.jpg" }},
-                        {{ "type": "TextField", "label": "What's on your mind?" }},
-                        {{ "type": "Button", "label": "Post" }},
-                        {{ "type": "ImageView", "src": "https://example.com/post1.jpg" }},
-                        {{ "type": "VideoView", "src": "https://example.com/video1.mp4" }},
-                        {{ "type": "Progress", "progress": 80 }},
-                        {{ "type": "Switch", "label": "Show Online Status" }}
+                        { "type": "Avatar", "src": "https://example.com/user1.jpg" },
+                        { "type": "TextField", "label": "What's on your mind?" },
+                        { "type": "Button", "label": "Post" },
+                        { "type": "ImageView", "src": "https://example.com/post1.jpg" },
+                        { "type": "VideoView", "src": "https://example.com/video1.mp4" },
+                        { "type": "Progress", "progress": 80 },
+                        { "type": "Switch", "label": "Show Online Status" }
                     ]
-                }},
-                {{
+                },
+                {
                     "label": "Profile",
                     "components": [
-                        {{ "type": "Avatar", "src": "https://example.com/user1.jpg" }},
-                        {{ "type": "Tabs", "tabs": ["Posts", "About", "Connections"] }},
-                        {{ "type": "Progress", "progress": 90 }},
-                        {{ "type": "Slider", "value": 50 }}
+                        { "type": "Avatar", "src": "https://example.com/user1.jpg" },
+                        { "type": "Tabs", "tabs": ["Posts", "About", "Connections"] },
+                        { "type": "Progress", "progress": 90 },
+                        { "type": "Slider", "value": 50 }
                     ]
-                }},
-                {{
+                },
+                {
                     "label": "Connections",
                     "components": [
-                        {{ "type": "Avatar", "src": "https://example.com/user2.jpg" }},
-                        {{ "type": "Avatar", "src": "https://example.com/user3.jpg" }},
-                        {{ "type": "Dropdown", "options": ["Sort by Name", "Sort by Recent"] }}
+                        { "type": "Avatar", "src": "https://example.com/user2.jpg" },
+                        { "type": "Avatar", "src": "https://example.com/user3.jpg" },
+                        { "type": "Dropdown", "options": ["Sort by Name", "Sort by Recent"] }
                     ]
-                }},
-                {{
+                },
+                {
                     "label": "Settings",
                     "components": [
-                        {{ "type": "Switch", "label": "Dark Mode" }},
-                        {{ "type": "Switch", "label": "Enable Notifications" }},
-                        {{ "type": "Button", "label": "Logout" }}
+                        { "type": "Switch", "label": "Dark Mode" },
+                        { "type": "Switch", "label": "Enable Notifications" },
+                        { "type": "Button", "label": "Logout" }
                     ]
-                }}
+                }
             ],
             "edges": [
-                {{ "from": 0, "to": 1 }},
-                {{ "from": 1, "to": 2 }},
-                {{ "from": 2, "to": 3 }},
-                {{ "from": 2, "to": 4 }},
-                {{ "from": 3, "to": 5 }}
+                { "from": 0, "to": 1 },
+                { "from": 1, "to": 2 },
+                { "from": 2, "to": 3 },
+                { "from": 2, "to": 4 },
+                { "from": 3, "to": 5 }
             ]
-        }}
+        }
 
         Special Instructions:
         1. Validate JSON syntax before finalizing
@@ -113,54 +125,103 @@ class WireframeGenerator:
         4. Maintain component consistency across similar screens
         5. Include rich media components (Image/Video views) where relevant
 
-        PRD Summary to Analyze:
-        {self.prd_text}
-
         Generate only raw JSON output without any commentary.
         """
 
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-
-        response = requests.post(
-            f"{self.api_url}?key={self.api_key}",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-        )
-
-        print("\n\nAPI Response Status Code:", response.status_code)
-        print("\nAPI Response Content:", response.text)
-        print("\nWireframe response:", response.json())
-
-        if response.status_code == 200:
-            candidates = response.json().get("candidates", [])
-            if candidates:
-                response_text = candidates[0]["content"]["parts"][0]["text"]
-                print("Wireframe prompt response:", response_text)
-
-                try:
-                    wireframe_components = self.validateJsonResponse(response_text)
-                    print("Final Wireframe components:", wireframe_components)
-                except Exception as e:
-                    raise Exception(
-                        "Failed to extract valid JSON from the response."
-                    ) from e
-            else:
-                raise Exception("No candidates found in response.")
-        else:
-            raise Exception("Failed to get wireframe with Gemini API.")
-
+    def getWireframeComponents(self):
+        """AI-based text processing & structured wireframe generation"""
+        try:
+            source_text = flow_notes(self.client, self.MODEL, self.prd_text, self.cache)
+        except GeminiError as e:
+            raise Exception("Failed to get wireframe with Gemini API.") from e
+
+        prompt = self.wireframePrompt()
+        last_error = None
+        for _ in range(self.MAX_ATTEMPTS):
+            try:
+                response = self.client.generate(
+                    self.MODEL, prompt, stage="wireframes", hedge=True, document=source_text
+                )
+            except GeminiError as e:
+                raise Exception("Failed to get wireframe with Gemini API.") from e
+
+            try:
+                return self.readResponse(response)
+            except ValueError as e:
+                # Local repair failed; only now pay for another generation
+                logger.warning("Wireframe JSON could not be repaired: %s", e)
+                last_error = e
+
+        raise Exception("Failed to extract valid JSON from the response.") from last_error
+
+    def readResponse(self, response):
+        """Return the wireframes in a generation; ValueError means regenerate."""
+        log_payload(logger, "Wireframe response", response.body)
+
+        if not response.candidates:
+            raise Exception("No candidates found in response.")
+
+        wireframe_components = self.validateJsonResponse(response.text)
+        log_payload(logger, "Final wireframe components", wireframe_components)
         return wireframe_components
 
     def validateJsonResponse(self, json_str):
-        match = re.search(r"```json\n(.*?)\n```", json_str, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-            parsed_json = json.loads(json_str)  # To validate JSON
-            return parsed_json
-        else:
-            print("No JSON found")
+        """Extract, repair and schema-check the wireframe JSON in a response.
+
+        Raises ValueError when the text holds no usable screens/edges object.
+        """
+        try:
+            parsed_json, repaired = parse_json_object(json_str)
+            validate_wireframes(parsed_json)
+        except ValueError:
+            JSON_PARSES.inc(stage="wireframes", result="failed")
+            raise
+        JSON_PARSES.inc(stage="wireframes", result="repaired" if repaired else "clean")
+        return parsed_json
 
     def process(self):
-        """Process the PRD text and return the summarized information."""
-        self.wireframe_components = self.getWireframeComponents()
+        """Process the PRD text and return the laid-out wireframe graph."""
+        self.wireframe_components = with_layout(self.getWireframeComponents())
+        return self.wireframe_components
+
+
+class AsyncWireframeGenerator(WireframeGenerator):
+    """WireframeGenerator on an AsyncGeminiClient; same prompt and cache keys."""
+
+    def __init__(self, api_key, prd_text, client=None, cache=None):
+        if client is None:
+            # httpx is only needed by the async app
+            from routes.async_gemini_client import get_async_client
+
+            client = get_async_client(api_key)
+        super().__init__(api_key, prd_text, client=client, cache=cache)
+
+    async def getWireframeComponents(self):
+        try:
+            source_text = await flow_notes_async(
+                self.client, self.MODEL, self.prd_text, self.cache
+            )
+        except GeminiError as e:
+            raise Exception("Failed to get wireframe with Gemini API.") from e
+
+        prompt = self.wireframePrompt()
+        last_error = None
+        for _ in range(self.MAX_ATTEMPTS):
+            try:
+                response = await self.client.generate(
+                    self.MODEL, prompt, stage="wireframes", hedge=True, document=source_text
+                )
+            except GeminiError as e:
+                raise Exception("Failed to get wireframe with Gemini API.") from e
+
+            try:
+                return self.readResponse(response)
+            except ValueError as e:
+                logger.warning("Wireframe JSON could not be repaired: %s", e)
+                last_error = e
+
+        raise Exception("Failed to extract valid JSON from the response.") from last_error
+
+    async def process(self):
+        self.wireframe_components = with_layout(await self.getWireframeComponents())
         return self.wireframe_components
@@ -0,0 +1,202 @@
+NODE_WIDTH = 250
+TITLE_HEIGHT = 60
+COMPONENT_HEIGHT = 40
+MIN_NODE_HEIGHT = 120
+NODE_GAP = 100
+LAYER_GAP = 200
+# Horizontal room kept for an edge passing through a layer
+DUMMY_WIDTH = 20
+SWEEPS = 8
+
+
+def node_height(screen):
+    return max(MIN_NODE_HEIGHT, TITLE_HEIGHT + COMPONENT_HEIGHT * len(screen.get("components", [])))
+
+
+def break_cycles(count, edges):
+    """Return the edges as a DAG, reversing the back edges found by DFS."""
+    successors = [[] for _ in range(count)]
+    for source, target in edges:
+        successors[source].append(target)
+
+    state = [0] * count  # 0 unvisited, 1 on the DFS stack, 2 done
+    back_edges = set()
+    for root in range(count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state[child] == 1:
+                    back_edges.add((node, child))
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+
+    return sorted(
+        {(t, s) if (s, t) in back_edges else (s, t) for s, t in edges}
+    )
+
+
+def assign_layers(count, dag):
+    """Longest-path layering: each screen sits one layer below its deepest parent."""
+    successors = [[] for _ in range(count)]
+    indegree = [0] * count
+    for source, target in dag:
+        successors[source].append(target)
+        indegree[target] += 1
+
+    layer = [0] * count
+    ready = [node for node in range(count) if indegree[node] == 0]
+    for node in ready:
+        for child in successors[node]:
+            layer[child] = max(layer[child], layer[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    return layer
+
+
+def count_crossings(upper, lower, down):
+    """Edge crossings between two adjacent layers, counted as inversions."""
+    position = {node: i for i, node in enumerate(lower)}
+    targets = [
+        position[target]
+        for node in upper
+        for target in sorted(down.get(node, ()), key=position.get)
+    ]
+    # Fenwick tree over lower positions: for each edge, count earlier edges
+    # that land strictly to its right
+    tree = [0] * (len(lower) + 1)
+    crossings = 0
+    for seen, target in enumerate(targets):
+        i, at_or_left = target + 1, 0
+        while i:
+            at_or_left += tree[i]
+            i -= i & -i
+        crossings += seen - at_or_left
+        i = target + 1
+        while i <= len(lower):
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def order_layers(layers, down, up):
+    """Reorder layers by neighbour barycenters, sweeping down and up in turn.
+
+    Returns the ordering with the fewest crossings seen and that count.
+    """
+    def total(layers):
+        return sum(count_crossings(layers[i], layers[i + 1], down) for i in range(len(layers) - 1))
+
+    current = [list(nodes) for nodes in layers]
+    best, best_crossings = [list(nodes) for nodes in current], total(current)
+
+    for sweep in range(SWEEPS):
+        if not best_crossings:
+            break
+        downward = sweep % 2 == 0
+        indexes = range(1, len(current)) if downward else range(len(current) - 2, -1, -1)
+        neighbours = up if downward else down
+        for i in indexes:
+            fixed = {node: p for p, node in enumerate(current[i - 1 if downward else i + 1])}
+            previous = {node: p for p, node in enumerate(current[i])}
+
+            def barycenter(node):
+                linked = [fixed[n] for n in neighbours.get(node, ()) if n in fixed]
+                return sum(linked) / len(linked) if linked else previous[node]
+
+            current[i].sort(key=lambda node: (barycenter(node), previous[node]))
+
+        crossings = total(current)
+        if crossings < best_crossings:
+            best, best_crossings = [list(nodes) for nodes in current], crossings
+    return best, best_crossings
+
+
+def layout_wireframes(wireframes):
+    """Deterministic layered (Sugiyama-style) layout of the screen graph.
+
+    Cycles are broken by reversing DFS back edges, screens are layered by
+    longest path, edges spanning several layers get dummy nodes, and
+    barycenter sweeps reduce crossings. Ties are broken by screen index, so
+    the same screens/edges always give the same coordinates.
+
+    ``nodes`` has one entry per screen, in screen order, with its layer,
+    position in the layer and bounding box (``x``/``y`` is the top-left
+    corner); ``width``/``height`` bound the whole drawing.
+    """
+    screens = wireframes.get("screens", [])
+    count = len(screens)
+    edges = [(e["from"], e["to"]) for e in wireframes.get("edges", []) if e["from"] != e["to"]]
+    dag = break_cycles(count, edges)
+    rank = assign_layers(count, dag)
+
+    # Dummy nodes get ids from ``count`` up so every link joins adjacent layers
+    down, up = {}, {}
+    for source, target in dag:
+        previous = source
+        for step in range(rank[source] + 1, rank[target]):
+            rank.append(step)
+            node = len(rank) - 1
+            down.setdefault(previous, []).append(node)
+            up.setdefault(node, []).append(previous)
+            previous = node
+        down.setdefault(previous, []).append(target)
+        up.setdefault(target, []).append(previous)
+
+    layers = [[] for _ in range(max(rank, default=-1) + 1)]
+    for node, depth in enumerate(rank):
+        layers[depth].append(node)
+    layers, crossings = order_layers(layers, down, up)
+
+    heights = [node_height(screen) for screen in screens]
+
+    def width(node):
+        return NODE_WIDTH if node < count else DUMMY_WIDTH
+
+    layer_widths = [
+        sum(width(node) for node in nodes) + NODE_GAP * (len(nodes) - 1) for nodes in layers
+    ]
+    total_width = max(layer_widths, default=0)
+
+    nodes, y = [None] * count, 0
+    for depth, layer_nodes in enumerate(layers):
+        x = (total_width - layer_widths[depth]) / 2
+        for order, node in enumerate(layer_nodes):
+            if node < count:
+                nodes[node] = {
+                    "index": node,
+                    "layer": depth,
+                    "order": order,
+                    "x": x,
+                    "y": y,
+                    "width": NODE_WIDTH,
+                    "height": heights[node],
+                }
+            x += width(node) + NODE_GAP
+        y += max((heights[n] for n in layer_nodes if n < count), default=0) + LAYER_GAP
+
+    return {
+        "direction": "TB",
+        "nodes": nodes,
+        "width": total_width,
+        "height": max(y - LAYER_GAP, 0),
+        "crossings": crossings,
+    }
+
+
+def with_layout(wireframes):
+    """Return a copy of a validated screens/edges dict with ``layout`` added.
+
+    The argument is left alone: it is often a cached result shared with
+    other requests.
+    """
+    return dict(wireframes, layout=layout_wireframes(wireframes))
@@ -0,0 +1,106 @@
+import pytest
+
+from routes.json_repair import (
+    WireframeSchemaError,
+    find_json_object,
+    parse_json_object,
+    validate_wireframes,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expected, repaired",
+    [
+        # Code fence and chatter around the object
+        (
+            'Here you go:\n```json\n{"screens": [{"name": "Login", "components": []}],'
+            ' "edges": []}\n```\nLet me know if you need changes.',
+            {"screens": [{"name": "Login", "components": []}], "edges": []},
+            False,
+        ),
+        # Braces inside strings do not end the object
+        (
+            '{"note": "use {braces} here", "screens": []} trailing text }',
+            {"note": "use {braces} here", "screens": []},
+            False,
+        ),
+        # Trailing commas in arrays and objects
+        (
+            '{"screens": [{"name": "Login", "components": ["Email", "Password",],},],'
+            ' "edges": [],}',
+            {"screens": [{"name": "Login", "components": ["Email", "Password"]}], "edges": []},
+            True,
+        ),
+        # Single-quoted strings, with escaped and embedded quotes
+        (
+            "{'screens': [{'name': 'User\\'s home', 'components': ['Say \"hi\"']}]}",
+            {"screens": [{"name": "User's home", "components": ['Say "hi"']}]},
+            True,
+        ),
+        # Truncated in the middle of a key
+        (
+            '{"screens": [{"name": "Login", "components": ["Email"]}, {"name": "Home", "compo',
+            {"screens": [{"name": "Login", "components": ["Email"]}, {"name": "Home"}]},
+            True,
+        ),
+        # Truncated in the middle of a string value: the partial value goes
+        (
+            '{"screens": [{"name": "Login", "components": ["Email", "Pass',
+            {"screens": [{"name": "Login", "components": ["Email"]}]},
+            True,
+        ),
+        # Truncated after a colon
+        (
+            '{"screens": [{"name": "Login"}], "edges": [{"from": 0, "to":',
+            {"screens": [{"name": "Login"}], "edges": [{"from": 0}]},
+            True,
+        ),
+        # Truncated after a comma
+        (
+            '```json\n{"screens": [{"name": "Login", "components": ["Email",',
+            {"screens": [{"name": "Login", "components": ["Email"]}]},
+            True,
+        ),
+    ],
+)
+def test_parse_json_object(text, expected, repaired):
+    assert parse_json_object(text) == (expected, repaired)
+
+
+@pytest.mark.parametrize("text", ["", "Sorry, I cannot help with that.", "[1, 2, 3]"])
+def test_parse_json_object_without_object(text):
+    with pytest.raises(ValueError, match="No JSON object"):
+        parse_json_object(text)
+
+
+def test_parse_json_object_beyond_repair():
+    with pytest.raises(ValueError, match="Could not repair"):
+        parse_json_object('{"screens": [{"name": Login}]}')
+
+
+def test_find_json_object_returns_truncated_tail():
+    assert find_json_object('Result: {"a": {"b": 1}') == '{"a": {"b": 1}'
+
+
+def test_validate_wireframes_adds_missing_edges():
+    assert validate_wireframes({"screens": [{"components": []}]}) == {
+        "screens": [{"components": []}],
+        "edges": [],
+    }
+
+
+@pytest.mark.parametrize(
+    "wireframes, message",
+    [
+        ([], "JSON object"),
+        ({"screens": []}, "non-empty 'screens'"),
+        ({"screens": [{"components": "Email"}]}, "Screen 0"),
+        ({"screens": [{}], "edges": {}}, "must be a list"),
+        ({"screens": [{}], "edges": [{"from": 0, "to": "1"}]}, "non-integer 'to'"),
+        ({"screens": [{}], "edges": [{"from": True, "to": 0}]}, "non-integer 'from'"),
+        ({"screens": [{}, {}], "edges": [{"from": 0, "to": 2}]}, "outside the 2 screens"),
+    ],
+)
+def test_validate_wireframes_rejects(wireframes, message):
+    with pytest.raises(WireframeSchemaError, match=message):
+        validate_wireframes(wireframes)
@@ -0,0 +1,176 @@
+import pytest
+
+from routes.mermaid_graph import MermaidSyntaxError, canonicalize, parse_mermaid
+
+
+def lines(*rows):
+    return "\n".join(rows)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # Code fence and chatter around the chart
+        (
+            "Here is the chart:\n```mermaid\ngraph LR\n  A[Start] --> B[End]\n```\nDone.",
+            lines("graph LR", "    n1[Start]", '    n2["End"]', "    n1 --> n2"),
+        ),
+        # Statements separated by semicolons
+        (
+            "graph TD; A-->B; B-->C",
+            lines(
+                "graph TD",
+                "    n1[A]",
+                "    n2[B]",
+                "    n3[C]",
+                "    n1 --> n2",
+                "    n2 --> n3",
+            ),
+        ),
+        # "&" joins nodes on both sides of a link
+        (
+            "graph TD\nA[Login] & B[Signup] --> C[Home] & D[Help]",
+            lines(
+                "graph TD",
+                "    n1[Login]",
+                "    n2[Signup]",
+                "    n3[Home]",
+                "    n4[Help]",
+                "    n1 --> n3",
+                "    n1 --> n4",
+                "    n2 --> n3",
+                "    n2 --> n4",
+            ),
+        ),
+        # Hyphenated ids, with and without spaces around the links
+        (
+            lines(
+                "graph TD",
+                "login-page[Login] --> home-screen{Signed in?}",
+                "home-screen -->|No| login-page",
+                "home-screen -- Yes --> dash-board[Dashboard]",
+                "sign-up-->verify-email---done",
+                "step-1-.->step-2",
+            ),
+            lines(
+                "graph TD",
+                "    n1[Login]",
+                "    n2{Signed in?}",
+                "    n3[Dashboard]",
+                '    n4["sign-up"]',
+                '    n5["verify-email"]',
+                "    n6[done]",
+                '    n7["step-1"]',
+                '    n8["step-2"]',
+                "    n1 --> n2",
+                "    n2 -->|No| n1",
+                "    n2 -->|Yes| n3",
+                "    n4 --> n5",
+                "    n5 --- n6",
+                "    n7 -.-> n8",
+            ),
+        ),
+        # Links to and from a whole subgraph
+        (
+            lines(
+                "flowchart TD",
+                "subgraph auth[Authentication]",
+                "  L[Login] --> R[Reset]",
+                "end",
+                "H[Home] --> auth",
+                "auth --> D[Dashboard]",
+            ),
+            lines(
+                "flowchart TD",
+                "    n1[Home]",
+                "    n2[Dashboard]",
+                "    subgraph s1[Authentication]",
+                "        n3[Login]",
+                "        n4[Reset]",
+                "    end",
+                "    n1 --> s1",
+                "    s1 --> n2",
+                "    n3 --> n4",
+            ),
+        ),
+        # A subgraph linked to before it is declared
+        (
+            lines(
+                "graph TD",
+                "H[Home] --> checkout",
+                "subgraph checkout[Checkout]",
+                "  C[Cart] --> P[Pay]",
+                "end",
+            ),
+            lines(
+                "graph TD",
+                "    n1[Home]",
+                "    subgraph s1[Checkout]",
+                "        n2[Cart]",
+                "        n3[Pay]",
+                "    end",
+                "    n1 --> s1",
+                "    n2 --> n3",
+            ),
+        ),
+        # Text on dotted and thick links
+        (
+            "graph TD\nA -. optional .-> B\nA == main ==> C",
+            lines(
+                "graph TD",
+                "    n1[A]",
+                "    n2[B]",
+                "    n3[C]",
+                "    n1 -.->|optional| n2",
+                "    n1 ==>|main| n3",
+            ),
+        ),
+        # Repeated nodes and edges
+        (
+            "graph TD\nA[Login] --> B[Home]\nA --> B\nA[Login] --> B",
+            lines("graph TD", "    n1[Login]", "    n2[Home]", "    n1 --> n2"),
+        ),
+    ],
+)
+def test_canonicalize(text, expected):
+    assert canonicalize(text) == expected
+
+
+def test_canonicalize_collapses_subgraphs_over_budget():
+    text = lines(
+        "graph TD",
+        "H[Home] --> P[Profile]",
+        "subgraph settings[Settings]",
+        "  A[Account] --> B[Billing] --> C[Privacy]",
+        "end",
+        "P --> A",
+    )
+    assert canonicalize(text, budget=4) == lines(
+        "graph TD",
+        "    n1[Home]",
+        "    n2[Profile]",
+        "    n3[[Settings]]",
+        "    n1 --> n2",
+        "    n2 --> n3",
+    )
+
+
+def test_parse_mermaid_keeps_hyphenated_ids():
+    graph = parse_mermaid("graph TD\nlogin-page --> home-screen")
+    assert set(graph.nodes) == {"login-page", "home-screen"}
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("", "empty flowchart"),
+        ("pie title Pets", "expected 'graph' or 'flowchart' header"),
+        ("graph TD\nA[Login --> B", "unclosed '\\[' for node 'A'"),
+        ("graph TD\nsubgraph S\nA-->B", "subgraph 'S' is not closed"),
+        ("graph TD\nend", "'end' without a subgraph"),
+        ("graph TD\nA -->", "link without a target"),
+    ],
+)
+def test_canonicalize_rejects(text, message):
+    with pytest.raises(MermaidSyntaxError, match=message):
+        canonicalize(text)